@@ -1,7 +1,9 @@
 """
 ASGI config for FaviconGen project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``. Serve it with
+uvicorn, e.g. ``uvicorn FaviconGen.asgi:application --workers 4 --lifespan off``; the
+generation views are async and render on Favitude's render executor.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -12,5 +14,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FaviconGen.settings')
+# Django recommends against persistent database connections in async mode
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -41,7 +41,9 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'rest_framework_simplejwt',
+    # rest_framework_simplejwt is not listed: REST_FRAMEWORK names its authentication class by
+    # path, and as an app it only adds translations while its models module drags django.test
+    # into every worker's start-up
     'django.contrib.sites',
     'allauth',
     'allauth.account',
@@ -52,8 +54,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers the rest of the stack
+    'Favitude.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # whitenoise, made async-capable so it does not serialize requests under ASGI
+    'Favitude.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,13 +74,21 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'Favitude.pagecache.page_cache',
+            ],
+            # Compiled templates are kept for the life of the process (in development too,
+            # where the autoreloader clears them when a template changes)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -90,7 +103,9 @@ if 'POSTGRES_URL' in os.environ:
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ['POSTGRES_URL'],
-            conn_max_age=600
+            # FaviconGen/asgi.py turns persistent connections off: under ASGI they are not
+            # reliably closed, so put a pooler in front of the database instead
+            conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600))
         )
     }
 elif os.environ.get("POSTGRES_DB"):
@@ -113,10 +128,10 @@ else:
     }
 
 # Authentication Backends
+# One backend for username, email and allauth logins, so a failed attempt costs one query and
+# one password hash rather than one per backend
 AUTHENTICATION_BACKENDS = [
     'Favitude.backends.EmailBackend',
-    'django.contrib.auth.backends.ModelBackend',
-    'allauth.account.auth_backends.AuthenticationBackend',
 ]
 
 SITE_ID = 1
@@ -210,12 +225,15 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # WhiteNoise Configuration
+# Static files are collected with content-hashed names and gzip/brotli copies by
+# "manage.py build_assets" (see Favitude/assets.py); whitenoise serves hashed names with a
+# far-future Cache-Control. Anything not yet built is served unhashed from the finders.
 STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
     },
     "staticfiles": {
-        "BACKEND": "whitenoise.storage.CompressedStaticFilesStorage",
+        "BACKEND": "Favitude.assets.FavitudeStaticFilesStorage",
     },
 }
 
@@ -237,3 +255,131 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
+
+# Favicon render cache
+# Finished bundles are cached by a hash of their normalized render parameters (text)
+# or of the uploaded bytes (upload). FAVITUDE_RENDER_CACHE_BACKEND may be
+# 'locmem', 'filesystem' or 'django'.
+FAVITUDE_RENDER_CACHE_BACKEND = os.environ.get('FAVITUDE_RENDER_CACHE_BACKEND', 'locmem')
+FAVITUDE_RENDER_CACHE_DIR = Path(os.environ.get('FAVITUDE_RENDER_CACHE_DIR', BASE_DIR / 'render_cache'))
+
+
+def _render_cache(alias, max_bytes, timeout=None):
+    return {
+        'locmem': {
+            'BACKEND': 'Favitude.cache.LocMemRenderCache',
+            'OPTIONS': {'max_bytes': max_bytes, 'timeout': timeout},
+        },
+        'filesystem': {
+            'BACKEND': 'Favitude.cache.FileSystemRenderCache',
+            'OPTIONS': {'location': FAVITUDE_RENDER_CACHE_DIR / alias, 'max_bytes': max_bytes, 'timeout': timeout},
+        },
+        'django': {
+            'BACKEND': 'Favitude.cache.DjangoRenderCache',
+            'OPTIONS': {'alias': 'default', 'key_prefix': f'favitude:{alias}:', 'timeout': timeout},
+        },
+    }[FAVITUDE_RENDER_CACHE_BACKEND]
+
+
+FAVITUDE_RENDER_CACHES = {
+    'text': _render_cache(
+        'text',
+        max_bytes=int(os.environ.get('FAVITUDE_RENDER_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ),
+    'upload': _render_cache(
+        'upload',
+        max_bytes=int(os.environ.get('FAVITUDE_UPLOAD_CACHE_MAX_BYTES', 128 * 1024 * 1024)),
+        timeout=int(os.environ.get('FAVITUDE_UPLOAD_CACHE_TTL', 24 * 60 * 60)),
+    ),
+}
+
+# Font registry
+# Directories scanned once at startup (after Favitude/bundled_fonts). Empty means the
+# platform's standard font directories. The index is saved so worker cold starts skip the scan.
+FAVITUDE_FONT_DIRS = [d for d in os.environ.get('FAVITUDE_FONT_DIRS', '').split(os.pathsep) if d]
+FAVITUDE_FONT_INDEX_PATH = os.environ.get('FAVITUDE_FONT_INDEX_PATH', BASE_DIR / 'font_index.json')
+# Load the font index and draw the background masks when a worker starts rather than on its
+# first render. Off on Vercel, where start-up time is paid by the request that caused it.
+FAVITUDE_EAGER_WARMUP = os.environ.get('FAVITUDE_EAGER_WARMUP', '0' if os.environ.get('VERCEL') else '1') == '1'
+
+# Render executor
+# Pillow work runs on a bounded pool off the request thread. KIND is 'process', 'thread'
+# or 'inline'; when MAX_WORKERS + MAX_QUEUE jobs are in flight, requests get a 503. Threads
+# on Vercel, whose functions cannot create the semaphores a process pool needs.
+FAVITUDE_RENDER_EXECUTOR = {
+    'KIND': os.environ.get('FAVITUDE_RENDER_EXECUTOR', 'thread' if os.environ.get('VERCEL') else 'process'),
+    'MAX_WORKERS': int(os.environ.get('FAVITUDE_RENDER_WORKERS', os.cpu_count() or 1)),
+    'MAX_QUEUE': int(os.environ.get('FAVITUDE_RENDER_QUEUE', 16)),
+    'TIMEOUT': int(os.environ.get('FAVITUDE_RENDER_TIMEOUT', 30)),
+    'RETRY_AFTER': int(os.environ.get('FAVITUDE_RENDER_RETRY_AFTER', 5)),
+}
+
+# Uploaded sources and finished bundles for queued favicon jobs
+MEDIA_URL = '/media/'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
+
+# Largest number of texts or images accepted by one batch request
+FAVITUDE_BATCH_MAX_ITEMS = int(os.environ.get('FAVITUDE_BATCH_MAX_ITEMS', 50))
+
+# Upload ingestion limits (see Favitude/ingest.py)
+FAVITUDE_UPLOAD_LIMITS = {
+    'MAX_PIXELS': int(os.environ.get('FAVITUDE_UPLOAD_MAX_PIXELS', 40_000_000)),
+    'MAX_DECODE_BYTES': int(os.environ.get('FAVITUDE_UPLOAD_MAX_DECODE_BYTES', 256 * 2 ** 20)),
+    'MAX_FRAMES': int(os.environ.get('FAVITUDE_UPLOAD_MAX_FRAMES', 64)),
+    'TIME_BUDGET': float(os.environ.get('FAVITUDE_UPLOAD_TIME_BUDGET', 10)),
+    'MAX_UPLOAD_BYTES': int(os.environ.get('FAVITUDE_UPLOAD_MAX_BYTES', 20 * 2 ** 20)),
+}
+
+# PNG output optimizer (see Favitude/optimize.py): the largest per-channel change allowed when
+# folding a frame's rarest colours into a 256-entry palette. 0 (the default) keeps every PNG
+# lossless; a small value such as 2 opts in to lossy paletting of anti-aliased frames.
+FAVITUDE_PNG_QUANTIZE_TOLERANCE = int(os.environ.get('FAVITUDE_PNG_QUANTIZE_TOLERANCE', 0))
+
+# Render instrumentation (see Favitude/instrument.py): per-stage spans reported in a
+# Server-Timing header and aggregated into histograms served at api/stats/render/
+FAVITUDE_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('FAVITUDE_INSTRUMENTATION', '1') == '1',
+    'SERVER_TIMING': os.environ.get('FAVITUDE_SERVER_TIMING', '1') == '1',
+    'SLOW_REQUEST_MS': int(os.environ.get('FAVITUDE_SLOW_REQUEST_MS', 1000)),
+}
+
+# Caches. 'pages' holds the static marketing and docs pages (see Favitude/pagecache.py);
+# FAVITUDE_PAGE_CACHE_BACKEND may be 'locmem' (per process) or 'filesystem' (shared by the
+# workers of one host, so gallery edits invalidate all of them at once).
+FAVITUDE_PAGE_CACHE_BACKEND = os.environ.get('FAVITUDE_PAGE_CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'favitude-pages',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        },
+        'filesystem': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': Path(os.environ.get('FAVITUDE_PAGE_CACHE_DIR', BASE_DIR / 'page_cache')),
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        },
+    }[FAVITUDE_PAGE_CACHE_BACKEND],
+}
+
+# Whole pages for anonymous visitors and template fragments for signed-in users, invalidated
+# when BUILD_HASH changes. Deploys should set FAVITUDE_BUILD_HASH (e.g. to the commit) when
+# the checkout has no .git; otherwise each process start begins with an empty page cache.
+FAVITUDE_PAGE_CACHE = {
+    'ENABLED': os.environ.get('FAVITUDE_PAGE_CACHE', '0' if DEBUG else '1') == '1',
+    'ALIAS': 'pages',
+    'TIMEOUT': int(os.environ.get('FAVITUDE_PAGE_CACHE_TTL', 600)),
+    'BUILD_HASH': os.environ.get('FAVITUDE_BUILD_HASH', ''),
+}
+
+# Responsive image variants built by build_assets and emitted by {% picture %}
+FAVITUDE_ASSETS = {
+    'SOURCES': ['images/'],
+    'WIDTHS': [int(w) for w in os.environ.get('FAVITUDE_ASSET_WIDTHS', '160,320,640,1280').split(',')],
+    'FORMATS': ['avif', 'webp'],
+    'QUALITY': {'avif': 60, 'webp': 80, 'jpeg': 82},
+    'AVIF_SPEED': int(os.environ.get('FAVITUDE_AVIF_SPEED', 6)),
+}
@@ -16,9 +16,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from Favitude.lazy import lazy_include
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('Favitude.urls', namespace='Hill')),
-    path('accounts/', include('allauth.urls')),
-    path('accounts/', include('django.contrib.auth.urls')),
+    # Loaded with the first accounts/ URL resolved or reversed; see Favitude/lazy.py
+    path('accounts/', lazy_include('allauth.urls')),
+    path('accounts/', lazy_include('django.contrib.auth.urls')),
 ]
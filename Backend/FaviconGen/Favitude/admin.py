@@ -1,3 +1,27 @@
 from django.contrib import admin
 
+from .models import GalleryItem, generateImage
+
 # Register your models here.
+@admin.register(generateImage)
+class FaviconJobAdmin(admin.ModelAdmin):
+    list_display = ('job_id', 'kind', 'status', 'owner', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('job_id', 'created_at', 'started_at', 'finished_at')
+
+
+@admin.register(GalleryItem)
+class GalleryItemAdmin(admin.ModelAdmin):
+    list_display = ('slug', 'title', 'kind', 'position', 'is_published', 'bundle_size', 'rendered_at')
+    list_filter = ('kind', 'is_published')
+    list_editable = ('position', 'is_published')
+    prepopulated_fields = {'slug': ('title',)}
+    readonly_fields = ('source_digest', 'bundle', 'bundle_digest', 'bundle_size', 'preview', 'preview_digest',
+                       'rendered_at')
+    actions = ['prerender']
+
+    @admin.action(description='Pre-render selected items')
+    def prerender(self, request, queryset):
+        from . import gallery
+        rendered = sum(gallery.prerender_item(item, force=True) for item in queryset)
+        self.message_user(request, f'Rendered {rendered} item(s).')
@@ -0,0 +1,152 @@
+"""
+REST API for queued favicon generation.
+"""
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.utils.http import content_disposition_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import batch, instrument, jobs, uploads
+from .executor import RenderQueueFull
+from .models import generateImage
+from .serializers import (
+    BatchImageSerializer, BatchTextSerializer, ImageJobSerializer, JobSerializer, TextJobSerializer
+)
+
+
+class FaviconAPIView(APIView):
+    # JWT for API clients, session for the site's own pages
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # Views taking image uploads set this to the most files one request may carry
+    upload_max_files = 0
+
+    def initialize_request(self, request, *args, **kwargs):
+        if self.upload_max_files:
+            uploads.install(request, self.upload_max_files)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_job(self, request, job_id):
+        return get_object_or_404(generateImage, job_id=job_id, owner=request.user)
+
+    def rejected_uploads_response(self, request):
+        """
+        400 listing the uploads the upload handler refused, or None if there were none.
+        """
+        errors = {}
+        for field_name, file_name, message in uploads.rejections(request):
+            errors.setdefault(field_name, []).append(f'{file_name}: {message}' if file_name else message)
+        if not errors:
+            return None
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class JobListView(FaviconAPIView):
+    """
+    POST a text spec (JSON or form) or a multipart ``image`` upload to queue a render.
+    Responds 202 with the job id and the URL to poll.
+    """
+    upload_max_files = 1
+
+    def post(self, request):
+        rejected = self.rejected_uploads_response(request)
+        if rejected is not None:
+            return rejected
+        if 'image' in request.FILES:
+            serializer = ImageJobSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+            job = jobs.enqueue_image_job(request.user, data['image'], data['profile'], data['sizes'])
+        else:
+            serializer = TextJobSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            job = jobs.enqueue_text_job(request.user, serializer.validated_data)
+        data = JobSerializer(job, context={'request': request}).data
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['status_url']})
+
+
+class JobDetailView(FaviconAPIView):
+
+    def get(self, request, job_id):
+        job = self.get_job(request, job_id)
+        return Response(JobSerializer(job, context={'request': request}).data)
+
+
+class JobResultView(FaviconAPIView):
+    """
+    Serves the stored ZIP once the job has succeeded; 409 while it is still queued or running.
+    """
+
+    def get(self, request, job_id):
+        job = self.get_job(request, job_id)
+        if job.status != generateImage.STATUS_SUCCEEDED:
+            return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_409_CONFLICT)
+        return FileResponse(job.result.open('rb'), as_attachment=True, filename='favicons.zip')
+
+
+class BatchView(FaviconAPIView):
+    """
+    POST ``{"items": [text spec, ...]}`` as JSON, or several ``images`` (plus an optional
+    ``profile``/``sizes`` for all of them) as a multipart upload, to render them all in parallel. Streams back one ZIP with a folder per item and a
+    manifest.json of per-item status and timings.
+    """
+    upload_max_files = settings.FAVITUDE_BATCH_MAX_ITEMS
+
+    def post(self, request):
+        rejected = self.rejected_uploads_response(request)
+        if rejected is not None:
+            return rejected
+        if request.FILES:
+            serializer = BatchImageSerializer(data={
+                'images': request.FILES.getlist('images'),
+                'profile': request.data.get('profile', ''),
+                'sizes': request.data.getlist('sizes'),
+            })
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+            items = batch.image_items(data['images'], data['profile'], data['sizes'])
+        else:
+            serializer = BatchTextSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            items = batch.text_items(serializer.validated_data['items'])
+
+        renderer = batch.BatchRenderer(items)
+        try:
+            renderer.start()
+        except RenderQueueFull as e:
+            response = HttpResponse(str(e), status=503, content_type='text/plain')
+            response['Retry-After'] = str(e.retry_after)
+            return response
+
+        response = StreamingHttpResponse(renderer.stream(), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, 'favicons_batch.zip')
+        return response
+
+
+class RenderStatsView(FaviconAPIView):
+    """
+    Per-stage render latency histograms of the process answering the request (each worker
+    process keeps its own). Staff only; DELETE clears them.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'enabled': instrument.is_enabled(),
+            'pid': os.getpid(),
+            'since': instrument.stats.started_at,
+            'stages': instrument.stats.snapshot(),
+        })
+
+    def delete(self, request):
+        instrument.stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class FavitudeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Favitude'
+
+    def ready(self):
+        from . import pagecache  # noqa: F401 (connects its signals)
+        # Serverless workers skip this: both happen on the first render anyway, and a cold
+        # start should not pay for Pillow when its first request is not a render
+        if not getattr(settings, 'FAVITUDE_EAGER_WARMUP', True):
+            return
+        # Build (or load the saved) font index once per process instead of per request
+        from . import fonts, profiles, textrender, utils
+        fonts.registry.load()
+        # Background masks are shared by every text render; drawing them all takes a few ms
+        sizes = {size[0] for outputs in profiles.PROFILES.values() for size in profiles.plan_sizes(outputs)}
+        textrender.warm_shape_masks(utils.BG_SHAPES, sizes)
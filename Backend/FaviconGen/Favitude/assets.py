@@ -0,0 +1,305 @@
+"""
+Static asset pipeline: responsive image variants and the hashed, precompressed storage.
+
+``manage.py build_assets`` runs it in two steps:
+
+1. build_variants() writes AVIF, WebP and downscaled copies of every source image (PNG and
+   JPEG under ``SOURCES``) to ``static/variants/`` and records them in
+   ``variants/variants.json``. Images whose bytes and encoding settings have not changed
+   since the last build are skipped.
+2. collectstatic, through FavitudeStaticFilesStorage, copies everything to STATIC_ROOT with a
+   content hash in each name (served by whitenoise with a far-future, immutable Cache-Control)
+   and writes gzip and brotli copies of the text assets next to them.
+
+The ``{% picture %}`` tag (templatetags/assets.py) turns the variants into ``<picture>`` markup.
+
+Configured through ``settings.FAVITUDE_ASSETS``:
+
+    FAVITUDE_ASSETS = {
+        'SOURCES': ['images/'],           # static path prefixes to build variants of
+        'WIDTHS': [160, 320, 640, 1280],  # srcset widths, plus each image's own width
+        'FORMATS': ['avif', 'webp'],      # modern formats offered ahead of the original
+        'QUALITY': {'avif': 60, 'webp': 80, 'jpeg': 82},
+        'AVIF_SPEED': 6,                  # libavif effort, 0 (smallest) to 10 (fastest)
+    }
+"""
+import hashlib
+import json
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+DEFAULT_CONFIG = {
+    'SOURCES': ['images/'],
+    'WIDTHS': [160, 320, 640, 1280],
+    'FORMATS': ['avif', 'webp'],
+    'QUALITY': {'avif': 60, 'webp': 80, 'jpeg': 82},
+    'AVIF_SPEED': 6,
+}
+
+# Where variants are written, inside the app's static directory so every finder sees them
+VARIANTS_PREFIX = 'variants'
+VARIANTS_DIR = Path(__file__).resolve().parent / 'static' / VARIANTS_PREFIX
+MANIFEST_NAME = posixpath.join(VARIANTS_PREFIX, 'variants.json')
+
+SOURCE_FORMATS = {'.png': 'png', '.jpg': 'jpeg', '.jpeg': 'jpeg'}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'png': 'image/png', 'jpeg': 'image/jpeg'}
+
+_config = None
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = {**DEFAULT_CONFIG, **getattr(settings, 'FAVITUDE_ASSETS', {})}
+    return _config
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    global _config, _manifest
+    if setting in ('FAVITUDE_ASSETS', 'STATIC_ROOT', 'STATICFILES_DIRS'):
+        _config = None
+        _manifest = None
+
+
+class FavitudeStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Whitenoise's hashed, precompressed storage, made safe to deploy before the first build:
+
+    - names missing from the manifest (no build yet, or files added since) resolve to the
+      unhashed file, which whitenoise serves from the finders, instead of raising;
+    - CSS references to files that do not exist are left as written (they were 404s already)
+      and listed in ``missing_references`` rather than failing collectstatic.
+    """
+    manifest_strict = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.missing_references = []
+
+    def stored_name(self, name):
+        if self.hash_key(urlsplit(unquote(name)).path.strip()) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def url_converter(self, name, hashed_files, template=None):
+        convert = super().url_converter(name, hashed_files, template)
+
+        def converter(matchobj):
+            try:
+                return convert(matchobj)
+            except ValueError:
+                self.missing_references.append((name, matchobj['url']))
+                return matchobj['matched']
+
+        return converter
+
+
+def variant_widths(width):
+    """
+    The srcset widths built for an image ``width`` pixels wide, its own width last.
+    """
+    return [w for w in get_config()['WIDTHS'] if w < width] + [width]
+
+
+def available_formats():
+    """
+    The configured modern formats this Pillow build can encode.
+    """
+    from PIL import features
+
+    return [fmt for fmt in get_config()['FORMATS'] if features.check(fmt)]
+
+
+def find_sources():
+    """
+    (static path, absolute path) of every source image, as the finders would collect them.
+    The first finder to list a path wins, like collectstatic.
+    """
+    sources = {}
+    prefixes = tuple(get_config()['SOURCES'])
+    for finder in finders.get_finders():
+        for path, storage in finder.list(['CVS', '.*', '*~']):
+            path = path.replace(os.sep, '/')
+            if (path.startswith(prefixes) and not path.startswith(VARIANTS_PREFIX + '/')
+                    and Path(path).suffix.lower() in SOURCE_FORMATS and path not in sources):
+                sources[path] = storage.path(path)
+    return sorted(sources.items())
+
+
+def _digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _variant_name(path, width, fmt):
+    stem, _ = posixpath.splitext(path)
+    return posixpath.join(VARIANTS_PREFIX, f'{stem}-{width}w.{"jpg" if fmt == "jpeg" else fmt}')
+
+
+def _save(img, fmt, name):
+    config = get_config()
+    quality = config['QUALITY']
+    target = VARIANTS_DIR.parent / name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == 'jpeg':
+        img.convert('RGB').save(target, 'JPEG', quality=quality['jpeg'], optimize=True, progressive=True)
+    elif fmt == 'png':
+        img.save(target, 'PNG', optimize=True)
+    elif fmt == 'webp':
+        img.save(target, 'WEBP', quality=quality['webp'], method=6)
+    else:
+        img.save(target, 'AVIF', quality=quality['avif'], speed=config['AVIF_SPEED'])
+    return target.stat().st_size
+
+
+def build_image(path, source):
+    """
+    Writes the variants of one source image and returns its manifest entry. A modern format
+    is only offered when the full-size encode is smaller than the original file.
+    """
+    # Pillow is imported here rather than at the top: whitenoise loads this module (for the
+    # storage) at start-up, and serving pages never builds variants
+    from PIL import Image
+
+    source_format = SOURCE_FORMATS[Path(path).suffix.lower()]
+    source_bytes = os.path.getsize(source)
+    with Image.open(source) as img:
+        img.load()
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if img.mode in ('P', 'LA', 'PA') or 'transparency' in img.info else 'RGB')
+        width, height = img.size
+        widths = variant_widths(width)
+        scaled = {w: img if w == width else img.resize((w, max(1, round(height * w / width))), Image.Resampling.LANCZOS)
+                  for w in widths}
+
+        sources = {}
+        for fmt in available_formats():
+            full = _variant_name(path, width, fmt)
+            if _save(scaled[width], fmt, full) >= source_bytes:
+                (VARIANTS_DIR.parent / full).unlink()
+                continue
+            entries = [(_variant_name(path, w, fmt), w) for w in widths[:-1]]
+            for name, w in entries:
+                _save(scaled[w], fmt, name)
+            sources[MIME_TYPES[fmt]] = entries + [(full, width)]
+
+        # Smaller copies in the original format for browsers without either
+        entries = [(_variant_name(path, w, source_format), w) for w in widths[:-1]]
+        for name, w in entries:
+            _save(scaled[w], source_format, name)
+        sources[MIME_TYPES[source_format]] = entries + [(path, width)]
+
+    return {'digest': _digest(source), 'build': _build_key(), 'width': width, 'height': height,
+            'sources': sources}
+
+
+def _build_or_error(item):
+    from PIL import Image
+
+    try:
+        return build_image(*item), None
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return None, str(e)
+
+
+def _build_key():
+    """
+    Identifies the settings variants are encoded with; changing any of them rebuilds all.
+    """
+    config = get_config()
+    return json.dumps([config[key] for key in ('WIDTHS', 'FORMATS', 'QUALITY', 'AVIF_SPEED')], sort_keys=True)
+
+
+def _is_current(path, entry, source):
+    if entry is None or entry.get('build') != _build_key() or entry['digest'] != _digest(source):
+        return False
+    return all(name == path or (VARIANTS_DIR.parent / name).exists()
+               for entries in entry['sources'].values() for name, _ in entries)
+
+
+def build_variants(force=False, jobs=None, log=None):
+    """
+    Brings ``static/variants`` up to date with the source images and writes the manifest.
+    Returns (built, up to date, failed) where failed lists (path, error) for sources Pillow
+    cannot read; those keep their plain <img>. Variants of images that no longer exist are
+    removed.
+    """
+    manifest_path = VARIANTS_DIR.parent / MANIFEST_NAME
+    try:
+        previous = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        previous = {}
+
+    sources = find_sources()
+    stale = [(path, source) for path, source in sources
+             if force or not _is_current(path, previous.get(path), source)]
+    manifest = {path: previous[path] for path, _ in sources if path in previous}
+    failed = []
+
+    # Encoders release the GIL, so threads keep every core busy
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        for (path, _), (entry, error) in zip(stale, pool.map(_build_or_error, stale)):
+            if error:
+                manifest.pop(path, None)
+                failed.append((path, error))
+                continue
+            manifest[path] = entry
+            if log:
+                log(f'{path}: {entry["width"]}px, {", ".join(entry["sources"])}')
+
+    keep = {name for entry in manifest.values() for entries in entry['sources'].values() for name, _ in entries}
+    for file in VARIANTS_DIR.rglob('*'):
+        name = file.relative_to(VARIANTS_DIR.parent).as_posix()
+        if file.is_file() and name != MANIFEST_NAME and name not in keep:
+            file.unlink()
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    clear_manifest()
+    return len(stale) - len(failed), len(sources) - len(stale), failed
+
+
+def clear_manifest():
+    global _manifest
+    _manifest = None
+
+
+def get_manifest():
+    """
+    The variants manifest: from the finders while developing, else from STATIC_ROOT. Empty
+    when build_assets has not been run, in which case {% picture %} emits plain <img> tags.
+    """
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                path = finders.find(MANIFEST_NAME)
+                if path is None and staticfiles_storage.exists(MANIFEST_NAME):
+                    path = staticfiles_storage.path(MANIFEST_NAME)
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        _manifest = json.load(f)
+                except (TypeError, OSError, ValueError):
+                    _manifest = {}
+    return _manifest
+
+
+def get_variants(path):
+    return get_manifest().get(path)
@@ -0,0 +1,118 @@
+"""
+Support for ``async def`` views on Django 4.2.
+
+Django 4.2 runs async views natively under ASGI, but its view decorators (login_required,
+csrf_protect, csrf_exempt, require_GET) only wrap sync views; async support for them arrived
+in 5.0. The versions here accept both: sync views get Django's decorator unchanged, async
+views an async wrapper that makes the same check, in a worker thread where the check may load
+the session or the user or parse the request body.
+
+Anything blocking an async view needs (template rendering, ORM calls without an async API)
+goes through sync_to_async; CPU-bound rendering goes to the render executor (executor.arun).
+
+Under WSGI an async view runs in its own event loop and its response is sent by the WSGI
+server, which can only iterate synchronously. Django 4.2 picks sync or async streaming from
+the iterator it is given, so streaming views choose by the request's handler (is_asgi()).
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth import decorators as auth_decorators
+from django.core.handlers.asgi import ASGIRequest
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators import csrf, http
+
+# Bytes read per worker-thread hop when streaming a file
+CHUNK_SIZE = 64 * 1024
+
+
+def _gate(decorator, blocking):
+    """
+    An async-capable version of ``decorator``, a Django view decorator that either refuses
+    the request with a response or calls the view. For async views the check runs as
+    Django's own code on a view that does nothing; ``blocking`` checks (ones that may query
+    the database) run on the thread sync_to_async reserves for the ORM.
+    """
+    def async_capable(view_func):
+        if not iscoroutinefunction(view_func):
+            return decorator(view_func)
+        check = decorator(lambda request, *args, **kwargs: None)
+        if blocking:
+            check = sync_to_async(check)
+
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            response = check(request, *args, **kwargs)
+            if blocking:
+                response = await response
+            if response is not None:
+                return response
+            return await view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return async_capable
+
+
+# request.user loads the session and the user the first time it is read
+login_required = _gate(auth_decorators.login_required, blocking=True)
+require_GET = _gate(http.require_GET, blocking=False)
+
+
+def csrf_exempt(view_func):
+    if not iscoroutinefunction(view_func):
+        return csrf.csrf_exempt(view_func)
+
+    @wraps(view_func)
+    async def wrapper(*args, **kwargs):
+        return await view_func(*args, **kwargs)
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def csrf_protect(view_func):
+    """
+    csrf_protect for sync and async views. For async views the check, which reads
+    request.POST and so parses the body (and runs the upload handlers), happens on a worker
+    thread. The response is left to CsrfViewMiddleware, which every request passes through.
+    """
+    if not iscoroutinefunction(view_func):
+        return csrf.csrf_protect(view_func)
+    middleware = CsrfViewMiddleware(view_func)
+
+    def check(request, args, kwargs):
+        middleware.process_request(request)
+        return middleware.process_view(request, view_func, args, kwargs)
+
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        response = await sync_to_async(check, thread_sensitive=False)(request, args, kwargs)
+        if response is not None:
+            return response
+        return await view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+async def _aiter_file(filelike, chunk_size=CHUNK_SIZE):
+    read = sync_to_async(filelike.read, thread_sensitive=False)
+    while chunk := await read(chunk_size):
+        yield chunk
+
+
+def stream_file(request, response):
+    """
+    Under ASGI, makes a FileResponse read its file on worker threads as an async iterator;
+    Django 4.2 would otherwise read the whole file in one thread (with a warning) before
+    sending any of it. The file is still closed with the response. Under WSGI the response is
+    left to the server's wsgi.file_wrapper.
+    """
+    filelike = getattr(response, 'file_to_stream', None)
+    if filelike is not None and is_asgi(request):
+        response.streaming_content = _aiter_file(filelike)
+    return response
@@ -1,23 +1,62 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import CharField, Func, Q
+
+
+class EmailKey(Func):
+    """
+    The expression migration 0004 indexes uniquely: the lower-cased email, with blank emails
+    as NULL so any number of accounts may have none. The '' is spelled out rather than bound
+    as a parameter, since SQLite only uses an expression index for an identical expression.
+    """
+    template = "NULLIF(LOWER(%(expressions)s), '')"
+    output_field = CharField()
+
+
+def users_by_username_or_email(username=None, email=None):
+    """
+    Users whose username is ``username`` or whose email matches ``email``, in one indexed
+    query. Both may be given.
+    """
+    UserModel = get_user_model()
+    lookup = Q()
+    if username:
+        lookup |= Q(**{UserModel.USERNAME_FIELD: username})
+    if email:
+        lookup |= Q(email_key=email.lower())
+    if not lookup:
+        return UserModel._default_manager.none()
+    return UserModel._default_manager.alias(email_key=EmailKey('email')).filter(lookup)
+
 
 class EmailBackend(ModelBackend):
-    def authenticate(self, request, username=None, password=None, **kwargs):
-        UserModel = get_user_model()
-        try:
-            # Check if the "username" (which comes from the form) is an email
-            # We look up user by email
-            user = UserModel.objects.get(email=username)
-        except UserModel.DoesNotExist:
-            # If user not found by email, return None
-            # Optionally, fall back to checking by username here if you want mixed login
+    """
+    The only authentication backend: accepts an email or a username in ``username`` (the
+    site's login form) or ``email`` (allauth), looks the user up with a single query and runs
+    the password hasher exactly once per attempt, hashing a dummy password when nobody matches
+    so failed logins take as long as successful ones.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        if password is None:
             return None
-        except UserModel.MultipleObjectsReturned:
-            # Handle edge case where multiple accounts might have same email (shouldn't happen with unique constrained)
+        login = email or username
+        if not login:
             return None
 
-        # Verify the password
+        # Mixed login: the form's single box takes either; an '@' means it is an email
+        candidates = list(users_by_username_or_email(username=username, email=login)[:2])
+        user = None
+        for candidate in candidates:
+            if '@' in login and candidate.email.lower() == login.lower():
+                user = candidate
+                break
+        if user is None and candidates:
+            user = candidates[0]
+
+        if user is None:
+            get_user_model()().set_password(password)
+            return None
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
@@ -0,0 +1,195 @@
+"""
+Batch rendering for agencies generating favicons for many brands at once.
+
+Items are rendered in parallel on the render executor (sharing its loaded fonts and the
+resize pipeline) and streamed back as a single ZIP with one folder per item, followed by a
+``manifest.json`` recording each item's outcome and timings.
+"""
+import io
+import json
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent import futures
+
+from django.utils.text import slugify
+
+from . import executor, utils
+
+
+class BatchItem:
+
+    def __init__(self, name, kind, render_cache, key, render):
+        self.name = name
+        self.kind = kind
+        self.render_cache = render_cache
+        self.key = key
+        self.render = render
+        self.future = None
+        self.data = None
+        self.error = None
+        self.cached = False
+        self.submitted_at = None
+        self.render_seconds = 0.0
+        self.total_seconds = 0.0
+        self.size = 0
+
+
+def _folder_name(index, label, taken):
+    name = f'{index:02d}-{slugify(label) or "item"}'[:64]
+    while name in taken:
+        name += '_'
+    taken.add(name)
+    return name
+
+
+def text_items(specs):
+    """
+    BatchItems for validated text specs (keyword arguments of generate_favicon_from_text,
+    plus an optional ``name`` for the item's folder).
+    """
+    taken = set()
+    items = []
+    for index, spec in enumerate(specs, start=1):
+        spec = dict(spec)
+        label = spec.pop('name', '') or spec['text']
+        items.append(BatchItem(_folder_name(index, label, taken), 'text', *utils.prepare_text_render(**spec)))
+    return items
+
+
+def image_items(uploads, profile=None, sizes=None):
+    """
+    BatchItems for uploaded image files, foldered by their filenames, all rendered with the
+    same output profile.
+    """
+    taken = set()
+    items = []
+    for index, upload in enumerate(uploads, start=1):
+        label = os.path.splitext(os.path.basename(upload.name or ''))[0]
+        items.append(BatchItem(_folder_name(index, label, taken), 'image', *utils.prepare_image_render(upload, profile, sizes)))
+    return items
+
+
+def _timed_bundle(render):
+    start = time.perf_counter()
+    data = b''.join(render())
+    return data, time.perf_counter() - start
+
+
+class BatchRenderer:
+    """
+    Keeps at most one render per executor worker in flight for this batch, so one large
+    batch cannot take over the shared queue, and yields ZIP members in item order as each
+    item finishes.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.executor = executor.get_render_executor()
+        self.window = self.executor.max_workers if self.executor else 1
+        self._in_flight = deque()
+        self._next = 0
+
+    def start(self):
+        """
+        Submits the first renders. Raises RenderQueueFull if the executor has no room at all,
+        before any response bytes have been sent.
+        """
+        self._fill(strict=True)
+
+    def _fill(self, strict=False):
+        while self._next < len(self.items) and len(self._in_flight) < self.window:
+            item = self.items[self._next]
+            item.submitted_at = time.perf_counter()
+            data = item.render_cache.get(item.key) if item.render_cache is not None else None
+            if data is not None:
+                item.data = data
+                item.cached = True
+            elif self.executor is not None:
+                try:
+                    item.future = self.executor.submit(_timed_bundle, item.render)
+                except executor.RenderQueueFull:
+                    if strict and not self._in_flight:
+                        raise
+                    if self._in_flight:
+                        # Wait for one of our own renders to free a slot
+                        return
+                    # Nothing of ours is queued to wait on; render here rather than stall
+                    self._resolve_inline(item)
+            else:
+                self._resolve_inline(item)
+            self._in_flight.append(item)
+            self._next += 1
+
+    def _resolve_inline(self, item):
+        try:
+            item.data, item.render_seconds = _timed_bundle(item.render)
+        except Exception as e:
+            item.error = str(e)
+
+    def _wait(self, item):
+        if item.future is not None:
+            try:
+                item.data, item.render_seconds = item.future.result(timeout=self.executor.timeout)
+            except futures.TimeoutError:
+                item.future.cancel()
+                item.error = f'Rendering took longer than {self.executor.timeout} seconds.'
+            except Exception as e:
+                item.error = str(e)
+        item.total_seconds = time.perf_counter() - item.submitted_at
+        if item.data is not None and not item.cached and item.render_cache is not None:
+            item.render_cache.set(item.key, item.data)
+
+    def members(self):
+        """
+        (arcname, writer) pairs for utils.iter_zip: each item's files under its folder, then
+        the manifest.
+        """
+        while self._in_flight or self._next < len(self.items):
+            self._fill()
+            item = self._in_flight.popleft()
+            self._wait(item)
+            self._fill()
+            if item.data is None:
+                continue
+            bundle = zipfile.ZipFile(io.BytesIO(item.data))
+            for info in bundle.infolist():
+                yield f'{item.name}/{info.filename}', _copy_member(bundle, info)
+            item.size = len(item.data)
+            # Release the item's archive as soon as it has been written out
+            item.data = None
+
+        yield 'manifest.json', self._write_manifest
+
+    def _write_manifest(self, dest):
+        manifest = {
+            'items': [
+                {
+                    'folder': item.name,
+                    'kind': item.kind,
+                    'status': 'failed' if item.error else 'ok',
+                    'error': item.error,
+                    'cached': item.cached,
+                    'render_ms': round(item.render_seconds * 1000, 2),
+                    'total_ms': round(item.total_seconds * 1000, 2),
+                    'bytes': item.size,
+                }
+                for item in self.items
+            ],
+        }
+        dest.write(json.dumps(manifest, indent=2).encode('utf-8'))
+
+    def stream(self):
+        return utils.iter_zip(self.members())
+
+
+def _copy_member(bundle, info):
+    def write(dest):
+        with bundle.open(info) as src:
+            while True:
+                chunk = src.read(64 * 1024)
+                if not chunk:
+                    break
+                dest.write(chunk)
+    return write
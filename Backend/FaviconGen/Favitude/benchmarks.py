@@ -0,0 +1,162 @@
+"""
+Helpers shared by the bench_* management commands.
+"""
+import io
+import multiprocessing
+import resource
+import time
+import zlib
+
+from PIL import Image
+
+
+def _proc_status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def _start_rss_window():
+    """
+    Returns the RSS (KB) to measure growth from. On Linux the high-water mark is reset first,
+    since a forked child otherwise inherits the parent's peak; elsewhere ru_maxrss is used.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_kb('VmRSS')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _peak_rss():
+    try:
+        return _proc_status_kb('VmHWM')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _calibration(source):
+    """
+    A fixed slice of the work the renderers do (Lanczos downscaling and zlib), timed next to
+    each benchmark run so timings can be compared in units of it.
+    """
+    start = time.perf_counter()
+    for side in (128, 64, 32):
+        zlib.compress(source.resize((side, side), Image.LANCZOS).tobytes(), 6)
+    return time.perf_counter() - start
+
+
+def _child(fn, args, repeat, warmup, calibrate, results):
+    for _ in range(warmup):
+        fn(*args)
+    source = Image.radial_gradient('L').convert('RGBA') if calibrate else None
+    baseline_kb = _start_rss_window()
+    timings = []
+    calibration = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+        if calibrate:
+            calibration.append(_calibration(source))
+    results.put((timings, _peak_rss() - baseline_kb, calibration))
+
+
+def measure(fn, *args, repeat=1, warmup=0, calibrate=False):
+    """
+    Runs fn(*args) ``repeat`` times in a fresh child and returns (timings in seconds,
+    peak RSS growth in KB). Children come from a forkserver rather than this process, so
+    heap the parent has freed but still holds cannot hide the measured allocations.
+    ``warmup`` untimed calls run first, so lazy imports and caches are not counted.
+    ``fn`` must be a module-level function.
+
+    With ``calibrate``, a fixed calibration workload is timed after every run and its
+    timings are returned third: on shared or throttled machines the speed of the whole
+    machine drifts by far more than the regressions worth catching, and the ratio of
+    each run to its neighbouring calibration cancels most of that drift.
+    """
+    ctx = multiprocessing.get_context('forkserver')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(fn, args, repeat, warmup, calibrate, results))
+    proc.start()
+    timings, peak_kb, calibration = results.get()
+    proc.join()
+    if calibrate:
+        return timings, peak_kb, calibration
+    return timings, peak_kb
+
+
+def make_source_image(side, fmt):
+    """
+    Encodes a side x side gradient in the given format, standing in for an uploaded logo.
+    """
+    img = Image.radial_gradient('L').resize((side, side)).convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def make_animated_gif(side, frames):
+    images = [Image.radial_gradient('L').resize((side, side)).rotate(i * 10) for i in range(frames)]
+    buf = io.BytesIO()
+    images[0].save(buf, format='GIF', save_all=True, append_images=images[1:])
+    return buf.getvalue()
+
+
+def percentile(values, pct):
+    """
+    The ``pct`` percentile of ``values``, interpolated linearly between the closest ranks.
+    """
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(timings, peak_kb, output_bytes, calibration=None):
+    """
+    The JSON record of one benchmark case: latency percentiles in ms, peak RSS growth in KB
+    and the size of what it produced. With the calibration timings from measure(), also the
+    median calibration time and the median latency in calibration units.
+    """
+    ms = [t * 1000 for t in timings]
+    summary = {
+        'runs': len(ms),
+        'min_ms': round(min(ms), 3),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p90_ms': round(percentile(ms, 90), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3),
+        'peak_rss_kb': peak_kb,
+        'output_bytes': output_bytes,
+    }
+    if calibration:
+        summary['calibration_ms'] = round(percentile(calibration, 50) * 1000, 3)
+        summary['p50_relative'] = round(percentile([t / c for t, c in zip(timings, calibration)], 50), 4)
+    return summary
+
+
+def find_regressions(results, baseline, thresholds, floors=None):
+    """
+    Compares two {case: summary} mappings and returns (case, metric, baseline value, current
+    value) for every metric that grew by more than its fraction in ``thresholds``. Growth
+    under the metric's absolute floor in ``floors`` is treated as noise. Cases missing from
+    either side are skipped.
+    """
+    floors = floors or {}
+    regressions = []
+    for case, current in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        for metric, threshold in thresholds.items():
+            if metric not in current or metric not in previous:
+                continue
+            before, after = previous[metric], current[metric]
+            if after - before > floors.get(metric, 0) and after > before * (1 + threshold):
+                regressions.append((case, metric, before, after))
+    return regressions
@@ -0,0 +1,348 @@
+"""
+Content-addressed cache for finished favicon bundles.
+
+Renders are deterministic in their inputs, so the ZIP produced for a given
+set of normalized parameters can be stored under a hash of those parameters
+and handed back on the next identical request without touching Pillow.
+
+Backends are configured through ``settings.FAVITUDE_RENDER_CACHES`` in the
+same shape as Django's ``CACHES`` setting:
+
+    FAVITUDE_RENDER_CACHES = {
+        'text': {
+            'BACKEND': 'Favitude.cache.LocMemRenderCache',
+            'OPTIONS': {'max_bytes': 64 * 1024 * 1024},
+        },
+    }
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_RENDER_CACHES = {
+    'text': {
+        'BACKEND': 'Favitude.cache.LocMemRenderCache',
+        'OPTIONS': {'max_bytes': 64 * 1024 * 1024},
+    },
+    'upload': {
+        'BACKEND': 'Favitude.cache.LocMemRenderCache',
+        'OPTIONS': {'max_bytes': 128 * 1024 * 1024, 'timeout': 24 * 60 * 60},
+    },
+}
+
+
+class BaseRenderCache:
+    """
+    Common interface for bundle caches. Keys are hex digests, values are bytes.
+    ``timeout`` is the default time-to-live in seconds; None keeps entries until evicted.
+    """
+
+    def __init__(self, timeout=None, **options):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        self._set(key, bytes(value), timeout)
+
+    async def aget(self, key):
+        """
+        get() for async views; backends that do I/O answer from a worker thread.
+        """
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    async def aset(self, key, value, timeout=None):
+        await sync_to_async(self.set, thread_sensitive=False)(key, value, timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, timeout):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocMemRenderCache(BaseRenderCache):
+    """
+    In-process LRU cache that evicts by total stored bytes rather than entry count.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, **options):
+        super().__init__(**options)
+        self.max_bytes = int(max_bytes)
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= len(value)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, timeout):
+        if len(value) > self.max_bytes:
+            # Never let a single oversized bundle flush the whole cache
+            return
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old[1])
+            self._entries[key] = (expires_at, value)
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    # Memory only, and the lock is never held for long: no need to leave the event loop
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value, timeout=None):
+        self.set(key, value, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(entries=len(self._entries), bytes=self.current_bytes)
+        return stats
+
+
+class FileSystemRenderCache(BaseRenderCache):
+    """
+    Stores each bundle as a file named by its key, sharded by the first two hex digits.
+    Shared by every worker process on the host. Expiry is judged from the file's mtime,
+    which is set to the expiry time on write, and ``max_bytes`` caps the directory size
+    by pruning the least recently read entries first.
+    """
+
+    def __init__(self, location=None, max_bytes=None, **options):
+        super().__init__(**options)
+        if location is None:
+            location = os.path.join(tempfile.gettempdir(), 'favitude-render-cache')
+        self.location = str(location)
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self._current_bytes = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.location, key[:2], key)
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at = os.fstat(f.fileno()).st_mtime
+                if expires_at and expires_at <= time.time():
+                    value = None
+                else:
+                    value = f.read()
+        except FileNotFoundError:
+            return None
+        if value is not None:
+            # Bump atime explicitly (mounts are often noatime) so pruning is least-recently-used
+            try:
+                os.utime(path, (time.time(), expires_at))
+            except FileNotFoundError:
+                pass
+            return value
+        self._remove(path)
+        return value
+
+    def _set(self, key, value, timeout):
+        if self.max_bytes and len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial bundle
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            # An mtime of 0 marks an entry that never expires
+            expires_at = time.time() + timeout if timeout is not None else 0
+            os.utime(tmp_path, (time.time(), expires_at))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.max_bytes:
+            with self._lock:
+                if self._current_bytes is None:
+                    self._current_bytes = sum(size for _, size, _ in self._scan())
+                else:
+                    self._current_bytes += len(value)
+                if self._current_bytes > self.max_bytes:
+                    self._prune()
+
+    def _scan(self):
+        if not os.path.isdir(self.location):
+            return
+        for shard in os.listdir(self.location):
+            shard_dir = os.path.join(self.location, shard)
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+
+    def _prune(self):
+        # Rescan so sizes written by other processes are accounted for,
+        # then drop least recently used files until back under 90% of the cap
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+        self._current_bytes = total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for path, _, _ in list(self._scan()):
+            self._remove(path)
+        with self._lock:
+            self._current_bytes = 0
+
+
+class DjangoRenderCache(BaseRenderCache):
+    """
+    Delegates storage to one of the caches configured in ``settings.CACHES``.
+    """
+
+    def __init__(self, alias='default', key_prefix='favitude:bundle:', **options):
+        super().__init__(**options)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _get(self, key):
+        return self._cache.get(self.key_prefix + key)
+
+    def _set(self, key, value, timeout):
+        self._cache.set(self.key_prefix + key, value, timeout)
+
+    def clear(self):
+        self._cache.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_render_cache(alias='text'):
+    """
+    Returns the configured cache instance for ``alias``, or None if caching is disabled for it.
+    """
+    with _caches_lock:
+        if alias not in _caches:
+            config = getattr(settings, 'FAVITUDE_RENDER_CACHES', DEFAULT_RENDER_CACHES).get(alias)
+            if config:
+                backend = import_string(config['BACKEND'])
+                _caches[alias] = backend(**config.get('OPTIONS', {}))
+            else:
+                _caches[alias] = None
+        return _caches[alias]
+
+
+def hash_upload(uploaded_file):
+    """
+    Streams an uploaded file through SHA-256 chunk by chunk and rewinds it for the decoder.
+    Uploads received through uploads.FaviconUploadHandler were hashed as they arrived.
+    """
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest is not None:
+        return digest
+    h = hashlib.sha256()
+    if hasattr(uploaded_file, 'chunks'):
+        chunks = uploaded_file.chunks()
+    else:
+        chunks = iter(lambda: uploaded_file.read(64 * 1024), b'')
+    for chunk in chunks:
+        h.update(chunk)
+    uploaded_file.seek(0)
+    return h.hexdigest()
+
+
+def make_key(namespace, **params):
+    """
+    Hashes already-normalized render parameters into a stable cache key.
+    """
+    payload = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f'{namespace}:{payload}'.encode('utf-8')).hexdigest()
+
+
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    Returns the SHA-256 of a file, memoized on (path, mtime, size) so fonts are hashed once.
+    """
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime_ns, stat.st_size)
+    with _file_digests_lock:
+        digest = _file_digests.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _file_digests_lock:
+            _file_digests[memo_key] = digest
+    return digest
@@ -0,0 +1,213 @@
+"""
+Cold-start measurement: start-up phases, import times and time to first response, each taken
+in a fresh interpreter so nothing the measuring process has imported is shared.
+
+The child (``python -m Favitude.coldstart``) starts Django the way a WSGI server does, in
+timed phases, then sends the given paths straight to the WSGI handler (no server or sockets):
+
+- ``settings``: importing the settings module (dotenv, dj_database_url, ...);
+- ``setup``: django.setup(), i.e. importing every installed app and its models and running
+  the AppConfig.ready() hooks;
+- ``handler``: building the WSGI handler and its middleware chain;
+- one timing per request; the first includes importing the URLconf and whatever views it
+  pulls in.
+
+This module imports nothing from Django at the top, so the child's numbers start from a bare
+interpreter. profile_startup and bench_coldstart are the management commands built on it.
+"""
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import unquote, urlsplit
+
+# Modules whose presence after start-up or a request shows what was (or was not) deferred
+WATCHED_MODULES = (
+    'PIL.Image',
+    'numpy',
+    'Favitude.utils',
+    'rest_framework.views',
+    'rest_framework_simplejwt.authentication',
+    'requests',
+    'allauth.socialaccount.providers.google.views',
+)
+
+
+class ColdStartError(Exception):
+    pass
+
+
+class ImportRecord:
+    """
+    One line of ``python -X importtime`` output.
+    """
+
+    def __init__(self, name, self_us, cumulative_us, depth):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+    @property
+    def package(self):
+        return self.name.split('.', 1)[0]
+
+
+def parse_importtime(text):
+    """
+    The ImportRecords in ``-X importtime`` output, in the order the interpreter reported them
+    (a module after everything it imported).
+    """
+    records = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the column header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append(ImportRecord(name.strip(), int(fields[0]), int(fields[1]), depth))
+    return records
+
+
+def package_totals(records):
+    """
+    {top-level package: (self time in µs, module count)}, slowest first.
+    """
+    totals = {}
+    for record in records:
+        self_us, count = totals.get(record.package, (0, 0))
+        totals[record.package] = (self_us + record.self_us, count + 1)
+    return dict(sorted(totals.items(), key=lambda item: -item[1][0]))
+
+
+def import_chain(records, name):
+    """
+    [name, the module that imported it, the module that imported that, ...] up to an import
+    made directly by the start-up code, or [] if ``name`` was not imported.
+    """
+    for i, record in enumerate(records):
+        if record.name == name:
+            break
+    else:
+        return []
+    chain = [record.name]
+    depth = record.depth
+    # Each module is reported after the modules it imported, one level less indented
+    for later in records[i + 1:]:
+        if later.depth < depth:
+            chain.append(later.name)
+            depth = later.depth
+    return chain
+
+
+def run(paths=(), importtime=False, env=None, timeout=300):
+    """
+    Starts a fresh interpreter, lets it start Django and request ``paths``, and returns
+    (report, stderr). The report holds the phase timings, one entry per request, the watched
+    modules loaded after start-up and after the requests, and ``wall_ms``, the child process's
+    whole lifetime from the parent's side (interpreter start and exit included).
+    """
+    from django.conf import settings
+
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-m', 'Favitude.coldstart', json.dumps({'paths': list(paths)})]
+    child_env = {**os.environ, **(env or {})}
+    child_env.setdefault('DJANGO_SETTINGS_MODULE', os.environ.get('DJANGO_SETTINGS_MODULE', 'FaviconGen.settings'))
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=settings.BASE_DIR, env=child_env, capture_output=True, text=True,
+                          timeout=timeout)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        tail = '\n'.join(line for line in proc.stderr.splitlines() if not line.startswith('import time:'))[-2000:]
+        raise ColdStartError(f'The cold-start process failed:\n{tail}')
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    report['wall_ms'] = wall_ms
+    return report, proc.stderr
+
+
+def _loaded():
+    return [name for name in WATCHED_MODULES if name in sys.modules]
+
+
+def _request(app, path):
+    """
+    Sends GET ``path`` to a WSGI ``app`` and returns the status code, having read the body.
+    """
+    url = urlsplit(path)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote(url.path).encode('utf-8').decode('iso-8859-1'),
+        'QUERY_STRING': url.query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    body = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(statuses[0].split()[0])
+
+
+def _child(options):
+    phases = {}
+    mark = time.perf_counter()
+
+    def lap(name):
+        nonlocal mark
+        now = time.perf_counter()
+        phases[name] = (now - mark) * 1000
+        mark = now
+
+    from django.conf import settings
+    settings.INSTALLED_APPS
+    lap('settings')
+
+    import django
+    django.setup(set_prefix=False)
+    lap('setup')
+
+    from django.core.handlers.wsgi import WSGIHandler
+    app = WSGIHandler()
+    lap('handler')
+    loaded_at_startup = _loaded()
+
+    requests = []
+    for path in options['paths']:
+        status = _request(app, path)
+        now = time.perf_counter()
+        requests.append({'path': path, 'status': status, 'ms': (now - mark) * 1000})
+        mark = now
+
+    return {
+        'phases': phases,
+        'startup_ms': sum(phases.values()),
+        'requests': requests,
+        'loaded_at_startup': loaded_at_startup,
+        'loaded_after_requests': _loaded(),
+    }
+
+
+if __name__ == '__main__':
+    report = _child(json.loads(sys.argv[1]))
+    sys.stdout.write('\n' + json.dumps(report) + '\n')
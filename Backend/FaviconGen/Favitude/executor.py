@@ -0,0 +1,172 @@
+"""
+Bounded executor that runs favicon rasterization off the request thread.
+
+Renders run on a process pool by default, so the Python parts of a render (layout, palette
+search, ZIP writing) do not contend for the GIL with request handling; a thread pool (Pillow
+releases the GIL while resampling and encoding) suits hosts without multiprocessing. Async views await the same pool
+through arun(), so renders never run on the event loop. A job hands back the finished bundle
+and gives up its slot before the response is sent, so slow clients never hold a worker. The
+number of jobs running or waiting is capped, and submissions beyond that cap fail fast with
+RenderQueueFull so the view can answer 503 rather than pile up behind one slow upload.
+
+Configured through ``settings.FAVITUDE_RENDER_EXECUTOR``:
+
+    FAVITUDE_RENDER_EXECUTOR = {
+        'KIND': 'process',     # 'process', 'thread' or 'inline' (no pool)
+        'MAX_WORKERS': 4,
+        'MAX_QUEUE': 16,       # jobs allowed to wait for a free worker
+        'TIMEOUT': 30,         # seconds a request waits for its job
+        'RETRY_AFTER': 5,      # seconds advertised to clients when the queue is full
+    }
+"""
+import asyncio
+import atexit
+import os
+import threading
+from concurrent import futures
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import instrument
+
+
+class RenderQueueFull(Exception):
+    """
+    Raised when every worker is busy and the wait queue is full.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__('The favicon renderer is busy, please retry shortly.')
+        self.retry_after = retry_after
+
+
+class RenderTimeout(Exception):
+    """
+    Raised when a job does not finish within the configured timeout.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _timeout_error(timeout, retry_after):
+    return RenderTimeout(f'Favicon rendering took longer than {timeout} seconds.', retry_after)
+
+
+def _init_process_worker():
+    import django
+    django.setup()
+
+
+class RenderExecutor:
+
+    def __init__(self, kind='process', max_workers=None, max_queue=16, timeout=30, retry_after=5):
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        # One slot per job that is running or queued; released when the job finishes,
+        # even if the request that submitted it has already timed out
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        if kind == 'process':
+            self._pool = futures.ProcessPoolExecutor(self.max_workers, initializer=_init_process_worker)
+        else:
+            self._pool = futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix='favitude-render')
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs) and returns its Future, or raises RenderQueueFull.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise RenderQueueFull(self.retry_after)
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Submits a job and blocks until its result is ready or the timeout expires. The job's
+        instrumentation spans are handed back to the calling request.
+        """
+        collecting = instrument.is_enabled()
+        if collecting:
+            fn, args = instrument.collect, (fn, *args)
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            result = future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            future.cancel()
+            raise _timeout_error(self.timeout, self.retry_after)
+        return self._unwrap(result, collecting)
+
+    async def arun(self, fn, *args, **kwargs):
+        """
+        Async counterpart of run(): the event loop stays free while the job waits and runs. A
+        request cancelled while its job is still queued (a client that went away) cancels the
+        job.
+        """
+        collecting = instrument.is_enabled()
+        if collecting:
+            fn, args = instrument.collect, (fn, *args)
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            # Cancelling the wrapper (on timeout or disconnect) cancels the pool's future
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise _timeout_error(self.timeout, self.retry_after)
+        return self._unwrap(result, collecting)
+
+    @staticmethod
+    def _unwrap(result, collecting):
+        if not collecting:
+            return result
+        result, spans = result
+        instrument.replay(spans)
+        return result
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    """
+    Returns the process-wide executor, or None when rendering is configured to run inline.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            config = getattr(settings, 'FAVITUDE_RENDER_EXECUTOR', {})
+            kind = config.get('KIND', 'process')
+            if kind == 'inline':
+                return None
+            _executor = RenderExecutor(
+                kind=kind,
+                max_workers=config.get('MAX_WORKERS'),
+                max_queue=config.get('MAX_QUEUE', 16),
+                timeout=config.get('TIMEOUT', 30),
+                retry_after=config.get('RETRY_AFTER', 5),
+            )
+            atexit.register(_executor.shutdown, wait=False)
+        return _executor
+
+
+async def arun(fn, *args, **kwargs):
+    """
+    Awaits fn(*args, **kwargs) on the render executor, or on a worker thread when rendering is
+    configured inline; either way not on the event loop.
+    """
+    render_executor = get_render_executor()
+    if render_executor is None:
+        return await sync_to_async(fn, thread_sensitive=False)(*args, **kwargs)
+    return await render_executor.arun(fn, *args, **kwargs)
@@ -0,0 +1,263 @@
+"""
+Font discovery, loading and auto-fit sizing for the text renderer.
+"""
+import functools
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+
+from django.conf import settings
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bundled_fonts')
+
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+
+# Font filenames to try for each family offered in the UI, in order of preference.
+# The Liberation/DejaVu/Carlito entries are metric-compatible stand-ins found on Linux hosts.
+FONT_MAP = {
+    'Roboto': ['Roboto-Regular.ttf', 'arial.ttf', 'LiberationSans-Regular.ttf', 'DejaVuSans.ttf'], # Roboto might not be installed
+    'Arial': ['arial.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf', 'DejaVuSans.ttf'],
+    'Verdana': ['verdana.ttf', 'Verdana.ttf', 'DejaVuSans.ttf'],
+    'Times New Roman': ['times.ttf', 'Times.ttf', 'LiberationSerif-Regular.ttf', 'DejaVuSerif.ttf'],
+    'Helvetica': ['Helvetica.ttf', 'arial.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf', 'DejaVuSans.ttf'],
+    'Calibri': ['calibri.ttf', 'Calibri.ttf', 'Carlito-Regular.ttf', 'DejaVuSans.ttf'],
+    'Garamond': ['gara.ttf', 'Garamond.ttf', 'EBGaramond-Regular.ttf', 'DejaVuSerif.ttf'],
+    'Futura': ['Futura.ttf', 'arial.ttf', 'LiberationSans-Regular.ttf', 'DejaVuSans.ttf'],
+    'Franklin Gothic': ['framd.ttf', 'Franklin Gothic.ttf', 'LiberationSans-Regular.ttf', 'DejaVuSans.ttf'],
+    'Rockwell': ['rock.ttf', 'Rockwell.ttf', 'DejaVuSerif.ttf'],
+}
+
+# The family used when a request names none
+DEFAULT_FAMILY = 'Roboto'
+
+# Longest family name, alias or filename accepted from a request
+MAX_NAME_LENGTH = 64
+
+# Style names that count as the upright, regular face of a family
+REGULAR_STYLES = ('regular', 'book', 'roman', 'normal', 'medium')
+
+# Auto-fit bounds, in pixels on the 512px canvas
+MIN_FONT_SIZE = 11
+MAX_FONT_SIZE = 400
+SAFE_AREA = 450
+
+# Font size used for the single measurement the size estimate is scaled from. Measuring at the
+# top of the range keeps bbox rounding error small, and that font is the answer for short text.
+REFERENCE_SIZE = MAX_FONT_SIZE
+
+
+@functools.lru_cache(maxsize=256)
+def load_font(path, size):
+    """
+    Returns a FreeTypeFont for (path, size), parsing each font file/size pair only once.
+    A path of None gives Pillow's built-in font at that size.
+    """
+    if path is None:
+        return ImageFont.load_default(size=size)
+    return ImageFont.truetype(path, size)
+
+
+def _fits(path, text, size, max_extent):
+    left, top, right, bottom = load_font(path, size).getbbox(text)
+    return right - left < max_extent and bottom - top < max_extent
+
+
+def fit_font_size(path, text, max_extent=SAFE_AREA, min_size=MIN_FONT_SIZE, max_size=MAX_FONT_SIZE):
+    """
+    Returns the largest font size in [min_size, max_size] whose text bbox fits strictly inside
+    a max_extent square, or None if even min_size overflows.
+
+    Glyph extents grow almost linearly with size, so one measurement at REFERENCE_SIZE gives an
+    estimate that is usually exact; hinting can shift it by a pixel or two, so the estimate is
+    then confirmed against its neighbour and, failing that, bisected inside a narrow bracket.
+    """
+    left, top, right, bottom = load_font(path, REFERENCE_SIZE).getbbox(text)
+    extent = max(right - left, bottom - top)
+    if extent <= 0:
+        return max_size
+
+    estimate = int((max_extent - 1) * REFERENCE_SIZE / extent)
+    estimate = min(max(estimate, min_size), max_size)
+
+    # Rounding error in the reference bbox is a pixel or two, i.e. a few percent of the size
+    slack = max(2, estimate // 50)
+    if _fits(path, text, estimate, max_extent):
+        if estimate == max_size or not _fits(path, text, estimate + 1, max_extent):
+            return estimate
+        lo, hi = estimate + 1, min(estimate + slack, max_size)
+        if _fits(path, text, hi, max_extent):
+            lo, hi = hi, max_size
+    else:
+        if estimate == min_size:
+            return None
+        lo, hi = max(estimate - slack, min_size), estimate - 1
+        if not _fits(path, text, lo, max_extent):
+            lo, hi = min_size, lo - 1
+            if lo > hi or not _fits(path, text, lo, max_extent):
+                return None
+
+    # Invariant: lo fits. Find the largest fitting size in [lo, hi].
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _fits(path, text, mid, max_extent):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def default_font_dirs():
+    """
+    The platform's standard system and per-user font directories.
+    """
+    system = platform.system()
+    home = os.path.expanduser('~')
+    if system == 'Windows':
+        return [os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'),
+                os.path.join(os.environ.get('LOCALAPPDATA', home), 'Microsoft', 'Windows', 'Fonts')]
+    if system == 'Darwin':
+        return ['/System/Library/Fonts', '/Library/Fonts', os.path.join(home, 'Library', 'Fonts')]
+    return ['/usr/share/fonts', '/usr/local/share/fonts',
+            os.path.join(home, '.fonts'), os.path.join(home, '.local', 'share', 'fonts')]
+
+
+class FontRegistry:
+    """
+    Process-wide index of installed fonts, built once and persisted to disk.
+
+    ``files`` maps lower-cased filenames to paths and ``families`` maps lower-cased family
+    names to the path of their regular face. The saved index carries a fingerprint of the
+    scanned directories' mtimes, so a worker cold start reuses it unless fonts were added
+    or removed.
+    """
+
+    def __init__(self, font_dirs=None, index_path=None):
+        self.font_dirs = font_dirs
+        self.index_path = index_path
+        self.files = {}
+        self.families = {}
+        self._resolved = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _configured_dirs(self):
+        dirs = self.font_dirs
+        if dirs is None:
+            dirs = getattr(settings, 'FAVITUDE_FONT_DIRS', None) or default_font_dirs()
+        return [BUNDLED_FONT_DIR] + [str(d) for d in dirs]
+
+    def _configured_index_path(self):
+        if self.index_path is not None:
+            return str(self.index_path)
+        return str(getattr(settings, 'FAVITUDE_FONT_INDEX_PATH', None)
+                   or os.path.join(tempfile.gettempdir(), 'favitude-font-index.json'))
+
+    def _fingerprint(self, dirs):
+        fingerprint = {}
+        for root in dirs:
+            for dirpath, _, _ in os.walk(root):
+                try:
+                    fingerprint[dirpath] = os.stat(dirpath).st_mtime_ns
+                except OSError:
+                    continue
+        return fingerprint
+
+    def load(self):
+        """
+        Populates the index from disk if it is still current, otherwise rescans and saves it.
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            dirs = self._configured_dirs()
+            fingerprint = self._fingerprint(dirs)
+            index_path = self._configured_index_path()
+            if not self._read_index(index_path, fingerprint):
+                self._scan(dirs)
+                self._write_index(index_path, fingerprint)
+            self._resolved.clear()
+            self._loaded = True
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+        self.load()
+
+    def _read_index(self, index_path, fingerprint):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('fingerprint') != fingerprint:
+            return False
+        self.files = data['files']
+        self.families = data['families']
+        return True
+
+    def _write_index(self, index_path, fingerprint):
+        data = {'fingerprint': fingerprint, 'files': self.files, 'families': self.families}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path) or '.')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            logger.warning('Could not write font index to %s', index_path, exc_info=True)
+
+    def _scan(self, dirs):
+        files = {}
+        families = {}
+        for root in dirs:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in sorted(filenames):
+                    if not filename.lower().endswith(FONT_EXTENSIONS):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    # Earlier directories (the bundled folder first) win on name clashes
+                    files.setdefault(filename.lower(), path)
+                    try:
+                        family, style = ImageFont.truetype(path, 12).getname()
+                    except OSError:
+                        continue
+                    if not family:
+                        continue
+                    key = family.lower()
+                    is_regular = (style or '').lower() in REGULAR_STYLES
+                    if key not in families or (is_regular and not families[key][1]):
+                        families[key] = (path, is_regular)
+        self.files = files
+        self.families = {family: path for family, (path, _) in families.items()}
+
+    def resolve(self, font_name):
+        """
+        Returns the path for a family name, alias or filename, or None if nothing matches. A
+        missing name means DEFAULT_FAMILY.
+        """
+        if not self._loaded:
+            self.load()
+        font_name = font_name or DEFAULT_FAMILY
+        try:
+            return self._resolved[font_name]
+        except KeyError:
+            pass
+
+        path = self.families.get(font_name.lower())
+        if path is None:
+            for filename in FONT_MAP.get(font_name, [f'{font_name}.ttf']):
+                path = self.files.get(filename.lower())
+                if path is not None:
+                    break
+        # Only hits are remembered: names come from requests, so misses are unbounded
+        if path is not None:
+            self._resolved[font_name] = path
+        return path
+
+
+registry = FontRegistry()
@@ -0,0 +1,169 @@
+"""
+Pre-rendered favicon gallery.
+
+Every GalleryItem is rendered once, by ``manage.py prerender_gallery`` or on its first
+download, into a ZIP and a preview PNG. Both are kept in the default storage under
+``gallery/<digest[:2]>/<digest>.<ext>``: identical renders share one file, a stored file
+never changes, and its digest doubles as the download's ETag.
+"""
+import hashlib
+import io
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image
+
+from . import cache, executor, utils
+from .models import GalleryItem
+
+GALLERY_DIR = 'gallery'
+
+# Bundle member stored alongside the ZIP as the item's thumbnail, when the profile has it
+PREVIEW_MEMBER = 'favicon-96x96.png'
+
+
+def content_name(digest, ext):
+    return f'{GALLERY_DIR}/{digest[:2]}/{digest}.{ext}'
+
+
+def store_blob(data, ext):
+    """
+    Saves ``data`` under its SHA-256 and returns (name, digest). Content already stored is
+    not written again.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    name = content_name(digest, ext)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(data))
+        if saved != name:
+            # Another process stored the same content first; ours is a duplicate
+            default_storage.delete(saved)
+    return name, digest
+
+
+def source_path(item):
+    """
+    Filesystem path of an image item's static source.
+    """
+    path = finders.find(item.source)
+    if path is None:
+        raise FileNotFoundError(f'Gallery source {item.source!r} was not found in the static files.')
+    return path
+
+
+def source_digest(item):
+    """
+    Digest of everything the item's render depends on, including RENDERER_VERSION.
+    """
+    if item.kind == GalleryItem.KIND_IMAGE:
+        return cache.make_key('gallery-image', version=utils.RENDERER_VERSION,
+                              digest=cache.file_digest(source_path(item)))
+    return utils.text_cache_key(utils.normalize_text_params(**item.params))
+
+
+def render_bundle(item):
+    """
+    Renders the item's favicon bundle and returns the ZIP bytes.
+    """
+    if item.kind == GalleryItem.KIND_IMAGE:
+        with open(source_path(item), 'rb') as f:
+            return b''.join(utils._render_favicon_from_image(f))
+    params = utils.normalize_text_params(**item.params)
+    return b''.join(utils._render_favicon_from_text(**params))
+
+
+def prerender_item(item, force=False):
+    """
+    Renders and stores the item's bundle and preview unless the stored ones were built from
+    the same source. Returns True if it rendered.
+    """
+    digest = _stale_digest(item, force)
+    if digest is None:
+        return False
+    _store_render(item, digest, render_bundle(item))
+    return True
+
+
+async def aprerender_item(item, force=False):
+    """
+    Async counterpart of prerender_item: the render runs on the render executor, hashing and
+    storage on worker threads.
+    """
+    digest = await sync_to_async(_stale_digest, thread_sensitive=False)(item, force)
+    if digest is None:
+        return False
+    data = await executor.arun(render_bundle, item)
+    # Thread-sensitive, as it saves the item
+    await sync_to_async(_store_render)(item, digest, data)
+    return True
+
+
+def _stale_digest(item, force):
+    """
+    The item's source digest if it needs rendering, or None if its stored render is current.
+    """
+    digest = source_digest(item)
+    if (not force and item.is_rendered and item.source_digest == digest
+            and default_storage.exists(item.bundle.name)):
+        return None
+    return digest
+
+
+def preview_bytes(data):
+    """
+    The thumbnail from a bundle's ZIP bytes: PREVIEW_MEMBER, or the largest PNG in profiles
+    without it.
+    """
+    bundle = zipfile.ZipFile(io.BytesIO(data))
+    names = bundle.namelist()
+    if PREVIEW_MEMBER in names:
+        return bundle.read(PREVIEW_MEMBER)
+    largest, largest_area = None, -1
+    for name in names:
+        if not name.endswith('.png'):
+            continue
+        png = bundle.read(name)
+        # Only the header is parsed
+        width, height = Image.open(io.BytesIO(png)).size
+        if width * height > largest_area:
+            largest, largest_area = png, width * height
+    if largest is None:
+        raise ValueError('The bundle has no PNG to preview.')
+    return largest
+
+
+def _store_render(item, digest, data):
+    item.bundle.name, item.bundle_digest = store_blob(data, 'zip')
+    item.bundle_size = len(data)
+    preview = preview_bytes(data)
+    item.preview.name, item.preview_digest = store_blob(preview, 'png')
+    item.source_digest = digest
+    item.rendered_at = timezone.now()
+    item.save(update_fields=['bundle', 'bundle_digest', 'bundle_size', 'preview', 'preview_digest',
+                             'source_digest', 'rendered_at'])
+
+
+def prune_blobs():
+    """
+    Deletes stored blobs no gallery item refers to any more. Returns the number deleted.
+    """
+    referenced = set()
+    for bundle, preview in GalleryItem.objects.values_list('bundle', 'preview'):
+        referenced.update((bundle, preview))
+
+    deleted = 0
+    if not default_storage.exists(GALLERY_DIR):
+        return deleted
+    shards, _ = default_storage.listdir(GALLERY_DIR)
+    for shard in shards:
+        _, filenames = default_storage.listdir(f'{GALLERY_DIR}/{shard}')
+        for filename in filenames:
+            name = f'{GALLERY_DIR}/{shard}/{filename}'
+            if name not in referenced:
+                default_storage.delete(name)
+                deleted += 1
+    return deleted
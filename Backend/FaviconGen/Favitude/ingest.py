@@ -0,0 +1,122 @@
+"""
+Guarded decoding of uploaded images.
+
+Favicons never exceed 256px, so an upload only needs to be decoded to about twice that.
+open_upload reads the header first and rejects oversized or over-budget images before any
+pixel data is decoded, uses JPEG draft mode and Image.reduce to land near the target size,
+and picks the best frame of multi-frame input.
+
+Limits come from ``settings.FAVITUDE_UPLOAD_LIMITS``:
+
+    FAVITUDE_UPLOAD_LIMITS = {
+        'MAX_PIXELS': 40_000_000,           # width * height of the chosen frame
+        'MAX_DECODE_BYTES': 256 * 2 ** 20,  # memory the decoded frame may occupy
+        'MAX_FRAMES': 64,                   # frames inspected in animated/multi-page files
+        'TIME_BUDGET': 10,                  # seconds for the whole ingestion
+        'MAX_UPLOAD_BYTES': 20 * 2 ** 20,   # encoded size, enforced while streaming (uploads.py)
+    }
+"""
+import time
+
+from django.conf import settings
+from PIL import Image
+
+DEFAULT_LIMITS = {
+    'MAX_PIXELS': 40_000_000,
+    'MAX_DECODE_BYTES': 256 * 2 ** 20,
+    'MAX_FRAMES': 64,
+    'TIME_BUDGET': 10,
+    'MAX_UPLOAD_BYTES': 20 * 2 ** 20,
+}
+
+# Bytes per pixel of the decoded frame for each Pillow mode; unknown modes assume 4
+_MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'La': 2, 'I;16': 2, 'RGB': 4, 'RGBA': 4, 'CMYK': 4, 'YCbCr': 4, 'I': 4, 'F': 4}
+
+
+class ImageRejected(ValueError):
+    """
+    Raised for uploads that are not images or exceed the configured limits.
+    """
+
+
+def get_limits():
+    return {**DEFAULT_LIMITS, **getattr(settings, 'FAVITUDE_UPLOAD_LIMITS', {})}
+
+
+class _Deadline:
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def check(self, stage):
+        if time.monotonic() > self.expires_at:
+            raise ImageRejected(f'Image took too long to process ({stage}).')
+
+
+# Multi-frame formats whose frames can differ in size. Animated GIF/WebP/PNG frames all share
+# one canvas (and seeking them means decoding them), so their first frame is used as is.
+_MULTI_SIZE_FORMATS = {'TIFF'}
+
+
+def _pick_frame(img, limits, deadline):
+    """
+    Seeks to the largest page of a multi-page image. At most MAX_FRAMES pages are inspected.
+    """
+    if img.format not in _MULTI_SIZE_FORMATS or not getattr(img, 'is_animated', False):
+        return
+    best_index, best_area = 0, -1
+    for index in range(limits['MAX_FRAMES']):
+        try:
+            img.seek(index)
+        except EOFError:
+            break
+        area = img.width * img.height
+        if area > best_area:
+            best_index, best_area = index, area
+        deadline.check('scanning frames')
+    img.seek(best_index)
+
+
+def open_upload(image_file, target_size):
+    """
+    Returns the upload decoded to roughly 2x ``target_size`` (width, height), or raises
+    ImageRejected. The returned image may still be larger than that for formats that can
+    only be decoded at full size; build_resize_pyramid finishes the job.
+    """
+    limits = get_limits()
+    deadline = _Deadline(limits['TIME_BUDGET'])
+    try:
+        # Image.open only parses the header; pixel data is decoded by load(). Uploads sniffed
+        # by the upload handler skip probing every other format's plugin.
+        image_format = getattr(image_file, 'image_format', None)
+        img = Image.open(image_file, formats=[image_format] if image_format else None)
+        _pick_frame(img, limits, deadline)
+
+        pixels = img.width * img.height
+        if pixels > limits['MAX_PIXELS']:
+            raise ImageRejected(
+                f'Image is {img.width}x{img.height}; the limit is {limits["MAX_PIXELS"]:,} pixels.'
+            )
+
+        # JPEG can be decoded directly at 1/2, 1/4 or 1/8 scale
+        img.draft(None, (target_size[0] * 2, target_size[1] * 2))
+        decoded_bytes = img.width * img.height * _MODE_BYTES.get(img.mode, 4)
+        if decoded_bytes > limits['MAX_DECODE_BYTES']:
+            raise ImageRejected('Image is too large to decode within the memory budget.')
+
+        img.load()
+        deadline.check('decoding')
+
+        factor = min(img.width // (target_size[0] * 2), img.height // (target_size[1] * 2))
+        if factor >= 2:
+            img = img.reduce(factor)
+        return img
+    except ImageRejected:
+        raise
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(str(e))
+    except Image.UnidentifiedImageError:
+        raise ImageRejected('The uploaded file is not a supported image.')
+    except (OSError, SyntaxError):
+        # Truncated or corrupt files surface as either
+        raise ImageRejected('The uploaded image is damaged or incomplete.')
@@ -0,0 +1,248 @@
+"""
+Per-stage timing of favicon renders.
+
+The render path is wrapped in named spans (decode, resize, font, autofit, rasterize, svg,
+encode_png, encode_ico, zip, cache, render)::
+
+    with instrument.span('decode'):
+        img = ingest.open_upload(...)
+
+Spans opened while a request is being handled are collected for that request; the
+ServerTimingMiddleware reports them in a ``Server-Timing`` header and adds them to this
+process's per-stage histograms, which the stats endpoint serves. Spans outside a request (job
+workers, or ZIP entries encoded while a streamed response is being sent) go straight to the
+histograms. Stages can nest: ``zip`` includes the encodes each entry triggers, and ``render``
+is the wall time of an executor job, queueing included.
+
+Configured through ``settings.FAVITUDE_INSTRUMENTATION``:
+
+    FAVITUDE_INSTRUMENTATION = {
+        'ENABLED': True,          # False makes span() return a shared no-op
+        'SERVER_TIMING': True,    # send the Server-Timing header
+        'SLOW_REQUEST_MS': 1000,  # log the stages of requests slower than this (0: never)
+    }
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_CONFIG = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+# Upper bounds (ms) of the histogram buckets; one more bucket holds everything slower
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_config = None
+
+# The span list of the request being handled in this context, if any
+_collector = contextvars.ContextVar('favitude_spans', default=None)
+
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = {**DEFAULT_CONFIG, **getattr(settings, 'FAVITUDE_INSTRUMENTATION', {})}
+    return _config
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    global _config
+    if setting == 'FAVITUDE_INSTRUMENTATION':
+        _config = None
+
+
+def is_enabled():
+    return get_config()['ENABLED']
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram of one stage.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the ``q`` quantile (the observed maximum for the
+        overflow bucket).
+        """
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.quantile(0.5),
+            'p90_ms': self.quantile(0.9),
+            'p99_ms': self.quantile(0.99),
+            'buckets': {
+                **{f'le_{bound}': count for bound, count in zip(BUCKETS_MS, self.counts)},
+                'inf': self.counts[-1],
+            },
+        }
+
+
+class StageStats:
+    """
+    Process-wide histograms, one per stage.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, spans):
+        with self._lock:
+            for name, seconds in spans:
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = Histogram()
+                histogram.add(seconds * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.as_dict() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started_at = time.time()
+
+
+stats = StageStats()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _add(self.name, time.perf_counter() - self.start)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name):
+    """
+    Context manager timing the stage ``name``. Costs one settings lookup when disabled.
+    """
+    if not get_config()['ENABLED']:
+        return _NOOP
+    return _Span(name)
+
+
+def _add(name, seconds):
+    spans = _collector.get()
+    if spans is not None:
+        spans.append((name, seconds))
+    else:
+        stats.record([(name, seconds)])
+
+
+def start_collecting():
+    """
+    Collects the spans of this context (a request) until stop_collecting(token).
+    """
+    return _collector.set([])
+
+
+def stop_collecting(token):
+    """
+    Stops collecting and returns the collected (name, seconds) spans.
+    """
+    spans = _collector.get()
+    _collector.reset(token)
+    return spans or []
+
+
+def collect(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) and returns (result, spans). Executor jobs go through this so
+    spans recorded in a worker thread or process reach the request that submitted them.
+    """
+    token = start_collecting()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        spans = stop_collecting(token)
+    return result, spans
+
+
+def replay(spans):
+    """
+    Adds spans returned by collect() to the current request, or to the histograms.
+    """
+    current = _collector.get()
+    if current is not None:
+        current.extend(spans)
+    else:
+        stats.record(spans)
+
+
+def summarize(spans):
+    """
+    Total seconds and count per stage, in first-seen order.
+    """
+    totals = {}
+    for name, seconds in spans:
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + seconds, count + 1)
+    return totals
+
+
+def server_timing(spans, total=None):
+    """
+    The Server-Timing header value for a request's spans.
+    """
+    metrics = [
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else '')
+        for name, (seconds, count) in summarize(spans).items()
+    ]
+    if total is not None:
+        metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
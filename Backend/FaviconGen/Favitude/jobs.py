@@ -0,0 +1,88 @@
+"""
+Database-backed queue for favicon renders.
+
+The API inserts ``generateImage`` rows in the queued state and returns immediately;
+``manage.py run_favicon_worker`` claims them one at a time, renders them and stores the
+finished ZIP, so no external broker is needed.
+"""
+import logging
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from . import utils
+from .models import generateImage
+
+logger = logging.getLogger(__name__)
+
+TEXT_PARAM_NAMES = ('text', 'font_size', 'bg_shape', 'font_color', 'bg_color', 'font_type', 'profile', 'sizes')
+
+
+def enqueue_text_job(owner, params):
+    """
+    Queues a text render. ``params`` uses the keyword names of generate_favicon_from_text.
+    """
+    params = {name: params.get(name) for name in TEXT_PARAM_NAMES}
+    return generateImage.objects.create(owner=owner, kind=generateImage.KIND_TEXT, params=params)
+
+
+def enqueue_image_job(owner, image, profile=None, sizes=None):
+    """
+    Queues an image render, storing the upload so the worker can read it later.
+    """
+    params = {'profile': profile, 'sizes': list(sizes or [])}
+    return generateImage.objects.create(owner=owner, kind=generateImage.KIND_IMAGE, image_field=image, params=params)
+
+
+def claim_next_job():
+    """
+    Atomically moves the oldest queued job to running and returns it, or None if the queue is empty.
+    The conditional UPDATE means concurrent workers never claim the same row.
+    """
+    queued = generateImage.objects.filter(status=generateImage.STATUS_QUEUED)
+    for pk in queued.values_list('pk', flat=True)[:10]:
+        claimed = generateImage.objects.filter(pk=pk, status=generateImage.STATUS_QUEUED).update(
+            status=generateImage.STATUS_RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return generateImage.objects.get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs(older_than):
+    """
+    Puts jobs that have been running longer than ``older_than`` (a timedelta) back in the
+    queue, recovering work from a worker that died mid-render. Returns the number requeued.
+    """
+    cutoff = timezone.now() - older_than
+    return generateImage.objects.filter(status=generateImage.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=generateImage.STATUS_QUEUED, started_at=None
+    )
+
+
+def render_job(job):
+    """
+    Returns the ZIP bytes for a job.
+    """
+    if job.kind == generateImage.KIND_TEXT:
+        return b''.join(utils.stream_favicon_from_text(**job.params))
+    with job.image_field.open('rb') as image:
+        return b''.join(utils.stream_favicon_from_image(image, **job.params))
+
+
+def run_job(job):
+    """
+    Renders a claimed job and records its result or error.
+    """
+    try:
+        data = render_job(job)
+    except Exception as e:
+        logger.exception('Favicon job %s failed', job.job_id)
+        job.status = generateImage.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.result.save(f'{job.job_id}.zip', ContentFile(data), save=False)
+        job.status = generateImage.STATUS_SUCCEEDED
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return job
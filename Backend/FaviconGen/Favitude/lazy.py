@@ -0,0 +1,46 @@
+"""
+Deferred imports for URLconfs, so a cold-started worker only loads what its first request
+needs. Django imports the root URLconf, and every view and include() in it, on the first
+request whatever its path; these helpers put the import off until a matching request:
+
+    path('api/jobs/', lazy_view('Favitude.api.JobListView', csrf_exempt=True)),
+    path('accounts/', lazy_include('allauth.urls')),
+
+DRF and simplejwt load with the API module, and allauth's account views and forms with its
+URLconf. (allauth's social providers are not deferred: SocialAccountConfig.ready() imports
+every installed provider, and ``requests`` with them.)
+"""
+import functools
+
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path, csrf_exempt=False, **initkwargs):
+    """
+    A view that imports ``dotted_path``, a view function or class-based view (given
+    ``initkwargs`` for as_view()), when it first handles a request. CsrfViewMiddleware reads
+    ``csrf_exempt`` before the view is imported, so views that are exempt (every DRF view)
+    must say so here.
+    """
+    @functools.lru_cache(maxsize=None)
+    def load():
+        target = import_string(dotted_path)
+        return target.as_view(**initkwargs) if isinstance(target, type) else target
+
+    def view(request, *args, **kwargs):
+        return load()(request, *args, **kwargs)
+
+    view.__name__ = view.__qualname__ = dotted_path.rsplit('.', 1)[-1]
+    view.__module__ = dotted_path.rsplit('.', 1)[0]
+    view.csrf_exempt = csrf_exempt
+    return view
+
+
+def lazy_include(module_name, namespace=None):
+    """
+    Like include() of a dotted module path, except that the URLconf is imported when a URL
+    under it is first resolved or reversed rather than with the including URLconf. Only for
+    URLconfs that declare no ``app_name``, as include() would read it straight away.
+    """
+    # URLResolver imports a URLconf given by name on first use
+    return module_name, None, namespace
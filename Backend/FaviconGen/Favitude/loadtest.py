@@ -0,0 +1,263 @@
+"""
+HTTP load generator for a running Favitude server (``manage.py loadtest``).
+
+Virtual users sign up through signup_page (or, if the account exists from an earlier run,
+log in through login_page, which authenticates by email), then share a pool of asyncio
+workers that drive a weighted mix of:
+
+    text      POST gen_from_text/ and follow the redirect to the rendered ZIP
+    image     POST imageGen/ with one of the fixture uploads
+    download  GET a gallery bundle from download/collection/<slug>/
+
+``UNIQUE_RATIO`` of text and image requests carry content no earlier request had, so the
+render caches see a realistic mix of hits and misses. Any response that is not the expected
+ZIP counts as an error; 503s from a full render queue are counted separately as ``busy``.
+Form posts take their CSRF token from the cookie set at sign-in, so only the requests
+themselves are timed.
+
+Requires httpx, which is only needed here.
+"""
+import asyncio
+import io
+import random
+import re
+import time
+import uuid
+
+from PIL import Image
+
+from . import benchmarks
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_MIX = {'text': 5, 'image': 2, 'download': 3}
+
+# The slugs seeded by the gallery migration
+DEFAULT_GALLERY_SLUGS = ['frame1', 'frame2', 'frame3', 'frame5', 'check', 'convert']
+
+TEXTS = ['Fa', 'Hi', 'Go', 'Zx', 'Ok', 'W']
+SHAPES = ['square', 'rounded_square', 'circle', 'triangular']
+COLORS = ['#ffffff', '#3264c8', '#c81e1e', '#ffc800', '#000000']
+
+# (format, side) of the image uploads
+IMAGE_FIXTURES = [('PNG', 256), ('PNG', 1024), ('JPEG', 2048)]
+
+PASSWORD = 'loadtest-Pa55word'
+
+_CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+# Django accepts the cookie's secret as the form token, so a signed-in client needs no page
+# load before each timed POST
+CSRF_COOKIE = 'csrftoken'
+
+
+class LoadTestError(Exception):
+    """
+    Raised when the harness cannot set itself up against the target server.
+    """
+
+
+def parse_mix(value):
+    """
+    {'text': 5, ...} from "text=5,image=2,download=3".
+    """
+    mix = {}
+    for part in filter(None, value.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown request kind {name!r}; expected one of {", ".join(DEFAULT_MIX)}.')
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('The request mix needs at least one positive weight.')
+    return mix
+
+
+def make_image_fixtures():
+    """
+    Encoded uploads standing in for user logos, keyed by a label.
+    """
+    return {f'{fmt.lower()}-{side}': (fmt, benchmarks.make_source_image(side, fmt)) for fmt, side in IMAGE_FIXTURES}
+
+
+def _unique_image(fmt, side):
+    # A flat random colour: cheap to encode, and never seen by the upload cache before
+    buf = io.BytesIO()
+    Image.new('RGB', (side, side), tuple(random.randrange(256) for _ in range(3))).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class Results:
+    """
+    Latencies and outcomes per request kind.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.busy = {}
+        self.statuses = {}
+        self.started = self.finished = None
+
+    def add(self, kind, seconds, outcome):
+        if outcome == 'ok':
+            self.latencies.setdefault(kind, []).append(seconds)
+        elif outcome == 'busy':
+            self.busy[kind] = self.busy.get(kind, 0) + 1
+        else:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            self.statuses[outcome] = self.statuses.get(outcome, 0) + 1
+
+    def summary(self):
+        elapsed = self.finished - self.started
+        kinds = sorted(set(self.latencies) | set(self.errors) | set(self.busy))
+        report = {'duration_s': round(elapsed, 3), 'kinds': {}, 'error_statuses': self.statuses}
+        for kind in kinds + ['all']:
+            if kind == 'all':
+                latencies = [t for values in self.latencies.values() for t in values]
+                errors, busy = sum(self.errors.values()), sum(self.busy.values())
+            else:
+                latencies = self.latencies.get(kind, [])
+                errors, busy = self.errors.get(kind, 0), self.busy.get(kind, 0)
+            total = len(latencies) + errors + busy
+            entry = {
+                'requests': total,
+                'ok': len(latencies),
+                'errors': errors,
+                'busy': busy,
+                'error_rate': round((errors + busy) / total, 4) if total else 0.0,
+                'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            }
+            if latencies:
+                ms = [t * 1000 for t in latencies]
+                entry.update({
+                    'p50_ms': round(benchmarks.percentile(ms, 50), 1),
+                    'p90_ms': round(benchmarks.percentile(ms, 90), 1),
+                    'p99_ms': round(benchmarks.percentile(ms, 99), 1),
+                    'max_ms': round(max(ms), 1),
+                })
+            report['kinds'][kind] = entry
+        return report
+
+
+class LoadTest:
+
+    def __init__(self, base_url, users=4, concurrency=8, duration=30, requests=None, mix=None,
+                 unique_ratio=0.2, gallery_slugs=None, user_prefix='loadtest', timeout=60):
+        if httpx is None:
+            raise LoadTestError('The load test needs httpx: pip install httpx')
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.mix = mix or DEFAULT_MIX
+        self.unique_ratio = unique_ratio
+        self.gallery_slugs = gallery_slugs or DEFAULT_GALLERY_SLUGS
+        self.user_prefix = user_prefix
+        self.timeout = timeout
+        self.fixtures = make_image_fixtures()
+        self.results = Results()
+        self._issued = 0
+
+    def _client(self):
+        return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, follow_redirects=True)
+
+    async def _csrf(self, client, path):
+        token = client.cookies.get(CSRF_COOKIE)
+        if token is not None:
+            return token
+        response = await client.get(path)
+        match = _CSRF_RE.search(response.text)
+        if match is None:
+            raise LoadTestError(f'No CSRF token on {path} ({response.status_code}).')
+        return match.group(1)
+
+    async def _form_post(self, client, path, data, files=None):
+        data = {'csrfmiddlewaretoken': await self._csrf(client, path), **data}
+        return await client.post(path, data=data, files=files, headers={'Referer': self.base_url + path})
+
+    async def sign_in(self, index):
+        """
+        A client logged in as virtual user ``index``, created through the signup form if needed.
+        """
+        client = self._client()
+        username = f'{self.user_prefix}{index}'
+        email = f'{username}@loadtest.invalid'
+        response = await self._form_post(client, '/signup/', {'username': username, 'email': email, 'password': PASSWORD})
+        if response.url.path.rstrip('/') != '/home':
+            # Already registered by an earlier run
+            response = await self._form_post(client, '/login/', {'username': email, 'password': PASSWORD})
+        if response.url.path.rstrip('/') != '/home':
+            await client.aclose()
+            raise LoadTestError(f'Could not sign up or log in as {email} ({response.status_code} at {response.url.path}).')
+        return client
+
+    def _unique(self):
+        return random.random() < self.unique_ratio
+
+    async def text(self, client):
+        data = {
+            'text': uuid.uuid4().hex[:2] if self._unique() else random.choice(TEXTS),
+            'fsize': random.choice(['', '160']),
+            'Background': random.choice(SHAPES),
+            'fcolor': random.choice(COLORS),
+            'bcolor': random.choice(COLORS),
+            'ftype': 'Roboto',
+        }
+        return await self._form_post(client, '/gen_from_text/', data)
+
+    async def image(self, client):
+        if self._unique():
+            fmt, side = random.choice(IMAGE_FIXTURES)
+            label, data = f'unique-{side}', _unique_image(fmt, side)
+        else:
+            label, (fmt, data) = random.choice(list(self.fixtures.items()))
+        files = {'image': (f'{label}.{fmt.lower()}', data, f'image/{fmt.lower()}')}
+        return await self._form_post(client, '/imageGen/', {'profile': 'classic'}, files=files)
+
+    async def download(self, client):
+        return await client.get(f'/download/collection/{random.choice(self.gallery_slugs)}/')
+
+    def _next_kind(self):
+        kinds, weights = zip(*self.mix.items())
+        return random.choices(kinds, weights)[0]
+
+    def _more(self, deadline):
+        if self.requests is not None:
+            if self._issued >= self.requests:
+                return False
+            self._issued += 1
+            return True
+        return time.perf_counter() < deadline
+
+    async def _worker(self, client, deadline):
+        while self._more(deadline):
+            kind = self._next_kind()
+            start = time.perf_counter()
+            try:
+                response = await getattr(self, kind)(client)
+                await response.aread()
+                if response.status_code == 503:
+                    outcome = 'busy'
+                elif response.status_code == 200 and response.headers.get('content-type', '').startswith('application/zip'):
+                    outcome = 'ok'
+                else:
+                    outcome = str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            self.results.add(kind, time.perf_counter() - start, outcome)
+
+    async def run(self):
+        clients = await asyncio.gather(*(self.sign_in(index) for index in range(self.users)))
+        try:
+            self.results.started = time.perf_counter()
+            deadline = self.results.started + self.duration
+            await asyncio.gather(*(
+                self._worker(clients[index % len(clients)], deadline) for index in range(self.concurrency)
+            ))
+            self.results.finished = time.perf_counter()
+        finally:
+            await asyncio.gather(*(client.aclose() for client in clients))
+        return self.results.summary()
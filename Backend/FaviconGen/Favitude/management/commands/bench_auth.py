@@ -0,0 +1,104 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from Favitude.backends import users_by_username_or_email
+
+PASSWORD = 'bench-Pa55word'
+
+# The backends before they were consolidated into Favitude.backends.EmailBackend
+LEGACY_BACKENDS = [
+    'Favitude.management.commands.bench_auth.LegacyEmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+    'allauth.account.auth_backends.AuthenticationBackend',
+]
+
+
+class LegacyEmailBackend(ModelBackend):
+    """
+    The former EmailBackend: an exact, unindexed email lookup, then the password check.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        try:
+            user = UserModel.objects.get(email=username)
+        except (UserModel.DoesNotExist, UserModel.MultipleObjectsReturned):
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+def _legacy_signup_check(username, email):
+    User = get_user_model()
+    return User.objects.filter(username=username).exists() or User.objects.filter(email=email).exists()
+
+
+def _signup_check(username, email):
+    return list(users_by_username_or_email(username=username, email=email).values_list('username', flat=True))
+
+
+class Command(BaseCommand):
+    help = ('Measures login and signup lookups against a large user table, comparing the '
+            'consolidated backend with the former three-backend chain')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--prefix', default='benchauth')
+        parser.add_argument('--keep', action='store_true', help='Leave the generated users in place')
+
+    def handle(self, *args, **options):
+        prefix, count = options['prefix'], options['users']
+        User = get_user_model()
+        existing = User.objects.filter(username__startswith=prefix).count()
+        if existing < count:
+            self.stdout.write(f'Creating {count - existing} users...')
+            # One hash shared by every account; hashing each would take hours at default cost
+            password = make_password(PASSWORD)
+            User.objects.bulk_create(
+                (User(username=f'{prefix}{i}', email=f'{prefix}{i}@Example.com', password=password)
+                 for i in range(existing, count)),
+                batch_size=5000,
+            )
+
+        middle = count // 2
+        login_cases = {
+            'login email': (f'{prefix}{middle}@example.com', PASSWORD),
+            'login username': (f'{prefix}{middle}', PASSWORD),
+            'login wrong password': (f'{prefix}{middle}@example.com', 'wrong'),
+            'login unknown': (f'nobody-{prefix}@example.com', PASSWORD),
+        }
+        signup_args = (f'new-{prefix}', f'{prefix}{middle}@example.com')
+
+        self.stdout.write(f"{'case':<24}{'backends':<14}{'best ms':>9}{'queries':>9}{'hashes':>8}")
+        try:
+            for name, (login, password) in login_cases.items():
+                for label, backends in (('legacy', LEGACY_BACKENDS), ('consolidated', None)):
+                    with override_settings(**({'AUTHENTICATION_BACKENDS': backends} if backends else {})):
+                        self._report(options['repeat'], name, label, authenticate, None, username=login, password=password)
+            for label, check in (('legacy', _legacy_signup_check), ('consolidated', _signup_check)):
+                self._report(options['repeat'], 'signup check', label, check, *signup_args)
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=prefix).delete()
+
+    def _report(self, repeat, name, label, fn, *args, **kwargs):
+        timings = []
+        for _ in range(repeat):
+            # A password check, or the dummy hash a backend runs when nobody matches
+            with mock.patch('django.contrib.auth.base_user.check_password', side_effect=check_password) as checks, \
+                    mock.patch('django.contrib.auth.base_user.make_password', side_effect=make_password) as dummies, \
+                    CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                fn(*args, **kwargs)
+                timings.append(time.perf_counter() - start)
+        hashes = checks.call_count + dummies.call_count
+        self.stdout.write(f"{name:<24}{label:<14}{min(timings) * 1000:>9.1f}{len(queries):>9}{hashes:>8}")
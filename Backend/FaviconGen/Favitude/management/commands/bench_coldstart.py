@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import benchmarks, coldstart, utils
+from Favitude.views import text_render_url
+
+
+def _render_path(run):
+    # A new logo each run, so no render cache a deployment shares across workers can answer it
+    return text_render_url(utils.normalize_text_params(f'Cold {run}', '', 'circle', '#ffffff', '#1e3a8a'))
+
+
+CASES = {
+    'about': lambda run: '/about/',
+    'home': lambda run: '/',
+    'render': _render_path,
+    'api': lambda run: '/api/jobs/',
+}
+
+# FAVITUDE_EAGER_WARMUP for each start-up mode
+MODES = {
+    'lazy': '0',
+    'eager': '1',
+}
+
+
+class Command(BaseCommand):
+    help = ('Measures time to first response: each run starts the project in a fresh interpreter '
+            'and sends one path twice, reporting start-up, the first (cold) and the second (warm) '
+            'request, with the font and mask warm-up deferred and eager')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Fresh processes per case and mode')
+        parser.add_argument('--case', action='append', choices=sorted(CASES),
+                            help='Only run this case (repeatable); all by default')
+        parser.add_argument('--mode', action='append', choices=sorted(MODES),
+                            help='Only start up this way (repeatable); both by default')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        cases = options['case'] or list(CASES)
+        modes = options['mode'] or list(MODES)
+        results = {}
+        self.stdout.write(f"{'case':<8}{'mode':<7}{'process ms':>12}{'start-up ms':>13}{'first ms':>10}"
+                          f"{'warm ms':>9}{'status':>8}  loaded by the first request")
+        for case in cases:
+            for mode in modes:
+                runs = []
+                for run in range(options['repeat']):
+                    path = CASES[case](run)
+                    try:
+                        report, _ = coldstart.run([path, path], env={'FAVITUDE_EAGER_WARMUP': MODES[mode]})
+                    except coldstart.ColdStartError as e:
+                        raise CommandError(str(e))
+                    runs.append(report)
+
+                first, warm = zip(*((r['requests'][0], r['requests'][1]) for r in runs))
+                loaded = [name for name in runs[-1]['loaded_after_requests'] if name not in runs[-1]['loaded_at_startup']]
+                result = {
+                    'process_ms': [r['wall_ms'] for r in runs],
+                    'startup_ms': [r['startup_ms'] for r in runs],
+                    'first_ms': [request['ms'] for request in first],
+                    'warm_ms': [request['ms'] for request in warm],
+                    'status': first[-1]['status'],
+                    'loaded_at_startup': runs[-1]['loaded_at_startup'],
+                    'loaded_by_requests': loaded,
+                }
+                results[f'{case}/{mode}'] = result
+                self.stdout.write(
+                    f"{case:<8}{mode:<7}{benchmarks.percentile(result['process_ms'], 50):>12.0f}"
+                    f"{benchmarks.percentile(result['startup_ms'], 50):>13.0f}"
+                    f"{benchmarks.percentile(result['first_ms'], 50):>10.0f}"
+                    f"{benchmarks.percentile(result['warm_ms'], 50):>9.1f}{result['status']:>8}  {', '.join(loaded) or '-'}"
+                )
+        self.stdout.write('Medians of the runs; "warm" is the same request again in the same process')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
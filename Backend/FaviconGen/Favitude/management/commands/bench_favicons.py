@@ -0,0 +1,165 @@
+import datetime
+import functools
+import json
+import os
+import platform
+import warnings
+
+import PIL
+from PIL import Image
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import benchmarks, ingest, utils
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TEXT_SHAPES = utils.BG_SHAPES
+TEXT_FONTS = ['Roboto', 'Times New Roman', 'Rockwell']
+# 0 makes the renderer search for the largest size that fits
+TEXT_FONT_SIZES = {'auto': 0, 'fixed': 160}
+
+# (label, format, side); 12000px exceeds the default MAX_PIXELS, so that case times the rejection
+IMAGE_SOURCES = [
+    ('png-512', 'PNG', 512),
+    ('png-2048', 'PNG', 2048),
+    ('jpeg-2048', 'JPEG', 2048),
+    ('gif-anim-1024', 'GIF', 1024),
+    ('png-6000', 'PNG', 6000),
+    ('jpeg-6000', 'JPEG', 6000),
+    ('png-12000', 'PNG', 12000),
+]
+GIF_FRAMES = 8
+
+# A case regresses when a metric grows by more than its threshold (a fraction) and by more
+# than its floor, so a small wobble on a fast case does not fail the run. Latency is gated on
+# the median in calibration units (see benchmarks.measure): milliseconds drift with the
+# machine's speed by up to 2x between runs on shared hardware, so they are reported only.
+DEFAULT_THRESHOLDS = {'p50_relative': 0.2, 'peak_rss_kb': 0.15, 'output_bytes': 0.02}
+NOISE_FLOORS = {'p50_relative': 0.1, 'peak_rss_kb': 2048, 'output_bytes': 0}
+# Fewer runs than this (on either side) make the median too noisy to gate on
+MIN_GATE_REPEAT = 10
+
+
+def _render_text(text, font_size, bg_shape, font_color, bg_color, font_type):
+    """
+    What generate_favicon_from_text does on a render-cache miss, minus the executor hand-off.
+    """
+    params = utils.normalize_text_params(text, font_size, bg_shape, font_color, bg_color, font_type)
+    return utils._bundle_bytes(functools.partial(utils._render_favicon_from_text, **params))
+
+
+def _render_image(data):
+    """
+    What generate_favicon_from_image does on an upload-cache miss. Rejected uploads produce
+    no bytes.
+    """
+    with warnings.catch_warnings():
+        # The oversized case is meant to trip Pillow's bomb check; ingest rejects it right after
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        try:
+            return utils._bundle_bytes(functools.partial(utils._render_favicon_from_image, data))
+        except ingest.ImageRejected:
+            return b''
+
+
+def _make_source(fmt, side):
+    if fmt == 'GIF':
+        return benchmarks.make_animated_gif(side, GIF_FRAMES)
+    return benchmarks.make_source_image(side, fmt)
+
+
+def text_cases():
+    for shape in TEXT_SHAPES:
+        for sizing, font_size in TEXT_FONT_SIZES.items():
+            yield f'text/{shape}/{sizing}/Roboto', (_render_text, 'Fa', font_size, shape, '#ffffff', '#3264c8', 'Roboto')
+    for font in TEXT_FONTS[1:]:
+        yield f'text/square/auto/{font}', (_render_text, 'Fa', 0, 'square', '#ffffff', '#3264c8', font)
+
+
+def image_cases():
+    for label, fmt, side in IMAGE_SOURCES:
+        # Sources are built lazily; the large ones take a while to encode
+        yield f'image/{label}', (_render_image, functools.partial(_make_source, fmt, side))
+
+
+def environment():
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'numpy': numpy.__version__ if numpy is not None else None,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'renderer_version': utils.RENDERER_VERSION,
+        'fonts': {font: os.path.basename(utils.get_font_path(font) or 'default') for font in TEXT_FONTS},
+    }
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks text and image favicon generation, writes latency percentiles, peak RSS '
+            'and output size as JSON, and optionally fails on regressions against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--only', action='append', default=[],
+                            help='Run only cases whose name contains this (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this file ("-" for stdout)')
+        parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+        parser.add_argument('--threshold', type=float,
+                            help='Allowed fractional growth for every metric, overriding the defaults')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    previous = json.load(f)
+                baseline = previous['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Could not read baseline {options["baseline"]}: {e}')
+            repeat = min(options['repeat'], previous.get('repeat', 0))
+            if repeat < MIN_GATE_REPEAT:
+                raise CommandError(f'Comparing against a baseline needs at least {MIN_GATE_REPEAT} runs per case '
+                                   f'on both sides (got {repeat}); raise --repeat.')
+
+        # Human-readable progress goes to stderr when the JSON takes stdout
+        out = self.stderr if options['output'] == '-' else self.stdout
+        out.write(f"{'case':<40}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'p50 rel':>10}{'peak RSS MB':>13}"
+                  f"{'bytes':>10}")
+        results = {}
+        for name, (fn, *args) in [*text_cases(), *image_cases()]:
+            if options['only'] and not any(part in name for part in options['only']):
+                continue
+            args = [arg() if callable(arg) else arg for arg in args]
+            output_bytes = len(fn(*args))
+            timings, peak_kb, calibration = benchmarks.measure(fn, *args, repeat=options['repeat'],
+                                                               warmup=options['warmup'], calibrate=True)
+            summary = results[name] = benchmarks.summarize(timings, peak_kb, output_bytes, calibration)
+            out.write(f"{name:<40}{summary['p50_ms']:>10.1f}{summary['p90_ms']:>10.1f}{summary['p99_ms']:>10.1f}"
+                      f"{summary['p50_relative']:>10.2f}{peak_kb / 1024:>13.1f}{output_bytes:>10}")
+
+        report = {'environment': environment(), 'repeat': options['repeat'], 'results': results}
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        if baseline is None:
+            return
+        thresholds = DEFAULT_THRESHOLDS
+        if options['threshold'] is not None:
+            thresholds = dict.fromkeys(DEFAULT_THRESHOLDS, options['threshold'])
+        regressions = benchmarks.find_regressions(results, baseline, thresholds, NOISE_FLOORS)
+        for case, metric, before, after in regressions:
+            out.write(self.style.ERROR(f'{case}: {metric} {before} -> {after} (+{after / before - 1:.0%})'
+                                       if before else f'{case}: {metric} {before} -> {after}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} metric(s) regressed against {options["baseline"]}.')
+        out.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}.'))
@@ -0,0 +1,46 @@
+import io
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from Favitude import benchmarks, ingest, utils
+
+
+def _naive(data):
+    """
+    The pre-ingestion path: decode the whole first frame and convert it to RGBA.
+    """
+    Image.open(io.BytesIO(data)).convert('RGBA')
+
+
+def _ingest(data):
+    try:
+        ingest.open_upload(io.BytesIO(data), max(utils.PNG_SIZES + utils.ICO_SIZES)).convert('RGBA')
+    except ingest.ImageRejected:
+        pass
+
+
+DECODERS = {
+    'naive': _naive,
+    'ingest': _ingest,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares peak RSS and time of naive decoding and the guarded ingestion stage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        sources = {
+            'JPEG 6000': benchmarks.make_source_image(6000, 'JPEG'),
+            'PNG 6000': benchmarks.make_source_image(6000, 'PNG'),
+            'PNG 10000': benchmarks.make_source_image(10000, 'PNG'),
+            'GIF 2000x8': benchmarks.make_animated_gif(2000, 8),
+        }
+        self.stdout.write(f"{'source':<12}{'decoder':<9}{'best ms':>10}{'peak RSS MB':>14}")
+        for label, data in sources.items():
+            for name, decoder in DECODERS.items():
+                timings, peak_kb = benchmarks.measure(decoder, data, repeat=options['repeat'])
+                self.stdout.write(f"{label:<12}{name:<9}{min(timings) * 1000:>10.1f}{peak_kb / 1024:>14.1f}")
@@ -0,0 +1,57 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+
+from PIL import Image
+
+from Favitude import benchmarks, optimize, textrender, utils
+
+# (label, text, shape, font colour, background colour)
+TEXT_SAMPLES = [
+    ('monogram', 'Ab', 'rounded_square', '#ffffff', '#3264c8'),
+    ('word', 'Hello', 'circle', '#ffc800', '#c81e1e'),
+    ('glyph', 'W', 'triangular', '#000000', None),
+]
+
+
+def _text_frames(text, bg_shape, font_color, bg_color):
+    params = utils.normalize_text_params(text, 0, bg_shape, font_color, bg_color)
+    logo = textrender.layout(params['text'], params['font_size'], params['bg_shape'], params['font_color'],
+                             params['bg_color'], utils.get_font_path(params['font_type']))
+    return {size: textrender.rasterize(logo, size[0]) for size in set(utils.PNG_SIZES + utils.ICO_SIZES)}
+
+
+def _photo_frames(side):
+    img = Image.open(io.BytesIO(benchmarks.make_source_image(side, 'PNG')))
+    return utils.build_resize_pyramid(img, utils.PNG_SIZES + utils.ICO_SIZES)
+
+
+class Command(BaseCommand):
+    help = 'Reports the bytes saved by the PNG/ICO output optimizer against Pillow defaults'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photo-side', type=int, default=1024)
+
+    def handle(self, *args, **options):
+        samples = [(label, _text_frames(*spec)) for label, *spec in TEXT_SAMPLES]
+        samples.append(('photo', _photo_frames(options['photo_side'])))
+
+        self.stdout.write(f"{'sample':<10}{'file':<24}{'default B':>11}{'optimized B':>13}{'saved':>8}{'ms':>8}")
+        total_before = total_after = 0
+        for label, frames in samples:
+            encoder = optimize.FrameEncoder(frames)
+            files = [(f'favicon-{w}x{h}.png', optimize.baseline_png(frames[(w, h)]), encoder.png, (w, h))
+                     for w, h in utils.PNG_SIZES]
+            ico_frames = [frames[size] for size in utils.ICO_SIZES]
+            files.append(('favicon.ico', optimize.baseline_ico(ico_frames), encoder.ico, utils.ICO_SIZES))
+            for name, baseline, encode, arg in files:
+                before = len(baseline)
+                start = time.perf_counter()
+                after = len(encode(arg))
+                elapsed = time.perf_counter() - start
+                total_before += before
+                total_after += after
+                self.stdout.write(f"{label:<10}{name:<24}{before:>11}{after:>13}"
+                                  f"{1 - after / before:>8.1%}{elapsed * 1000:>8.1f}")
+        self.stdout.write(f"{'total':<34}{total_before:>11}{total_after:>13}{1 - total_after / total_before:>8.1%}")
@@ -0,0 +1,50 @@
+import io
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from Favitude import benchmarks, utils
+
+
+def _legacy_render(data):
+    """
+    The pre-pyramid pipeline: every output size resampled independently from full resolution.
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    img.save(io.BytesIO(), format='ICO', sizes=utils.ICO_SIZES)
+    for size in utils.PNG_SIZES:
+        img.resize(size, Image.Resampling.LANCZOS).save(io.BytesIO(), format='PNG')
+
+
+def _pyramid_render(data):
+    for _ in utils._render_favicon_from_image(io.BytesIO(data)):
+        pass
+
+
+PIPELINES = {
+    'legacy': _legacy_render,
+    'pyramid': _pyramid_render,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares wall-clock time and peak RSS of the legacy and pyramid resize pipelines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000])
+        parser.add_argument('--formats', nargs='+', default=['PNG', 'JPEG'])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'source':<14}{'pipeline':<10}{'best ms':>10}{'mean ms':>10}{'peak RSS MB':>14}")
+        for fmt in options['formats']:
+            for side in options['sizes']:
+                data = benchmarks.make_source_image(side, fmt)
+                for name, pipeline in PIPELINES.items():
+                    timings, peak_kb = benchmarks.measure(pipeline, data, repeat=options['repeat'])
+                    self.stdout.write(
+                        f"{fmt + ' ' + str(side):<14}{name:<10}{min(timings) * 1000:>10.1f}"
+                        f"{sum(timings) / len(timings) * 1000:>10.1f}{peak_kb / 1024:>14.1f}"
+                    )
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import loadtest
+
+# How each entry point is served: the WSGI setup from the README (gunicorn's sync workers)
+# and the ASGI run profile (uvicorn; Django 4.2 does not implement the lifespan protocol)
+SERVERS = {
+    'wsgi': ['gunicorn', 'FaviconGen.wsgi:application', '--workers', '{workers}',
+             '--bind', '127.0.0.1:{port}', '--timeout', '120'],
+    'asgi': ['uvicorn', 'FaviconGen.asgi:application', '--workers', '{workers}',
+             '--host', '127.0.0.1', '--port', '{port}', '--lifespan', 'off', '--no-access-log'],
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """
+    One server process, started from this project's directory with the current environment.
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        executable, *args = [arg.format(workers=workers, port=self.port) for arg in SERVERS[name]]
+        path = shutil.which(executable, path=os.path.dirname(sys.executable)) or shutil.which(executable)
+        if path is None:
+            raise CommandError(f'{executable} is not installed (pip install {executable}).')
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen([path, *args], cwd=settings.BASE_DIR, stdout=self.log,
+                                        stderr=subprocess.STDOUT)
+
+    def wait_until_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f'{self.name} exited with status {self.process.returncode}:\n{self.output()}')
+            try:
+                loadtest.httpx.get(self.url + '/about/', timeout=5)
+                return
+            except loadtest.httpx.TransportError:
+                time.sleep(0.2)
+        raise CommandError(f'{self.name} did not answer within {timeout} seconds:\n{self.output()}')
+
+    def output(self):
+        self.log.seek(0)
+        return self.log.read().decode('utf-8', 'replace')[-2000:]
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+class Command(BaseCommand):
+    help = ('Compares the WSGI (gunicorn) and ASGI (uvicorn) entry points under the same mixed '
+            'load: starts each server in turn with the same number of workers and drives the '
+            'loadtest traffic at it at each concurrency level')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=list(SERVERS))
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 64],
+                            help='Requests in flight at once, one run per level')
+        parser.add_argument('--duration', type=float, default=20, help='Seconds per run')
+        parser.add_argument('--users', type=int, default=4)
+        parser.add_argument('--mix', default='text=5,image=2,download=3',
+                            help='Relative weights of the text, image and download requests')
+        parser.add_argument('--unique-ratio', type=float, default=0.2,
+                            help='Share of text/image requests with content the caches have not seen')
+        parser.add_argument('--output', help='Write every run\'s loadtest report as JSON to this file')
+
+    def handle(self, *args, **options):
+        if loadtest.httpx is None:
+            raise CommandError('The benchmark needs httpx: pip install httpx')
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = {}
+        self.stdout.write(f"{'server':<8}{'conc':>6}{'requests':>10}{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}"
+                          f"{'p99 ms':>9}{'errors':>8}{'busy':>6}")
+        for name in options['servers']:
+            server = Server(name, options['workers'])
+            try:
+                server.wait_until_ready()
+                for concurrency in options['concurrency']:
+                    test = loadtest.LoadTest(
+                        server.url, users=options['users'], concurrency=concurrency,
+                        duration=options['duration'], mix=mix, unique_ratio=options['unique_ratio'],
+                        user_prefix=f'bench{name}',
+                    )
+                    try:
+                        report = asyncio.run(test.run())
+                    except loadtest.LoadTestError as e:
+                        raise CommandError(f'{name}: {e}\n{server.output()}')
+                    results[f'{name}/{concurrency}'] = report
+                    self._row(name, concurrency, report['kinds'].get('all', {}))
+            finally:
+                server.stop()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {key: options[key] for key in ('servers', 'workers', 'concurrency', 'duration',
+                                                                     'users', 'mix', 'unique_ratio')},
+                           'runs': results}, f, indent=2)
+
+    def _row(self, name, concurrency, entry):
+        latency = ''.join(f"{entry.get(key, float('nan')):>9.1f}" for key in ('p50_ms', 'p90_ms', 'p99_ms'))
+        self.stdout.write(f"{name:<8}{concurrency:>6}{entry.get('requests', 0):>10}{entry.get('throughput_rps', 0):>8.1f}"
+                          f"{latency}{entry.get('errors', 0):>8}{entry.get('busy', 0):>6}")
@@ -0,0 +1,39 @@
+import time
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import assets
+
+
+class Command(BaseCommand):
+    help = ('Builds responsive image variants (AVIF, WebP, downscaled) of the static images, then '
+            'collects static files with content-hashed names and gzip/brotli copies')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants of unchanged images')
+        parser.add_argument('--jobs', type=int, help='Images encoded at once (default: one per CPU)')
+        parser.add_argument('--variants-only', action='store_true', help='Skip collectstatic')
+        parser.add_argument('--clear', action='store_true', help='Empty STATIC_ROOT before collecting')
+
+    def handle(self, *args, **options):
+        if not assets.available_formats():
+            self.stderr.write('This Pillow build encodes none of the configured formats; '
+                              'only downscaled copies will be built.')
+        start = time.perf_counter()
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        built, current, failed = assets.build_variants(force=options['force'], jobs=options['jobs'], log=log)
+        self.stdout.write(f'Variants: {built} image(s) built, {current} up to date '
+                          f'({time.perf_counter() - start:.1f}s)')
+        for path, error in failed:
+            self.stderr.write(f'{path} skipped, not a readable image: {error}')
+        if options['variants_only']:
+            return
+
+        if not isinstance(staticfiles_storage, assets.FavitudeStaticFilesStorage):
+            raise CommandError('STORAGES["staticfiles"] must be Favitude.assets.FavitudeStaticFilesStorage.')
+        call_command('collectstatic', interactive=False, clear=options['clear'], verbosity=options['verbosity'])
+        # Each post-processing pass reports them again
+        for name, url in dict.fromkeys(staticfiles_storage.missing_references):
+            self.stderr.write(f'{name} refers to {url}, which does not exist; left unhashed')
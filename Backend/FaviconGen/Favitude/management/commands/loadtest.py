@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import loadtest
+
+
+class Command(BaseCommand):
+    help = ('Drives mixed text, image and gallery-download traffic at a running server and reports '
+            'throughput, latency percentiles and error rates, e.g. against '
+            '"gunicorn FaviconGen.wsgi -w 4 -b 127.0.0.1:8000"')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=4, help='Virtual users to sign up and log in')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run for')
+        parser.add_argument('--requests', type=int, help='Stop after this many requests instead')
+        parser.add_argument('--mix', default='text=5,image=2,download=3',
+                            help='Relative weights of the text, image and download requests')
+        parser.add_argument('--unique-ratio', type=float, default=0.2,
+                            help='Share of text/image requests with content the caches have not seen')
+        parser.add_argument('--slugs', nargs='+', help='Gallery items to download')
+        parser.add_argument('--user-prefix', default='loadtest')
+        parser.add_argument('--output', help='Also write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--users and --concurrency must be at least 1.')
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+            test = loadtest.LoadTest(
+                options['url'], users=options['users'], concurrency=options['concurrency'],
+                duration=options['duration'], requests=options['requests'], mix=mix,
+                unique_ratio=options['unique_ratio'], gallery_slugs=options['slugs'],
+                user_prefix=options['user_prefix'],
+            )
+            self.stdout.write(f"Signing in {options['users']} users at {options['url']}...")
+            report = asyncio.run(test.run())
+        except (ValueError, loadtest.LoadTestError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'kind':<10}{'requests':>9}{'ok':>7}{'errors':>8}{'busy':>6}{'err %':>7}"
+                          f"{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for kind, entry in report['kinds'].items():
+            latency = ''.join(f"{entry.get(key, float('nan')):>9.1f}" for key in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms'))
+            self.stdout.write(f"{kind:<10}{entry['requests']:>9}{entry['ok']:>7}{entry['errors']:>8}{entry['busy']:>6}"
+                              f"{entry['error_rate']:>7.1%}{entry['throughput_rps']:>8.1f}{latency}")
+        if report['error_statuses']:
+            self.stdout.write(f"Errors by status: {report['error_statuses']}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {key: options[key] for key in ('url', 'users', 'concurrency', 'duration',
+                                                                     'requests', 'mix', 'unique_ratio')},
+                           **report}, f, indent=2)
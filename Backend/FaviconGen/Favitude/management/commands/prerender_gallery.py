@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import gallery
+from Favitude.models import GalleryItem
+
+
+class Command(BaseCommand):
+    help = 'Renders gallery items into stored favicon bundles and previews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Only these items (default: all)')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render items whose stored bundle is already current')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete stored files no item refers to any more')
+
+    def handle(self, *args, **options):
+        items = GalleryItem.objects.all()
+        if options['slugs']:
+            items = items.filter(slug__in=options['slugs'])
+            missing = set(options['slugs']) - set(items.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'Unknown gallery item(s): {", ".join(sorted(missing))}')
+
+        failed = 0
+        for item in items:
+            try:
+                rendered = gallery.prerender_item(item, force=options['force'])
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{item.slug} failed: {e}')
+                continue
+            state = 'rendered' if rendered else 'up to date'
+            self.stdout.write(f'{item.slug} {state} ({item.bundle_size} bytes, {item.bundle_digest[:12]})')
+
+        if options['prune']:
+            self.stdout.write(f'Pruned {gallery.prune_blobs()} unreferenced file(s)')
+        if failed:
+            raise CommandError(f'{failed} item(s) failed to render')
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Favitude import coldstart
+
+
+class Command(BaseCommand):
+    help = ('Starts the project in a fresh interpreter under "python -X importtime" and reports the '
+            'start-up phases and where import time goes, by package and by module')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', default=[],
+                            help='Also request this path after start-up (repeatable), e.g. --path /about/')
+        parser.add_argument('--limit', type=int, default=25, help='Modules to list')
+        parser.add_argument('--sort', choices=('cumulative', 'self'), default='cumulative',
+                            help='Order modules by time including or excluding their own imports')
+        parser.add_argument('--why', action='append', default=[], metavar='MODULE',
+                            help='Show the chain of imports that loaded MODULE (repeatable)')
+        parser.add_argument('--output', help='Write the phases and every import as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            report, stderr = coldstart.run(options['path'], importtime=True)
+        except coldstart.ColdStartError as e:
+            raise CommandError(str(e))
+        records = coldstart.parse_importtime(stderr)
+
+        phases = ', '.join(f'{name} {ms:.0f}' for name, ms in report['phases'].items())
+        self.stdout.write(f"Start-up {report['startup_ms']:.0f} ms ({phases}); process {report['wall_ms']:.0f} ms")
+        for request in report['requests']:
+            self.stdout.write(f"GET {request['path']}: {request['status']} in {request['ms']:.0f} ms")
+        self.stdout.write(f"Loaded at start-up: {', '.join(report['loaded_at_startup']) or 'none of the watched modules'}")
+        if report['requests']:
+            self.stdout.write(f"Loaded after requests: {', '.join(report['loaded_after_requests'])}")
+
+        total_us = sum(record.self_us for record in records)
+        self.stdout.write(f"\n{len(records)} modules imported in {total_us / 1000:.0f} ms")
+        self.stdout.write(f"{'package':<36}{'self ms':>9}{'share':>7}{'modules':>9}")
+        for package, (self_us, count) in list(coldstart.package_totals(records).items())[:options['limit']]:
+            self.stdout.write(f"{package:<36}{self_us / 1000:>9.1f}{self_us / total_us:>7.1%}{count:>9}")
+
+        key = 'cumulative_us' if options['sort'] == 'cumulative' else 'self_us'
+        self.stdout.write(f"\n{'module':<56}{'cumul ms':>10}{'self ms':>9}")
+        for record in sorted(records, key=lambda r: -getattr(r, key))[:options['limit']]:
+            self.stdout.write(f"{record.name:<56}{record.cumulative_us / 1000:>10.1f}{record.self_us / 1000:>9.1f}")
+
+        for name in options['why']:
+            chain = coldstart.import_chain(records, name)
+            self.stdout.write(f"\n{name}: {' <- '.join(chain[1:]) or 'imported by the start-up code'}" if chain
+                              else f"\n{name}: not imported")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({**report, 'imports': [vars(record) for record in records]}, f, indent=2)
@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from Favitude import jobs
+
+
+class Command(BaseCommand):
+    help = 'Drains the database-backed favicon job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=0,
+                            help='Exit after this many jobs (0 means no limit)')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue jobs left running for this many seconds by a dead worker')
+        parser.add_argument('--requeue-interval', type=float, default=60.0,
+                            help='Seconds between checks for stale jobs')
+
+    def requeue_stale_jobs(self, stale_after):
+        requeued = jobs.requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s)')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        processed = 0
+        next_requeue = 0
+        while True:
+            # Workers can die at any time, not just before this one started
+            if time.monotonic() >= next_requeue:
+                self.requeue_stale_jobs(stale_after)
+                next_requeue = time.monotonic() + options['requeue_interval']
+
+            job = jobs.claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            jobs.run_job(job)
+            processed += 1
+            self.stdout.write(f'{job.job_id} {job.kind} {job.status}')
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
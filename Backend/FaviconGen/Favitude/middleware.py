@@ -0,0 +1,108 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import asyncviews, instrument
+
+logger = logging.getLogger(__name__)
+
+
+def _shared_cacheable(response):
+    directives = {directive.split('=', 1)[0].strip().lower()
+                  for directive in response.get('Cache-Control', '').split(',')}
+    return 'public' in directives or 's-maxage' in directives
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the render spans of each request into a ``Server-Timing`` header and the
+    process-wide stage histograms. Requests that open no spans are left alone, and responses
+    shared caches may keep (``public`` or ``s-maxage``) get no header, so one request's
+    timings are not replayed to everyone. Only spans that finish before the response starts
+    are reported; ZIP entries encoded while a streamed response is sent go straight to the
+    histograms. Runs natively under both WSGI
+    and ASGI (the spans live in a context variable, which follows the request either way).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not instrument.is_enabled():
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        token = instrument.start_collecting()
+        try:
+            response = self.get_response(request)
+        finally:
+            spans = instrument.stop_collecting(token)
+        return self._report(request, response, spans, start)
+
+    async def __acall__(self, request):
+        if not instrument.is_enabled():
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        token = instrument.start_collecting()
+        try:
+            response = await self.get_response(request)
+        finally:
+            spans = instrument.stop_collecting(token)
+        return self._report(request, response, spans, start)
+
+    def _report(self, request, response, spans, start):
+        if not spans:
+            return response
+
+        total = time.perf_counter() - start
+        instrument.stats.record(spans + [('request', total)])
+        config = instrument.get_config()
+        if config['SERVER_TIMING'] and not _shared_cacheable(response):
+            response['Server-Timing'] = instrument.server_timing(spans, total)
+        if config['SLOW_REQUEST_MS'] and total * 1000 >= config['SLOW_REQUEST_MS']:
+            logger.warning('Slow render request %s %s (%.0f ms): %s', request.method, request.path,
+                           total * 1000, instrument.server_timing(spans))
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs natively under ASGI. whitenoise itself is sync-only,
+    so Django would otherwise run it, and every request behind it, through the one thread
+    sync_to_async keeps for sync code, serializing the async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Development only: looks the file up on disk
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        response = await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return asyncviews.stream_file(request, response)
@@ -0,0 +1,94 @@
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def gen_job_ids(apps, schema_editor):
+    generateImage = apps.get_model('Favitude', 'generateImage')
+    for row in generateImage.objects.all():
+        row.job_id = uuid.uuid4()
+        row.save(update_fields=['job_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Favitude', '0001_initial'),
+    ]
+
+    operations = [
+        # Unique UUIDs for existing rows: add nullable, fill in, then make unique
+        migrations.AddField(
+            model_name='generateimage',
+            name='job_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, null=True),
+        ),
+        migrations.RunPython(gen_job_ids, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='generateimage',
+            name='job_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='favicon_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='kind',
+            field=models.CharField(choices=[('image', 'Image'), ('text', 'Text')], default='image', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='generateimage',
+            name='image_field',
+            field=models.ImageField(blank=True, upload_to='uploads/'),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='result',
+            field=models.FileField(blank=True, upload_to='favicons/'),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generateimage',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterModelOptions(
+            name='generateimage',
+            options={'ordering': ['created_at']},
+        ),
+        migrations.AddIndex(
+            model_name='generateimage',
+            index=models.Index(fields=['status', 'created_at'], name='Favitude_ge_status_a225f6_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+# The collection previously served straight from static/images/images-home
+LEGACY_COLLECTION = [
+    ('frame1', 'Frame 1', 'Frame1.png'),
+    ('frame2', 'Frame 2', 'Frame2.png'),
+    ('frame3', 'Frame 3', 'Frame3.png'),
+    ('frame5', 'Frame 5', 'Frame5.png'),
+    ('check', 'Check', 'check.png'),
+    ('convert', 'Convert', 'convert.png'),
+]
+
+
+def seed_gallery(apps, schema_editor):
+    GalleryItem = apps.get_model('Favitude', 'GalleryItem')
+    for position, (slug, title, filename) in enumerate(LEGACY_COLLECTION):
+        GalleryItem.objects.get_or_create(slug=slug, defaults={
+            'title': title,
+            'kind': 'image',
+            'source': f'images/images-home/{filename}',
+            'position': position,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Favitude', '0002_favicon_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(unique=True)),
+                ('title', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('image', 'Image'), ('text', 'Text')], default='image', max_length=10)),
+                ('source', models.CharField(blank=True, max_length=255)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('is_published', models.BooleanField(default=True)),
+                ('source_digest', models.CharField(blank=True, max_length=64)),
+                ('bundle', models.FileField(blank=True, upload_to='')),
+                ('bundle_digest', models.CharField(blank=True, max_length=64)),
+                ('bundle_size', models.PositiveIntegerField(default=0)),
+                ('preview', models.FileField(blank=True, upload_to='')),
+                ('preview_digest', models.CharField(blank=True, max_length=64)),
+                ('rendered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['position', 'slug'],
+            },
+        ),
+        migrations.RunPython(seed_gallery, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+INDEX_NAME = 'favitude_auth_user_email_ci_uniq'
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Refuses to build the index over accounts that share an email in different cases; which
+    of them to keep is a decision for a person, not a migration.
+    """
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(accounts=Count('id')).filter(accounts__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Cannot add a case-insensitive unique index on auth_user.email while these emails '
+            f'belong to more than one account: {", ".join(duplicates)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('Favitude', '0003_gallery'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, reverse_code=migrations.RunPython.noop),
+        # Blank emails index as NULL, so accounts without one (e.g. from createsuperuser) may
+        # coexist. Queries must use the same expression, backends.EmailKey, to hit it.
+        migrations.RunSQL(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {INDEX_NAME} ON auth_user (NULLIF(LOWER(email), ''))",
+            reverse_sql=f'DROP INDEX IF EXISTS {INDEX_NAME}',
+        ),
+    ]
@@ -6,6 +6,9 @@ from django.contrib.auth.models import (
 )
 from django.forms import modelform_factory
 from django.db.models import Model
+from django.conf import settings
+import uuid
+from django.utils import timezone
 
 # Create your models here.
 class MyUserManager(BaseUserManager):
@@ -29,4 +32,82 @@ class MyUserManager(BaseUserManager):
 
 
 class generateImage(models.Model):
-    image_field = models.ImageField(upload_to = 'uploads/')
\ No newline at end of file
+    """
+    A queued favicon render. Created by the jobs API and drained by ``manage.py run_favicon_worker``.
+    Image jobs keep their upload in ``image_field``; text jobs keep their form values in ``params``.
+    """
+    KIND_IMAGE = 'image'
+    KIND_TEXT = 'text'
+    KIND_CHOICES = [
+        (KIND_IMAGE, 'Image'),
+        (KIND_TEXT, 'Text'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='favicon_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_IMAGE)
+    image_field = models.ImageField(upload_to = 'uploads/', blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    result = models.FileField(upload_to='favicons/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} job {self.job_id} ({self.status})'
+
+
+class GalleryItem(models.Model):
+    """
+    A favicon in the public collection. Sources are either a static image (``source``, a path
+    findable by the staticfiles finders) or text parameters (``params``). ``manage.py
+    prerender_gallery`` renders each item once into a ZIP and a preview PNG kept in
+    content-addressed storage, so downloads never render or probe files per request.
+    """
+    KIND_IMAGE = generateImage.KIND_IMAGE
+    KIND_TEXT = generateImage.KIND_TEXT
+
+    slug = models.SlugField(unique=True)
+    title = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=generateImage.KIND_CHOICES, default=KIND_IMAGE)
+    source = models.CharField(max_length=255, blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    position = models.PositiveIntegerField(default=0)
+    is_published = models.BooleanField(default=True)
+    # Digest of the source and renderer version the stored bundle was built from
+    source_digest = models.CharField(max_length=64, blank=True)
+    bundle = models.FileField(blank=True)
+    bundle_digest = models.CharField(max_length=64, blank=True)
+    bundle_size = models.PositiveIntegerField(default=0)
+    preview = models.FileField(blank=True)
+    preview_digest = models.CharField(max_length=64, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['position', 'slug']
+
+    def __str__(self):
+        return self.title or self.slug
+
+    @property
+    def is_rendered(self):
+        return bool(self.bundle_digest)
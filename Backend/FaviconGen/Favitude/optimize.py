@@ -0,0 +1,232 @@
+"""
+Size optimization for the PNG and ICO files in a favicon bundle.
+
+Favicons are mostly flat colour. The distinct RGBA values of a frame are counted with a NumPy
+histogram over the packed pixels; a frame with at most 256 of them is written as a palette PNG,
+with a tRNS chunk for its translucent entries and at 1, 2 or 4 bits per pixel when the palette
+is small enough. All of that is lossless. Setting ``settings.FAVITUDE_PNG_QUANTIZE_TOLERANCE``
+above 0 opts in to paletting frames slightly over 256 colours (typically a few anti-aliasing
+shades) as well: their 256 most frequent colours are kept exactly and the rest mapped to the
+nearest of those, provided no channel moves by more than the tolerance. Every PNG is encoded
+once per zlib strategy in ZLIB_STRATEGIES, at a level chosen by compress_level(), and the
+smallest kept.
+
+ICO entries up to 128px are 32-bit BMPs with an AND mask: PNG entries only arrived with
+Windows Vista, and some readers still reject them. The 256px entry, which those readers do
+not use, is an RGBA PNG with the same zlib search, as it would be many times larger as a
+BMP. Without NumPy, only the zlib search applies.
+"""
+import functools
+import io
+import struct
+import zlib
+
+from django.conf import settings
+from PIL import Image
+
+from . import instrument
+
+MAX_PALETTE = 256
+
+# Frames with more colours than this are photos, not worth matching against a palette
+MAX_QUANTIZE_COLORS = 4096
+
+# Pillow picks the PNG row filter itself (none for palette images, adaptive otherwise), so the
+# zlib level and strategy are what is left to choose per image. Z_FILTERED rarely beat both
+# and costs as much as the default strategy.
+ZLIB_STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_RLE)
+
+# Level 9 saves 5-15% over level 6 but its cost grows faster than the frame does (up to ~9x
+# on smooth gradients), so frames above MAX_LEVEL9_PIXELS (the 512px PWA icon, large custom
+# sizes) use LARGE_COMPRESS_LEVEL
+COMPRESS_LEVEL = 9
+LARGE_COMPRESS_LEVEL = 6
+MAX_LEVEL9_PIXELS = 256 * 256
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """
+    NumPy, imported on the first palette attempt rather than with this module since it takes
+    longer to import than the rest of the renderer, or None when it is not installed.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def get_quantize_tolerance():
+    return getattr(settings, 'FAVITUDE_PNG_QUANTIZE_TOLERANCE', 0)
+
+
+def palette_image(img, tolerance=0):
+    """
+    Returns (P-mode image, tRNS alphas) for an RGBA image, or None if it cannot be paletted
+    within ``tolerance`` (the largest per-channel change allowed) or NumPy is unavailable.
+    """
+    np = _numpy()
+    if np is None or img.mode != 'RGBA':
+        return None
+    pixels = np.asarray(img, dtype=np.uint8).reshape(-1, 4)
+    colors, inverse, counts = np.unique(pixels.view('<u4').ravel(), return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    if len(colors) > MAX_PALETTE:
+        if tolerance <= 0 or len(colors) > MAX_QUANTIZE_COLORS:
+            return None
+        channels = colors.view(np.uint8).reshape(-1, 4).astype(np.int16)
+        by_count = np.argsort(-counts, kind='stable')
+        kept, rare = by_count[:MAX_PALETTE], by_count[MAX_PALETTE:]
+        # Largest channel difference between every rare colour and every kept one
+        distance = np.abs(channels[rare][:, None, :] - channels[kept][None, :, :]).max(axis=2)
+        nearest = distance.argmin(axis=1)
+        if distance[np.arange(len(rare)), nearest].max() > tolerance:
+            return None
+        slot = np.empty(len(colors), dtype=np.intp)
+        slot[kept] = np.arange(MAX_PALETTE)
+        slot[rare] = nearest
+        colors, inverse = colors[kept], slot[inverse]
+
+    rgba = colors.astype('<u4').view(np.uint8).reshape(-1, 4)
+    # Translucent entries first, so the tRNS chunk can end at the last of them
+    order = np.argsort(rgba[:, 3] == 255, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    rgba = rgba[order]
+
+    indices = rank[inverse].astype(np.uint8)
+    paletted = Image.frombytes('P', img.size, indices.tobytes())
+    paletted.putpalette(rgba[:, :3].tobytes(), rawmode='RGB')
+    alphas = rgba[:, 3]
+    return paletted, alphas[alphas < 255].tobytes()
+
+
+def compress_level(img):
+    return COMPRESS_LEVEL if img.width * img.height <= MAX_LEVEL9_PIXELS else LARGE_COMPRESS_LEVEL
+
+
+def _smallest_png(img, **params):
+    level = compress_level(img)
+    best = None
+    for strategy in ZLIB_STRATEGIES:
+        buf = io.BytesIO()
+        img.save(buf, format='PNG', compress_level=level, compress_type=strategy, **params)
+        if best is None or buf.tell() < len(best):
+            best = buf.getvalue()
+    return best
+
+
+def encode_png(img):
+    """
+    The smallest lossless RGBA PNG encoding of ``img`` found by the zlib search.
+    """
+    return _smallest_png(img)
+
+
+def encode_palette_png(img):
+    """
+    The palette PNG encoding of ``img``, or None if it cannot be paletted.
+    """
+    paletted = palette_image(img, get_quantize_tolerance())
+    if paletted is None:
+        return None
+    img, transparency = paletted
+    return _smallest_png(img, transparency=transparency) if transparency else _smallest_png(img)
+
+
+def encode_best_png(img, rgba=None):
+    """
+    The smaller of the palette and RGBA encodings of ``img``. The palette usually wins, but
+    its PLTE/tRNS chunks can outweigh the savings on tiny frames, and unfiltered palette rows
+    compress poorly for gradients. ``rgba`` may be an RGBA encoding already made.
+    """
+    if rgba is None:
+        rgba = encode_png(img)
+    data = encode_palette_png(img)
+    if data is None or len(rgba) <= len(data):
+        return rgba
+    return data
+
+
+# ICO entries at least this wide are stored as PNG, smaller ones as BMP
+ICO_PNG_MIN_SIZE = 256
+
+
+def encode_ico_bitmap(img):
+    """
+    ``img`` as the BMP form of an ICO entry: a BITMAPINFOHEADER whose height counts the XOR
+    and AND masks, the 32-bit BGRA pixels bottom-up, then a 1-bit mask marking the fully
+    transparent pixels, for readers that ignore the alpha channel.
+    """
+    img = img.convert('RGBA')
+    width, height = img.size
+    mask_stride = (width + 31) // 32 * 4
+    mask = img.getchannel('A').point(lambda alpha: 255 if alpha == 0 else 0, '1')
+    header = struct.pack('<IiiHHIIiiII', 40, width, height * 2, 1, 32, 0, 0, 0, 0, 0, 0)
+    return header + img.tobytes('raw', 'BGRA', 0, -1) + mask.tobytes('raw', '1', mask_stride, -1)
+
+
+def encode_ico(payloads):
+    """
+    An ICO file from (size, entry bytes) pairs, one entry each, in the order given (smallest
+    first by convention). Entries are PNG files or encode_ico_bitmap() output.
+    """
+    header = struct.pack('<HHH', 0, 1, len(payloads))
+    offset = len(header) + 16 * len(payloads)
+    entries = []
+    for (width, height), data in payloads:
+        # A dimension of 0 means 256 in ICONDIRENTRY
+        entries.append(struct.pack('<BBBBHHII', width % 256, height % 256, 0, 0, 1, 32, len(data), offset))
+        offset += len(data)
+    return header + b''.join(entries) + b''.join(data for _, data in payloads)
+
+
+class FrameEncoder:
+    """
+    Encodes the frames of one bundle, sharing the RGBA encodings between the PNG files and the
+    ICO entries of the same size.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self._rgba = {}
+        self._best = {}
+
+    def rgba(self, size):
+        if size not in self._rgba:
+            self._rgba[size] = encode_png(self.frames[size])
+        return self._rgba[size]
+
+    def png(self, size):
+        if size not in self._best:
+            with instrument.span('encode_png'):
+                self._best[size] = encode_best_png(self.frames[size], rgba=self.rgba(size))
+        return self._best[size]
+
+    def ico(self, sizes):
+        with instrument.span('encode_ico'):
+            return encode_ico([
+                (size, self.rgba(size) if size[0] >= ICO_PNG_MIN_SIZE else encode_ico_bitmap(self.frames[size]))
+                for size in sizes
+            ])
+
+
+def baseline_png(img):
+    """
+    The PNG Pillow writes with its default settings, for measuring the optimizer.
+    """
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def baseline_ico(images):
+    """
+    The ICO Pillow writes with BMP entries, the form encode_ico() uses below 256px.
+    """
+    buf = io.BytesIO()
+    images[-1].save(buf, format='ICO', sizes=[im.size for im in images], append_images=images[:-1],
+                    bitmap_format='bmp')
+    return buf.getvalue()
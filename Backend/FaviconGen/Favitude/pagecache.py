@@ -0,0 +1,159 @@
+"""
+Caching for the static marketing and docs pages.
+
+Anonymous visitors all see the same page, so @cached_page stores the whole response and
+serves it without running the view or the template engine. Logged-in users see their own
+name in the nav, so their pages are rendered every time, but the static body of each template
+is a ``{% cache %}`` fragment keyed the same way:
+
+    {% load cache %}
+    {% cache page_cache.timeout about page_cache.version using=page_cache.alias %}
+        ...
+    {% endcache %}
+
+Both are keyed by ``version``: the build hash, which changes on every deploy, and a gallery
+token bumped whenever a GalleryItem is saved or deleted (the home page lists them). Responses
+carry ``Vary: Cookie`` so a shared cache never hands an anonymous page to a signed-in user.
+
+Configured through ``settings.FAVITUDE_PAGE_CACHE``:
+
+    FAVITUDE_PAGE_CACHE = {
+        'ENABLED': True,      # False renders every page, fragments included
+        'ALIAS': 'pages',     # the CACHES entry pages and fragments are stored in
+        'TIMEOUT': 600,       # seconds
+        'BUILD_HASH': '',     # empty: the git HEAD, else a token fixed at process start
+    }
+
+With a per-process (locmem) cache, a gallery change reaches other workers' copies only when
+they expire; point the alias at a file-based or shared cache to invalidate them all at once.
+"""
+import functools
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+
+from .models import GalleryItem
+
+DEFAULT_CONFIG = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 600,
+    'BUILD_HASH': '',
+}
+
+GALLERY_VERSION_KEY = 'favitude:pages:gallery'
+
+_config = None
+
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = {**DEFAULT_CONFIG, **getattr(settings, 'FAVITUDE_PAGE_CACHE', {})}
+    return _config
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    global _config
+    if setting == 'FAVITUDE_PAGE_CACHE':
+        _config = None
+
+
+def get_cache():
+    return caches[get_config()['ALIAS']]
+
+
+@functools.lru_cache(maxsize=None)
+def _deployed_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short=12', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+@functools.lru_cache(maxsize=None)
+def _process_token():
+    return f'start-{time.time_ns():x}'
+
+
+def build_hash():
+    """
+    Identifies the deployed code: the configured BUILD_HASH, the git HEAD, or failing both a
+    token fixed when this process started (so at worst each restart starts a fresh cache).
+    """
+    return get_config()['BUILD_HASH'] or _deployed_revision() or _process_token()
+
+
+def gallery_version():
+    return get_cache().get_or_set(GALLERY_VERSION_KEY, time.time_ns, timeout=None)
+
+
+@receiver(post_save, sender=GalleryItem)
+@receiver(post_delete, sender=GalleryItem)
+def _bump_gallery_version(**kwargs):
+    get_cache().set(GALLERY_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def version():
+    return f'{build_hash()}.{gallery_version()}'
+
+
+def page_cache(request):
+    """
+    Context processor exposing the fragment cache settings as ``page_cache``. The version is
+    only looked up by templates that use it.
+    """
+    config = get_config()
+    return {'page_cache': {
+        # Fragments kept for 0 seconds are rendered every time
+        'timeout': config['TIMEOUT'] if config['ENABLED'] else 0,
+        'alias': config['ALIAS'],
+        'version': SimpleLazyObject(version),
+    }}
+
+
+def _cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # A page that used {% csrf_token %} holds this visitor's token
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cached_page(view):
+    """
+    Serves anonymous GET and HEAD requests for ``view`` from the page cache, keyed by path,
+    query string and version. Other requests run the view as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        config = get_config()
+        if not config['ENABLED'] or request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            response = view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+
+        cache = get_cache()
+        key = f'favitude:page:{version()}:{request.get_full_path()}'
+        response = cache.get(key)
+        if response is not None:
+            return response
+        response = view(request, *args, **kwargs)
+        patch_vary_headers(response, ('Cookie',))
+        if request.method == 'GET' and _cacheable(request, response):
+            cache.set(key, response, config['TIMEOUT'])
+        return response
+
+    return wrapper
@@ -0,0 +1,217 @@
+"""
+Output profiles: which files a favicon bundle contains.
+
+A profile is a list of outputs (PNG files, an ICO with several entries, the SVG for vector
+sources, and the web app manifest and browserconfig that point at the PNGs). plan_sizes()
+reduces a profile to the distinct raster sizes it needs, so each size is rendered once and
+shared by every file that uses it, however many outputs a profile adds.
+
+Besides the named profiles, ``custom`` takes a list of sizes: one PNG per size plus an ICO of
+those that fit in one.
+"""
+import functools
+import json
+import re
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+from . import instrument, optimize
+
+DEFAULT_PROFILE = 'classic'
+CUSTOM_PROFILE = 'custom'
+
+# Bounds for custom sizes; the ICO format stops at 256
+MIN_SIZE = 16
+MAX_SIZE = 1024
+MAX_ICO_SIZE = 256
+MAX_CUSTOM_SIZES = 12
+
+OPAQUE_BACKGROUND = (255, 255, 255, 255)
+
+
+class Output:
+    """
+    One file in a bundle. ``sizes`` are the raster frames it is built from; ``opaque`` PNGs
+    are flattened onto ``OPAQUE_BACKGROUND`` (iOS renders transparency in touch icons black).
+    """
+
+    def __init__(self, kind, filename, sizes=(), opaque=False):
+        self.kind = kind
+        self.filename = filename
+        self.sizes = [(side, side) for side in sizes]
+        self.opaque = opaque
+
+
+def png(filename, side, opaque=False):
+    return Output('png', filename, [side], opaque=opaque)
+
+
+def square_png(side):
+    return png(f'favicon-{side}x{side}.png', side)
+
+
+CLASSIC_ICO_SIZES = [(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
+CLASSIC_PNG_SIZES = [(16, 16), (32, 32), (96, 96), (256, 256)]
+
+SVG = Output('svg', 'favicon.svg')
+MANIFEST = Output('manifest', 'site.webmanifest')
+BROWSERCONFIG = Output('browserconfig', 'browserconfig.xml')
+
+MODERN = [
+    Output('ico', 'favicon.ico', [16, 32, 48]),
+    square_png(32),
+    png('apple-touch-icon.png', 180, opaque=True),
+    SVG,
+]
+
+PROFILES = {
+    'classic': [
+        Output('ico', 'favicon.ico', [w for w, _ in CLASSIC_ICO_SIZES]),
+        *[square_png(w) for w, _ in CLASSIC_PNG_SIZES],
+        SVG,
+    ],
+    'modern': MODERN,
+    'pwa': MODERN + [
+        png('android-chrome-192x192.png', 192),
+        png('android-chrome-512x512.png', 512),
+        png('mstile-150x150.png', 150),
+        MANIFEST,
+        BROWSERCONFIG,
+    ],
+}
+
+PROFILE_CHOICES = [*PROFILES, CUSTOM_PROFILE]
+
+
+def parse_sizes(value):
+    """
+    Canonical tuple of custom sizes from "16, 32 180" or a list of numbers. Raises ValueError.
+    """
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = [part for part in re.split(r'[\s,]+', value) if part]
+    try:
+        sizes = sorted({int(side) for side in value})
+    except (TypeError, ValueError):
+        raise ValueError('Custom sizes must be whole numbers of pixels.')
+    if len(sizes) > MAX_CUSTOM_SIZES:
+        raise ValueError(f'At most {MAX_CUSTOM_SIZES} custom sizes can be requested.')
+    if sizes[0] < MIN_SIZE or sizes[-1] > MAX_SIZE:
+        raise ValueError(f'Custom sizes must be between {MIN_SIZE} and {MAX_SIZE} pixels.')
+    return tuple(sizes)
+
+
+def normalize_profile(profile, sizes=None):
+    """
+    Returns the canonical (profile, sizes) pair. Sizes without a profile mean ``custom``.
+    Raises ValueError for an unknown profile or bad sizes.
+    """
+    sizes = parse_sizes(sizes)
+    if not profile:
+        profile = CUSTOM_PROFILE if sizes else DEFAULT_PROFILE
+    if profile == CUSTOM_PROFILE:
+        if not sizes:
+            raise ValueError('The custom profile needs at least one size.')
+        return profile, sizes
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown output profile {profile!r}.')
+    # Named profiles have fixed contents
+    return profile, ()
+
+
+@functools.lru_cache(maxsize=64)
+def get_outputs(profile=DEFAULT_PROFILE, sizes=()):
+    """
+    The outputs of a normalized (profile, sizes) pair.
+    """
+    if profile != CUSTOM_PROFILE:
+        return PROFILES[profile]
+    ico_sides = [side for side in sizes if side <= MAX_ICO_SIZE]
+    outputs = [square_png(side) for side in sizes]
+    if ico_sides:
+        outputs.insert(0, Output('ico', 'favicon.ico', ico_sides))
+    return outputs + [SVG]
+
+
+def plan_sizes(outputs):
+    """
+    The distinct raster sizes needed by ``outputs``, largest first.
+    """
+    sizes = {size for output in outputs for size in output.sizes}
+    return sorted(sizes, reverse=True)
+
+
+def _png_links(outputs):
+    return [output for output in outputs if output.kind == 'png']
+
+
+def webmanifest(outputs, meta):
+    icons = [
+        {'src': f'/{output.filename}', 'sizes': '{}x{}'.format(*output.sizes[0]), 'type': 'image/png'}
+        for output in _png_links(outputs) if output.filename.startswith('android-chrome-')
+    ]
+    color = meta.get('theme_color') or '#ffffff'
+    return json.dumps({
+        'name': meta.get('name', ''),
+        'short_name': meta.get('name', ''),
+        'icons': icons,
+        'theme_color': color,
+        'background_color': color,
+        'display': 'standalone',
+    }, indent=2)
+
+
+def browserconfig(outputs, meta):
+    tile = next((output for output in _png_links(outputs) if output.filename.startswith('mstile-')), None)
+    logo = f'<square150x150logo src="/{escape(tile.filename)}"/>' if tile else ''
+    color = escape(meta.get('theme_color') or '#ffffff')
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        f'<browserconfig><msapplication><tile>{logo}<TileColor>{color}</TileColor>'
+        '</tile></msapplication></browserconfig>\n'
+    )
+
+
+def _flatten(frame):
+    background = Image.new('RGBA', frame.size, OPAQUE_BACKGROUND)
+    background.alpha_composite(frame)
+    return background
+
+
+def members(outputs, frames, encoder, svg=None, meta=None):
+    """
+    (arcname, writer) pairs for utils.iter_zip. ``frames`` maps every size from plan_sizes to
+    its RGBA frame and ``encoder`` is an optimize.FrameEncoder over them; ``svg`` is included
+    for vector sources only, and ``meta`` (name, theme_color) fills in the manifests.
+    """
+    meta = meta or {}
+    for output in outputs:
+        if output.kind == 'ico':
+            yield output.filename, functools.partial(_write, encoder.ico, output.sizes)
+        elif output.kind == 'png' and output.opaque:
+            yield output.filename, functools.partial(_write_flat, frames[output.sizes[0]])
+        elif output.kind == 'png':
+            yield output.filename, functools.partial(_write, encoder.png, output.sizes[0])
+        elif output.kind == 'svg':
+            if svg is not None:
+                yield output.filename, functools.partial(_write_text, svg)
+        elif output.kind == 'manifest':
+            yield output.filename, functools.partial(_write_text, webmanifest(outputs, meta))
+        elif output.kind == 'browserconfig':
+            yield output.filename, functools.partial(_write_text, browserconfig(outputs, meta))
+
+
+def _write(encode, arg, dest):
+    dest.write(encode(arg))
+
+
+def _write_flat(frame, dest):
+    with instrument.span('encode_png'):
+        data = optimize.encode_best_png(_flatten(frame))
+    dest.write(data)
+
+
+def _write_text(text, dest):
+    dest.write(text.encode('utf-8'))
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.urls import reverse
+from rest_framework import serializers
+
+from . import fonts, profiles, utils
+from .models import generateImage
+
+
+class UploadedImageField(serializers.ImageField):
+    """
+    ImageField that trusts the format uploads.FaviconUploadHandler sniffed instead of decoding
+    the upload a second time; ingest validates the pixels when the image is rendered.
+    """
+
+    def to_internal_value(self, data):
+        if getattr(data, 'image_format', None):
+            return serializers.FileField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+
+class OutputProfileSerializer(serializers.Serializer):
+    """
+    The output profile fields shared by every render request; see profiles.normalize_profile.
+    """
+    profile = serializers.ChoiceField(choices=profiles.PROFILE_CHOICES, required=False, allow_blank=True, default='')
+    sizes = serializers.ListField(
+        child=serializers.IntegerField(min_value=profiles.MIN_SIZE, max_value=profiles.MAX_SIZE),
+        required=False, default=list, max_length=profiles.MAX_CUSTOM_SIZES,
+    )
+
+    def validate(self, attrs):
+        try:
+            profiles.normalize_profile(attrs.get('profile'), attrs.get('sizes'))
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return attrs
+
+
+class TextJobSerializer(OutputProfileSerializer):
+    text = serializers.CharField(max_length=64)
+    font_size = serializers.CharField(required=False, allow_blank=True, default='')
+    bg_shape = serializers.ChoiceField(choices=utils.BG_SHAPES, default='square')
+    font_color = serializers.CharField(required=False, default='#000000')
+    bg_color = serializers.CharField(required=False, default='#ffffff')
+    font_type = serializers.CharField(required=False, default=fonts.DEFAULT_FAMILY, max_length=fonts.MAX_NAME_LENGTH)
+
+    def validate(self, attrs):
+        # Reject bad sizes and colors now rather than as a failed job later
+        try:
+            utils.normalize_text_params(**attrs)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return attrs
+
+
+class BatchTextItemSerializer(TextJobSerializer):
+    name = serializers.CharField(required=False, allow_blank=True, max_length=64)
+
+    def validate(self, attrs):
+        name = attrs.pop('name', '')
+        attrs = super().validate(attrs)
+        attrs['name'] = name
+        return attrs
+
+
+class BatchTextSerializer(serializers.Serializer):
+    items = BatchTextItemSerializer(many=True, allow_empty=False, max_length=settings.FAVITUDE_BATCH_MAX_ITEMS)
+
+
+class BatchImageSerializer(OutputProfileSerializer):
+    images = serializers.ListField(
+        child=UploadedImageField(), allow_empty=False, max_length=settings.FAVITUDE_BATCH_MAX_ITEMS
+    )
+
+
+class ImageJobSerializer(OutputProfileSerializer):
+    image = UploadedImageField()
+
+
+class JobSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(source='job_id', read_only=True)
+    status_url = serializers.SerializerMethodField()
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = generateImage
+        fields = ['id', 'kind', 'status', 'error', 'created_at', 'started_at', 'finished_at', 'status_url', 'result_url']
+
+    def _absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_status_url(self, job):
+        return self._absolute(reverse('Hill:api_job_detail', args=[job.job_id]))
+
+    def get_result_url(self, job):
+        if job.status != generateImage.STATUS_SUCCEEDED:
+            return None
+        return self._absolute(reverse('Hill:api_job_result', args=[job.job_id]))
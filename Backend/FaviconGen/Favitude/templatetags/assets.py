@@ -0,0 +1,43 @@
+from django import template
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from Favitude import assets
+
+register = template.Library()
+
+MODERN_TYPES = ('image/avif', 'image/webp')
+
+
+def _srcset(entries):
+    return ', '.join(f'{static(name)} {width}w' for name, width in entries)
+
+
+@register.simple_tag
+def picture(path, alt='', sizes=None, loading='lazy', **attrs):
+    """
+    ``<picture>`` markup for the static image ``path``: AVIF and WebP sources, then an <img>
+    with downscaled copies in the original format, each as a srcset built by build_assets.
+    Other keyword arguments become attributes of the <img>:
+
+        {% picture 'images/images-home/convert.png' alt='Convert' sizes='(max-width: 600px) 90vw, 400px' class='tool' %}
+
+    Images build_assets has not processed get a plain <img>.
+    """
+    entry = assets.get_variants(path)
+    attrs = {'alt': alt, 'loading': loading, 'decoding': 'async', **attrs}
+    if entry is None:
+        return format_html('<img src="{}"{}>', static(path), flatatt(attrs))
+
+    sizes = sizes or f'(max-width: {entry["width"]}px) 100vw, {entry["width"]}px'
+    # Browsers take the first source they support, so the smallest format goes first
+    modern = [mime for mime in MODERN_TYPES if mime in entry['sources']]
+    fallback = next(entries for mime, entries in entry['sources'].items() if mime not in MODERN_TYPES)
+    attrs.update(srcset=_srcset(fallback), sizes=sizes)
+    return format_html(
+        '<picture>{}<img src="{}"{}></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">',
+                         ((mime, _srcset(entry['sources'][mime]), sizes) for mime in modern)),
+        static(path), flatatt(attrs),
+    )
@@ -1,3 +1,927 @@
-from django.test import TestCase
+import functools
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from PIL import Image, ImageFile
+
+from . import assets, asyncviews, batch, cache, executor, fonts, gallery, ingest, instrument, jobs, middleware, optimize, profiles, uploads, utils, views
+from .models import GalleryItem, generateImage
+
+email_index_migration = importlib.import_module('Favitude.migrations.0004_auth_user_email_ci_index')
+
+
+def png_bytes(side=64, color='red'):
+    buf = io.BytesIO()
+    Image.new('RGB', (side, side), color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def noise_png_bytes(side):
+    # Random pixels barely compress, so the file size tracks the side
+    buf = io.BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class LocMemRenderCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used_entries_past_max_bytes(self):
+        render_cache = cache.LocMemRenderCache(max_bytes=30)
+        render_cache.set('a', b'a' * 10)
+        render_cache.set('b', b'b' * 10)
+        render_cache.set('c', b'c' * 10)
+        # Reading 'a' makes 'b' the oldest entry
+        self.assertEqual(render_cache.get('a'), b'a' * 10)
+        render_cache.set('d', b'd' * 10)
+        self.assertIsNone(render_cache.get('b'))
+        self.assertEqual(render_cache.get('a'), b'a' * 10)
+        self.assertEqual(render_cache.stats()['bytes'], 30)
+
+    def test_evicts_as_many_entries_as_a_large_value_needs(self):
+        render_cache = cache.LocMemRenderCache(max_bytes=30)
+        for key in 'abc':
+            render_cache.set(key, key.encode() * 10)
+        render_cache.set('big', b'x' * 25)
+        self.assertEqual(render_cache.stats()['entries'], 1)
+        self.assertEqual(render_cache.stats()['bytes'], 25)
+
+    def test_replacing_a_key_accounts_for_the_old_value(self):
+        render_cache = cache.LocMemRenderCache(max_bytes=30)
+        render_cache.set('a', b'a' * 20)
+        render_cache.set('a', b'a' * 5)
+        self.assertEqual(render_cache.stats()['bytes'], 5)
+
+    def test_skips_a_value_larger_than_the_cache(self):
+        render_cache = cache.LocMemRenderCache(max_bytes=30)
+        render_cache.set('a', b'a' * 10)
+        render_cache.set('huge', b'x' * 31)
+        self.assertIsNone(render_cache.get('huge'))
+        self.assertEqual(render_cache.get('a'), b'a' * 10)
+
+    def test_counts_hits_and_misses(self):
+        render_cache = cache.LocMemRenderCache()
+        render_cache.get('a')
+        render_cache.set('a', b'a')
+        render_cache.get('a')
+        stats = render_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+class RenderCacheExpiryTests(SimpleTestCase):
+    """
+    The TTL and size cap the upload cache relies on, in memory and on disk.
+    """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+
+    def test_locmem_entries_expire_after_their_timeout(self):
+        render_cache = cache.LocMemRenderCache(timeout=60)
+        render_cache.set('a', b'a' * 10)
+        with mock.patch.object(cache.time, 'monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(render_cache.get('a'))
+        self.assertEqual(render_cache.stats()['bytes'], 0)
+
+    def test_filesystem_round_trip_and_expiry(self):
+        render_cache = cache.FileSystemRenderCache(location=self.location, timeout=60)
+        render_cache.set('ab12', b'bundle')
+        self.assertEqual(render_cache.get('ab12'), b'bundle')
+        with mock.patch.object(cache.time, 'time', return_value=time.time() + 61):
+            self.assertIsNone(render_cache.get('ab12'))
+        self.assertFalse(os.path.exists(render_cache._path('ab12')))
+
+    def test_filesystem_prunes_least_recently_read_files(self):
+        render_cache = cache.FileSystemRenderCache(location=self.location, max_bytes=100)
+        for n, key in enumerate(['aa01', 'bb02', 'cc03']):
+            render_cache.set(key, b'x' * 30)
+            os.utime(render_cache._path(key), (1000 + n, 0))
+        # Reading 'aa01' bumps its atime past the others
+        render_cache.get('aa01')
+        render_cache.set('dd04', b'x' * 30)
+        self.assertIsNone(render_cache.get('bb02'))
+        self.assertEqual(render_cache.get('aa01'), b'x' * 30)
+        self.assertEqual(render_cache.get('dd04'), b'x' * 30)
+
+
+class FitFontSizeTests(SimpleTestCase):
+    """
+    fit_font_size against the linear search it replaced, on Pillow's built-in font.
+    """
+
+    def linear_fit(self, text, max_extent=fonts.SAFE_AREA):
+        for size in range(fonts.MAX_FONT_SIZE, fonts.MIN_FONT_SIZE - 1, -1):
+            if fonts._fits(None, text, size, max_extent):
+                return size
+        return None
+
+    def test_matches_a_linear_search(self):
+        for text in ['A', 'Hi', 'Favitude', 'WWWWWWWWWWWW']:
+            with self.subTest(text=text):
+                self.assertEqual(fonts.fit_font_size(None, text), self.linear_fit(text))
+
+    def test_matches_a_linear_search_in_a_small_box(self):
+        self.assertEqual(fonts.fit_font_size(None, 'Hello', max_extent=100),
+                         self.linear_fit('Hello', max_extent=100))
+
+    def test_short_text_gets_the_largest_size(self):
+        self.assertEqual(fonts.fit_font_size(None, '.'), fonts.MAX_FONT_SIZE)
+
+    def test_returns_none_when_even_the_smallest_size_overflows(self):
+        self.assertIsNone(fonts.fit_font_size(None, 'W' * 200))
+
+
+class FontRegistryTests(SimpleTestCase):
+    """
+    A registry over a private font directory holding only DejaVu Sans.
+    """
+
+    def setUp(self):
+        installed = fonts.registry.resolve('DejaVu Sans')
+        if installed is None:
+            self.skipTest('DejaVu Sans is not installed')
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.font_dir = os.path.join(self.root, 'fonts')
+        os.mkdir(self.font_dir)
+        self.font_path = os.path.join(self.font_dir, 'DejaVuSans.ttf')
+        shutil.copy(installed, self.font_path)
+        self.index_path = os.path.join(self.root, 'index.json')
+
+    def registry(self):
+        return fonts.FontRegistry(font_dirs=[self.font_dir], index_path=self.index_path)
+
+    def test_resolves_family_names_and_file_stems(self):
+        registry = self.registry()
+        self.assertEqual(registry.resolve('DejaVu Sans'), self.font_path)
+        self.assertEqual(registry.resolve('dejavusans'), self.font_path)
+
+    def test_falls_back_through_the_font_map(self):
+        # No Arial installed: its metric-compatible stand-in answers
+        self.assertEqual(self.registry().resolve('Arial'), self.font_path)
+
+    def test_a_missing_name_means_the_default_family(self):
+        registry = self.registry()
+        self.assertEqual(registry.resolve(None), registry.resolve(fonts.DEFAULT_FAMILY))
+        self.assertEqual(registry.resolve(''), self.font_path)
+
+    def test_only_hits_are_memoized(self):
+        registry = self.registry()
+        self.assertIsNone(registry.resolve('No Such Font'))
+        registry.resolve('Arial')
+        self.assertEqual(list(registry._resolved), ['Arial'])
+
+    def test_a_second_registry_reuses_the_saved_index(self):
+        self.registry().load()
+        registry = self.registry()
+        with mock.patch.object(fonts.FontRegistry, '_scan', side_effect=AssertionError('rescanned')):
+            self.assertEqual(registry.resolve('DejaVu Sans'), self.font_path)
+
+
+class RenderExecutorTests(SimpleTestCase):
+    """
+    Backpressure and timeouts on a one-worker thread pool with no wait queue.
+    """
+
+    def setUp(self):
+        self.executor = executor.RenderExecutor('thread', max_workers=1, max_queue=0, timeout=0.2, retry_after=7)
+        self.release = threading.Event()
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(self.release.set)
+
+    def test_refuses_a_job_when_every_slot_is_taken(self):
+        self.executor.submit(self.release.wait)
+        with self.assertRaises(executor.RenderQueueFull) as raised:
+            self.executor.submit(sum, [])
+        self.assertEqual(raised.exception.retry_after, 7)
+
+    def test_raises_render_timeout_for_a_slow_job(self):
+        with self.assertRaises(executor.RenderTimeout) as raised:
+            self.executor.run(self.release.wait)
+        self.assertEqual(raised.exception.retry_after, 7)
+
+    def test_a_timed_out_job_keeps_its_slot_until_it_finishes(self):
+        with self.assertRaises(executor.RenderTimeout):
+            self.executor.run(self.release.wait)
+        with self.assertRaises(executor.RenderQueueFull):
+            self.executor.submit(sum, [])
+        self.release.set()
+        self.assertTrue(self.executor._slots.acquire(timeout=5))
+
+    def test_arun_raises_render_timeout(self):
+        with self.assertRaises(executor.RenderTimeout):
+            async_to_sync(self.executor.arun)(self.release.wait)
+
+    def test_a_bundle_gives_its_slot_back_before_it_is_read(self):
+        with mock.patch.object(executor, 'get_render_executor', return_value=self.executor):
+            chunks = utils.stream_favicon_from_text(f'slot-{time.time_ns()}', 0, 'square', '#ffffff', '#000000')
+            # A client that has not read anything yet holds no worker
+            self.assertTrue(self.executor._slots.acquire(timeout=5))
+            self.executor._slots.release()
+            data = b''.join(chunks)
+        self.assertIn('favicon.ico', zipfile.ZipFile(io.BytesIO(data)).namelist())
+
+
+class RenderBusyViewTests(TestCase):
+    """
+    A full queue or a timed out render answers 503 with Retry-After.
+    """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('busy', 'busy@example.com', 'Pa55word!'))
+
+    def test_image_gen_answers_503(self):
+        for error in [executor.RenderQueueFull(7), executor.RenderTimeout('slow', 7)]:
+            with self.subTest(error=type(error).__name__), \
+                    mock.patch('Favitude.utils.astream_favicon_from_image', side_effect=error):
+                response = self.client.post('/imageGen/', {'image': SimpleUploadedFile('logo.png', png_bytes())})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '7')
+
+
+class JobQueueTests(TestCase):
+
+    def enqueue(self, text='A'):
+        return jobs.enqueue_text_job(None, {'text': text, 'bg_shape': 'circle', 'font_color': '#fff', 'bg_color': '#00f'})
+
+    def test_claims_the_oldest_queued_job_once(self):
+        first, second = self.enqueue('A'), self.enqueue('B')
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual(claimed.status, generateImage.STATUS_RUNNING)
+        self.assertIsNotNone(claimed.started_at)
+        self.assertEqual(jobs.claim_next_job().pk, second.pk)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_requeues_only_jobs_running_past_the_cutoff(self):
+        stale, fresh = self.enqueue('A'), self.enqueue('B')
+        jobs.claim_next_job()
+        jobs.claim_next_job()
+        generateImage.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(minutes=20))
+        self.assertEqual(jobs.requeue_stale_jobs(timedelta(minutes=10)), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.started_at), (generateImage.STATUS_QUEUED, None))
+        self.assertEqual(fresh.status, generateImage.STATUS_RUNNING)
+
+    def test_run_job_stores_the_bundle(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enqueue()
+        with override_settings(MEDIA_ROOT=media_root):
+            job = jobs.run_job(jobs.claim_next_job())
+        self.assertEqual(job.status, generateImage.STATUS_SUCCEEDED)
+        with zipfile.ZipFile(os.path.join(media_root, job.result.name)) as bundle:
+            self.assertIn('favicon.ico', bundle.namelist())
+
+    def test_worker_keeps_requeueing_while_it_polls(self):
+        # Three idle polls, then stop the loop
+        with mock.patch.object(jobs, 'claim_next_job', side_effect=[None, None, None, KeyboardInterrupt]), \
+                mock.patch.object(jobs, 'requeue_stale_jobs', return_value=0) as requeue, \
+                mock.patch('time.sleep'), self.assertRaises(KeyboardInterrupt):
+            call_command('run_favicon_worker', requeue_interval=0, stdout=io.StringIO())
+        self.assertEqual(requeue.call_count, 4)
+
+
+class BatchTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('agency', 'agency@example.com', 'Pa55word!'))
+
+    def text_specs(self, count):
+        return [{'text': f'T{n}', 'font_size': 0, 'bg_shape': 'circle', 'font_color': '#fff', 'bg_color': '#00f'}
+                for n in range(count)]
+
+    def post_texts(self, items):
+        return self.client.post('/api/batch/', {'items': items}, content_type='application/json')
+
+    def test_rejects_more_texts_than_the_limit(self):
+        response = self.post_texts(self.text_specs(settings.FAVITUDE_BATCH_MAX_ITEMS + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.json())
+
+    def test_rejects_an_empty_batch(self):
+        self.assertEqual(self.post_texts([]).status_code, 400)
+
+    def test_rejects_more_images_than_the_limit(self):
+        images = [SimpleUploadedFile(f'logo{n}.png', png_bytes(16)) for n in range(settings.FAVITUDE_BATCH_MAX_ITEMS + 1)]
+        response = self.client.post('/api/batch/', {'images': images})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('images', response.json())
+
+    def test_keeps_at_most_one_render_per_worker_in_flight(self):
+        render_executor = executor.RenderExecutor('thread', max_workers=2)
+        self.addCleanup(render_executor.shutdown)
+        items = batch.text_items(self.text_specs(6))
+        for item in items:
+            item.render_cache = None
+        renderer = batch.BatchRenderer(items)
+        renderer.executor = render_executor
+        in_flight = []
+        submit = render_executor.submit
+
+        def record(*args, **kwargs):
+            in_flight.append(len(renderer._in_flight))
+            return submit(*args, **kwargs)
+
+        with mock.patch.object(render_executor, 'submit', side_effect=record):
+            renderer.start()
+            names = zipfile.ZipFile(io.BytesIO(b''.join(renderer.stream()))).namelist()
+        self.assertEqual(len(in_flight), 6)
+        self.assertLess(max(in_flight), renderer.window)
+        self.assertIn('06-t5/favicon.ico', names)
+
+    def test_answers_503_when_the_executor_has_no_room(self):
+        render_executor = executor.RenderExecutor('thread', max_workers=1, max_queue=0, retry_after=7)
+        release = threading.Event()
+        self.addCleanup(render_executor.shutdown)
+        self.addCleanup(release.set)
+        render_executor.submit(release.wait)
+        with mock.patch.object(executor, 'get_render_executor', return_value=render_executor):
+            response = self.post_texts(self.text_specs(2))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+
+def inflate_png_header(data, width, height):
+    # Rewrites the IHDR dimensions (and its CRC) of a PNG, leaving the pixel data alone
+    ihdr = bytearray(data[12:29])
+    ihdr[4:12] = struct.pack('>II', width, height)
+    return data[:12] + bytes(ihdr) + struct.pack('>I', zlib.crc32(ihdr)) + data[33:]
+
+
+class IngestTests(SimpleTestCase):
+
+    def test_rejects_a_decompression_bomb_from_its_header(self):
+        # Over MAX_PIXELS but under Pillow's own bomb check, so the guard is what refuses it
+        bomb = io.BytesIO(inflate_png_header(png_bytes(), 8000, 8000))
+        with mock.patch.object(ImageFile.ImageFile, 'load', side_effect=AssertionError('decoded')), \
+                self.assertRaisesMessage(ingest.ImageRejected, '8000x8000'):
+            ingest.open_upload(bomb, (256, 256))
+
+    @override_settings(FAVITUDE_UPLOAD_LIMITS={'MAX_DECODE_BYTES': 1000 * 1000})
+    def test_rejects_an_image_over_the_decode_budget(self):
+        with self.assertRaisesMessage(ingest.ImageRejected, 'memory budget'):
+            ingest.open_upload(io.BytesIO(png_bytes(600)), (256, 256))
+
+    def test_decodes_a_large_jpeg_near_the_target_size(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (4000, 4000), 'red').save(buf, 'JPEG')
+        buf.seek(0)
+        img = ingest.open_upload(buf, (64, 64))
+        self.assertLessEqual(img.width, 4 * 64)
+        self.assertGreaterEqual(img.width, 2 * 64)
+
+    def test_rejects_bytes_that_are_not_an_image(self):
+        with self.assertRaises(ingest.ImageRejected):
+            ingest.open_upload(io.BytesIO(b'not an image at all'), (256, 256))
+
+
+class BundleTests(SimpleTestCase):
+
+    def test_identical_renders_are_byte_identical(self):
+        params = utils.normalize_text_params('Hi', 0, 'circle', '#ffffff', '#ff0000')
+        first = utils._bundle_bytes(functools.partial(utils._render_favicon_from_text, **params))
+        # Entries carry a fixed timestamp, not the time of the render
+        with mock.patch('time.localtime', return_value=time.localtime(time.time() + 86400)):
+            second = utils._bundle_bytes(functools.partial(utils._render_favicon_from_text, **params))
+        self.assertEqual(first, second)
+        for info in zipfile.ZipFile(io.BytesIO(first)).infolist():
+            self.assertEqual(info.date_time, utils.ZIP_DATE_TIME)
+
+
+class GalleryPrerenderTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def prerender(self, slug, **params):
+        item = GalleryItem.objects.create(slug=slug, title=slug, kind=GalleryItem.KIND_TEXT, params={
+            'text': 'Hi', 'font_size': 0, 'bg_shape': 'circle', 'font_color': '#fff', 'bg_color': '#f00', **params,
+        })
+        self.assertTrue(gallery.prerender_item(item))
+        with default_storage.open(item.preview.name) as f:
+            return item, Image.open(f).size
+
+    def test_classic_items_preview_their_96px_png(self):
+        _, size = self.prerender('classic')
+        self.assertEqual(size, (96, 96))
+
+    def test_profiles_without_a_96px_png_preview_their_largest(self):
+        for profile, sizes, expected in [('modern', None, (180, 180)), ('pwa', None, (512, 512)),
+                                         ('custom', [16, 64], (64, 64))]:
+            with self.subTest(profile=profile):
+                _, size = self.prerender(profile, profile=profile, sizes=sizes)
+                self.assertEqual(size, expected)
+
+    def test_identical_items_share_stored_files(self):
+        first, _ = self.prerender('first')
+        second, _ = self.prerender('second')
+        self.assertEqual(first.bundle.name, second.bundle.name)
+        self.assertEqual(first.preview.name, second.preview.name)
+
+
+class RenderTextTests(TestCase):
+    """
+    The public, cacheable GET URL that gen_from_text hands text renders off to.
+    """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('text', 'text@example.com', 'Pa55word!'))
+        response = self.client.post('/gen_from_text/', {'text': 'Hi', 'Background': 'circle',
+                                                        'fcolor': '#ffffff', 'bcolor': '#0000ff'})
+        self.assertEqual(response.status_code, 302)
+        self.url = response['Location']
+        # The URL is public: nothing below relies on the login
+        self.client.logout()
+
+    def test_serves_a_publicly_cacheable_bundle_with_an_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+        data = b''.join(response.streaming_content)
+        self.assertIn('favicon.ico', zipfile.ZipFile(io.BytesIO(data)).namelist())
+
+    def test_answers_a_revalidation_with_304_without_rendering(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch('Favitude.utils.astream_favicon_from_text', side_effect=AssertionError('rendered')):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_a_changed_etag_renders_again(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_a_failed_render_is_an_uncacheable_error(self):
+        with mock.patch('Favitude.utils.astream_favicon_from_text', side_effect=OSError('broken font')), \
+                self.assertLogs('Favitude.views', 'ERROR'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+
+    def test_a_busy_renderer_answers_503(self):
+        with mock.patch('Favitude.utils.astream_favicon_from_text', side_effect=executor.RenderTimeout('slow', 7)):
+            response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '7'))
+
+    def test_a_tampered_url_is_not_found(self):
+        self.assertEqual(self.client.get(self.url.rstrip('/') + 'x/').status_code, 404)
+
+
+def anti_aliased_frame():
+    # 256 flat colours in large blocks plus 44 single pixels a shade off some of them
+    img = Image.new('RGBA', (64, 64))
+    for n in range(256):
+        img.paste((n, 255 - n, 128, 255), ((n % 16) * 4, (n // 16) * 4, (n % 16) * 4 + 4, (n // 16) * 4 + 4))
+    for n in range(44):
+        img.putpixel(((n % 16) * 4, (n // 16) * 4), (n + 1, 255 - n, 129, 255))
+    return img
+
+
+class PngOptimizerTests(SimpleTestCase):
+
+    def decode(self, data):
+        return Image.open(io.BytesIO(data)).convert('RGBA')
+
+    def test_output_is_lossless_by_default(self):
+        img = anti_aliased_frame()
+        self.assertEqual(optimize.get_quantize_tolerance(), 0)
+        self.assertIsNone(optimize.palette_image(img, optimize.get_quantize_tolerance()))
+        self.assertEqual(self.decode(optimize.encode_best_png(img)).tobytes(), img.tobytes())
+
+    def test_palettes_a_frame_with_few_colours_losslessly(self):
+        img = Image.new('RGBA', (32, 32), (255, 0, 0, 255))
+        img.paste((0, 0, 255, 128), (8, 8, 24, 24))
+        data = optimize.encode_best_png(img)
+        self.assertEqual(Image.open(io.BytesIO(data)).mode, 'P')
+        self.assertEqual(self.decode(data).tobytes(), img.tobytes())
+
+    @override_settings(FAVITUDE_PNG_QUANTIZE_TOLERANCE=2)
+    def test_a_tolerance_opts_in_to_lossy_palettes(self):
+        img = anti_aliased_frame()
+        paletted, _ = optimize.palette_image(img, optimize.get_quantize_tolerance())
+        decoded = paletted.convert('RGBA')
+        self.assertNotEqual(decoded.tobytes(), img.tobytes())
+        for a, b in zip(decoded.getdata(), img.getdata()):
+            self.assertLessEqual(max(abs(x - y) for x, y in zip(a, b)), 2)
+
+
+class ProfileTests(SimpleTestCase):
+
+    def test_parse_sizes_accepts_strings_and_lists(self):
+        self.assertEqual(profiles.parse_sizes('180, 32 16,32'), (16, 32, 180))
+        self.assertEqual(profiles.parse_sizes([64, '16']), (16, 64))
+        self.assertEqual(profiles.parse_sizes(''), ())
+        self.assertEqual(profiles.parse_sizes(None), ())
+
+    def test_parse_sizes_rejects_bad_input(self):
+        for value in ['16, big', '8', str(profiles.MAX_SIZE + 1), list(range(16, 16 + profiles.MAX_CUSTOM_SIZES + 1))]:
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                profiles.parse_sizes(value)
+
+    def test_normalize_profile(self):
+        self.assertEqual(profiles.normalize_profile(None), (profiles.DEFAULT_PROFILE, ()))
+        self.assertEqual(profiles.normalize_profile(None, '32,16'), ('custom', (16, 32)))
+        # Named profiles have fixed contents, so stray sizes do not split their cache keys
+        self.assertEqual(profiles.normalize_profile('pwa', '32'), ('pwa', ()))
+        with self.assertRaises(ValueError):
+            profiles.normalize_profile('custom')
+        with self.assertRaises(ValueError):
+            profiles.normalize_profile('retro')
+
+    def test_custom_profile_puts_only_ico_sizes_in_the_ico(self):
+        outputs = profiles.get_outputs('custom', (16, 300))
+        self.assertEqual([output.filename for output in outputs],
+                         ['favicon.ico', 'favicon-16x16.png', 'favicon-300x300.png', 'favicon.svg'])
+        self.assertEqual(outputs[0].sizes, [(16, 16)])
+
+    def test_plan_sizes_renders_each_size_once(self):
+        plan = profiles.plan_sizes(profiles.get_outputs('pwa'))
+        self.assertEqual(plan, sorted(set(plan), reverse=True))
+        self.assertEqual(plan[0], (512, 512))
+        self.assertIn((180, 180), plan)
+
+    def test_pwa_bundle_contents(self):
+        params = utils.normalize_text_params('Hi', 0, 'circle', '#ffffff', '#ff0000', profile='pwa')
+        data = utils._bundle_bytes(functools.partial(utils._render_favicon_from_text, **params))
+        bundle = zipfile.ZipFile(io.BytesIO(data))
+        names = set(bundle.namelist())
+        self.assertTrue({'favicon.ico', 'apple-touch-icon.png', 'android-chrome-512x512.png',
+                         'site.webmanifest', 'browserconfig.xml'} <= names)
+        manifest = json.loads(bundle.read('site.webmanifest'))
+        self.assertEqual([icon['sizes'] for icon in manifest['icons']], ['192x192', '512x512'])
+        # iOS shows transparency in touch icons as black
+        touch = Image.open(io.BytesIO(bundle.read('apple-touch-icon.png'))).convert('RGBA')
+        self.assertEqual(touch.getextrema()[3], (255, 255))
+
+
+@override_settings(FAVITUDE_INSTRUMENTATION={'ENABLED': True, 'SERVER_TIMING': True, 'SLOW_REQUEST_MS': 0})
+class ServerTimingTests(SimpleTestCase):
+
+    def respond(self, spans=('render',), **cache_control):
+        def view(request):
+            for name in spans:
+                with instrument.span(name):
+                    pass
+            response = HttpResponse()
+            patch_cache_control(response, **cache_control)
+            return response
+        return middleware.ServerTimingMiddleware(view)(RequestFactory().get('/'))
+
+    def test_private_responses_report_their_spans(self):
+        response = self.respond(private=True)
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_shared_cacheable_responses_get_no_header(self):
+        for cache_control in [{'public': True, 'max_age': 60}, {'s_maxage': 60}]:
+            with self.subTest(**cache_control):
+                self.assertNotIn('Server-Timing', self.respond(**cache_control))
+
+    def test_spans_still_reach_the_histograms_when_suppressed(self):
+        instrument.stats.reset()
+        self.respond(public=True)
+        self.assertIn('render', instrument.stats.snapshot())
+
+    def test_requests_without_spans_are_left_alone(self):
+        self.assertNotIn('Server-Timing', self.respond(spans=()))
+
+
+@override_settings(FAVITUDE_PAGE_CACHE={'ENABLED': True, 'ALIAS': 'pages', 'BUILD_HASH': 'test'})
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        caches['pages'].clear()
+        self.item = GalleryItem.objects.create(slug='cached', title='Cached Logo', kind=GalleryItem.KIND_TEXT,
+                                               params={'text': 'C'}, position=99)
+
+    def test_serves_anonymous_pages_from_the_cache(self):
+        first = self.client.get('/')
+        self.assertIn('Cookie', first['Vary'])
+        with self.assertNumQueries(0):
+            second = self.client.get('/')
+        self.assertEqual(second.content, first.content)
+
+    def test_saving_a_gallery_item_invalidates_pages(self):
+        self.assertContains(self.client.get('/'), 'Cached Logo')
+        self.item.title = 'Renamed Logo'
+        self.item.save()
+        self.assertContains(self.client.get('/'), 'Renamed Logo')
+
+    def test_deleting_a_gallery_item_invalidates_pages(self):
+        self.assertContains(self.client.get('/'), 'Cached Logo')
+        self.item.delete()
+        self.assertNotContains(self.client.get('/'), 'Cached Logo')
+
+    def test_saving_a_gallery_item_invalidates_fragments(self):
+        self.client.force_login(User.objects.create_user('fragments', 'fragments@example.com', 'Pa55word!'))
+        self.assertContains(self.client.get('/'), 'Cached Logo')
+        self.item.title = 'Renamed Logo'
+        self.item.save()
+        self.assertContains(self.client.get('/'), 'Renamed Logo')
+
+
+VARIANTS = {'images/a.png': {'width': 800, 'height': 400, 'sources': {
+    'image/png': [['variants/images/a-320w.png', 320], ['images/a.png', 800]],
+    'image/webp': [['variants/images/a-320w.webp', 320], ['variants/images/a-800w.webp', 800]],
+    'image/avif': [['variants/images/a-320w.avif', 320], ['variants/images/a-800w.avif', 800]],
+}}}
+
+
+class PictureTagTests(SimpleTestCase):
+
+    def render(self, tag, **context):
+        with mock.patch.object(assets, 'get_manifest', return_value=VARIANTS):
+            return Template('{% load assets %}' + tag).render(Context(context))
+
+    def test_offers_avif_then_webp_then_the_original(self):
+        html = self.render("{% picture 'images/a.png' alt='A' %}")
+        self.assertTrue(html.startswith('<picture><source type="image/avif" '
+                                        'srcset="/static/variants/images/a-320w.avif 320w, '
+                                        '/static/variants/images/a-800w.avif 800w"'))
+        self.assertLess(html.index('image/avif'), html.index('image/webp'))
+        self.assertIn('<img src="/static/images/a.png"', html)
+        self.assertIn('srcset="/static/variants/images/a-320w.png 320w, /static/images/a.png 800w"', html)
+        self.assertTrue(html.endswith('></picture>'))
+
+    def test_sizes_default_to_the_image_width(self):
+        html = self.render("{% picture 'images/a.png' %}")
+        self.assertEqual(html.count('sizes="(max-width: 800px) 100vw, 800px"'), 3)
+        html = self.render("{% picture 'images/a.png' sizes='50vw' %}")
+        self.assertEqual(html.count('sizes="50vw"'), 3)
+
+    def test_escapes_attributes_and_passes_extra_ones_to_the_img(self):
+        html = self.render("{% picture 'images/a.png' alt=alt class='hero' loading='eager' %}", alt='A <b>')
+        self.assertIn('alt="A &lt;b&gt;"', html)
+        self.assertIn('class="hero"', html)
+        self.assertIn('loading="eager"', html)
+
+    def test_images_without_variants_get_a_plain_img(self):
+        html = self.render("{% picture 'images/none.png' alt='n' %}")
+        self.assertEqual(html, '<img src="/static/images/none.png" alt="n" decoding="async" loading="lazy">')
+
+
+class AsyncStreamingTests(TestCase):
+    """
+    The generation views under ASGI (async_client) and WSGI (client).
+    """
+
+    def setUp(self):
+        user = User.objects.create_user('stream', 'stream@example.com', 'Pa55word!')
+        self.client.force_login(user)
+        self.async_client.force_login(user)
+
+    async def test_streams_async_chunks_under_asgi(self):
+        params = utils.normalize_text_params(f'S{time.time_ns()}', 0, 'circle', '#ffffff', '#0a0b0c')
+        url = views.text_render_url(params)
+        response = await self.async_client.get(url)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response]
+        # One per ZIP entry, plus the central directory
+        self.assertGreater(len(chunks), 3)
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(b''.join(chunks))).testzip())
+        # The repeat comes from the render cache in one piece
+        response = await self.async_client.get(url)
+        self.assertEqual([chunk async for chunk in response], [b''.join(chunks)])
+
+    def test_streams_sync_chunks_under_wsgi(self):
+        response = self.client.post('/imageGen/', {'image': SimpleUploadedFile('logo.png', noise_png_bytes(64))})
+        self.assertFalse(response.is_async)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(b''.join(chunks))).testzip())
+
+    async def test_closing_an_unread_response_holds_no_render_slot(self):
+        render_executor = executor.RenderExecutor('thread', max_workers=1, max_queue=0)
+        self.addCleanup(render_executor.shutdown)
+        with mock.patch.object(executor, 'get_render_executor', return_value=render_executor):
+            response = await self.async_client.post(
+                '/imageGen/', {'image': SimpleUploadedFile('logo.png', noise_png_bytes(64))})
+            self.assertEqual(response.status_code, 200)
+            # As a server does for a response it never sends (HEAD, a client gone)
+            response.close()
+            self.assertTrue(render_executor._slots.acquire(timeout=5))
+
+    async def test_stored_files_are_read_off_the_event_loop_and_closed(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        opened = []
+
+        def stream_file(request, response):
+            opened.append(response.file_to_stream)
+            return asyncviews.stream_file(request, response)
+
+        with override_settings(MEDIA_ROOT=media_root), mock.patch.object(views, 'stream_file', stream_file):
+            item = await GalleryItem.objects.acreate(slug='streamed', title='Streamed', kind=GalleryItem.KIND_TEXT,
+                                                     params={'text': 'S', 'font_size': 0, 'bg_shape': 'circle',
+                                                             'font_color': '#fff', 'bg_color': '#f00'})
+            response = await self.async_client.get('/gallery/streamed/preview.png')
+            self.assertTrue(response.is_async)
+            data = b''.join([chunk async for chunk in response])
+            await item.arefresh_from_db()
+            with default_storage.open(item.preview.name) as f:
+                self.assertEqual(data, f.read())
+        response.close()
+        self.assertTrue(opened[0].closed)
+
+
+class UploadHandlerTests(TestCase):
+    """
+    uploads.FaviconUploadHandler on requests built with RequestFactory, read the way the
+    views read them.
+    """
+
+    def upload(self, data, name='logo.png'):
+        request = RequestFactory().post('/imageGen/', {'image': SimpleUploadedFile(name, data)})
+        uploads.install(request)
+        return request
+
+    def test_accepts_an_image_with_its_format_and_digest(self):
+        data = png_bytes()
+        request = self.upload(data)
+        uploaded = request.FILES['image']
+        self.assertEqual(uploads.rejections(request), [])
+        self.assertEqual(uploaded.image_format, 'PNG')
+        self.assertEqual(uploaded.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(uploaded.read(), data)
+
+    def test_rejects_non_image_bytes_by_sniffing(self):
+        # Named and typed like a PNG; only the content gives it away
+        request = self.upload(b'<?php echo "not an image"; ?>' * 10)
+        self.assertNotIn('image', request.FILES)
+        self.assertEqual(uploads.rejections(request),
+                         [('image', 'logo.png', 'The uploaded file is not a supported image.')])
+
+    @override_settings(FAVITUDE_UPLOAD_LIMITS={'MAX_UPLOAD_BYTES': 1000})
+    def test_rejects_an_upload_over_max_upload_bytes(self):
+        data = noise_png_bytes(40)
+        self.assertGreater(len(data), 1000)
+        request = self.upload(data)
+        self.assertNotIn('image', request.FILES)
+        [(_, _, message)] = uploads.rejections(request)
+        self.assertIn('at most', message)
+        # Refused while counting the bytes, not up front
+        self.assertFalse(request.upload_handlers[0].too_large)
+
+    @override_settings(FAVITUDE_UPLOAD_LIMITS={'MAX_UPLOAD_BYTES': 1000})
+    def test_rejects_a_request_whose_content_length_is_too_large(self):
+        data = noise_png_bytes(160)
+        self.assertGreater(len(data), 1000 + uploads.FORM_OVERHEAD_BYTES)
+        request = self.upload(data)
+        self.assertNotIn('image', request.FILES)
+        [(_, _, message)] = uploads.rejections(request)
+        self.assertIn('at most', message)
+        self.assertTrue(request.upload_handlers[0].too_large)
+
+    def test_hash_upload_reuses_the_handlers_digest(self):
+        data = png_bytes()
+        expected = hashlib.sha256(data).hexdigest()
+        uploaded = self.upload(data).FILES['image']
+        with mock.patch.object(cache.hashlib, 'sha256', side_effect=AssertionError('hashed twice')):
+            self.assertEqual(cache.hash_upload(uploaded), expected)
+
+
+class ImageGenCsrfTests(TestCase):
+    """
+    imageGen installs the upload handler outside CSRF protection and checks the token after.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('csrf', 'csrf@example.com', 'Pa55word!')
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def post_image(self, **extra):
+        return self.client.post('/imageGen/', {'image': SimpleUploadedFile('logo.png', png_bytes()), **extra})
+
+    def test_post_without_a_csrf_token_is_forbidden(self):
+        self.assertEqual(self.post_image().status_code, 403)
+
+    def test_post_with_a_csrf_token_renders(self):
+        self.client.get('/imageGen/')
+        response = self.post_image(csrfmiddlewaretoken=self.client.cookies['csrftoken'].value)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+
+class EmailBackendTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('ada', 'Ada@Example.com', 'Pa55word!')
+
+    def test_login_by_username(self):
+        self.assertEqual(authenticate(username='ada', password='Pa55word!'), self.user)
+
+    def test_login_by_email_in_a_different_case(self):
+        self.assertEqual(authenticate(username='aDA@example.COM', password='Pa55word!'), self.user)
+
+    def test_login_by_allauth_email_argument(self):
+        self.assertEqual(authenticate(email='ada@example.com', password='Pa55word!'), self.user)
+
+    def test_wrong_password(self):
+        self.assertIsNone(authenticate(username='ada@example.com', password='wrong'))
+
+    def test_unknown_user_still_hashes_the_password(self):
+        with mock.patch.object(User, 'set_password') as set_password:
+            self.assertIsNone(authenticate(username='nobody@example.com', password='Pa55word!'))
+        set_password.assert_called_once_with('Pa55word!')
+
+    def test_email_login_prefers_the_account_with_that_email(self):
+        # Someone may have picked another user's email address as their username
+        other = User.objects.create_user('bob@example.com', 'bob@example.com', 'Pa55word!')
+        User.objects.filter(pk=other.pk).update(email='robert@example.com')
+        bob = User.objects.create_user('bob', 'Bob@example.com', 'Pa55word!')
+        self.assertEqual(authenticate(username='bob@example.com', password='Pa55word!'), bob)
+
+
+class EmailIndexTests(TestCase):
+    """
+    The NULLIF(LOWER(email), '') unique index from migration 0004.
+    """
+
+    def test_rejects_an_email_differing_only_in_case(self):
+        User.objects.create_user('ada', 'Ada@Example.com', 'Pa55word!')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('ada2', 'ada@example.COM', 'Pa55word!')
+
+    def test_allows_any_number_of_blank_emails(self):
+        User.objects.create_user('one', '', 'Pa55word!')
+        User.objects.create_user('two', '', 'Pa55word!')
+        self.assertEqual(User.objects.filter(email='').count(), 2)
+
+    def test_migration_refuses_existing_duplicates(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {email_index_migration.INDEX_NAME}')
+        User.objects.create_user('ada', 'Ada@Example.com', 'Pa55word!')
+        User.objects.create_user('ada2', 'ada@example.com', 'Pa55word!')
+        with self.assertRaisesMessage(RuntimeError, 'ada@example.com'):
+            email_index_migration.check_duplicate_emails(apps, connection.schema_editor())
+
+
+class SignupTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('ada', 'Ada@Example.com', 'Pa55word!')
+
+    def signup(self, username, email):
+        response = self.client.post('/signup/', {'username': username, 'email': email, 'password': 'Pa55word!'})
+        return response, [str(message) for message in messages.get_messages(response.wsgi_request)]
+
+    def test_creates_and_logs_in_a_new_user(self):
+        response, _ = self.signup('grace', 'grace@example.com')
+        self.assertRedirects(response, '/home/', fetch_redirect_response=False)
+        self.assertTrue(User.objects.filter(username='grace').exists())
+
+    def test_rejects_an_email_registered_in_another_case(self):
+        response, errors = self.signup('ada2', 'ADA@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(errors, ['Email already registered'])
+        self.assertFalse(User.objects.filter(username='ada2').exists())
+
+    def test_rejects_a_taken_username(self):
+        _, errors = self.signup('ada', 'other@example.com')
+        self.assertEqual(errors, ['Username already taken'])
+
+    def test_index_catches_a_duplicate_the_check_missed(self):
+        # A concurrent signup with the same email lands between the check and the insert
+        with mock.patch('Favitude.views.users_by_username_or_email', return_value=User.objects.none()):
+            response, errors = self.signup('ada2', 'ada@EXAMPLE.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(errors, ['Username or email already registered'])
+        self.assertFalse(User.objects.filter(username='ada2').exists())
@@ -0,0 +1,194 @@
+"""
+Vector-first renderer for text favicons.
+
+The logo is described once as geometry in a 512-unit design space: a background shape and
+a line of text with its font, size and anchor point. Each output size is rasterized
+directly from that description at its own resolution, so a 16px icon gets a 12.5px
+hinted glyph instead of a downsampled 400px one. The same description is also written
+out as ``favicon.svg``.
+"""
+import functools
+import threading
+from xml.sax.saxutils import escape, quoteattr
+
+from PIL import Image, ImageDraw
+
+from . import fonts, instrument
+
+DESIGN_SIZE = 512
+
+# Corner radius of the rounded square, in design units (about 20%, the usual icon radius)
+ROUNDED_RADIUS = 100
+
+# Shapes are drawn at this multiple of the target size and box-filtered down for anti-aliasing
+SUPERSAMPLE = 4
+
+
+class TextLogo:
+    """
+    Resolution-independent description of a text favicon.
+    """
+
+    def __init__(self, text, font_path, font_px, bg_shape, font_color, bg_color):
+        self.text = text
+        self.font_path = font_path
+        self.font_px = font_px
+        self.bg_shape = bg_shape
+        self.font_color = font_color
+        self.bg_color = bg_color
+        self.center = (DESIGN_SIZE / 2, DESIGN_SIZE / 2)
+        if bg_shape == 'triangular':
+            # Move text down a bit for triangle, towards its visual centre
+            self.center = (DESIGN_SIZE / 2, int(DESIGN_SIZE * 0.65))
+
+
+def layout(text, font_size, bg_shape, font_color, bg_color, font_path):
+    """
+    Resolves the font size (fitting it to the safe area when ``font_size`` is 0) and returns
+    the TextLogo. Fonts that fail to load fall back to Pillow's built-in scalable font.
+    """
+    try:
+        if font_size > 0:
+            font_px = font_size
+        else:
+            with instrument.span('autofit'):
+                font_px = fonts.fit_font_size(font_path, text) or fonts.MIN_FONT_SIZE
+        with instrument.span('font'):
+            fonts.load_font(font_path, font_px)
+    except OSError:
+        font_path = None
+        font_px = font_size if font_size > 0 else (fonts.fit_font_size(None, text) or fonts.MIN_FONT_SIZE)
+    return TextLogo(text, font_path, font_px, bg_shape, font_color, bg_color)
+
+
+@functools.lru_cache(maxsize=64)
+def shape_mask(bg_shape, size):
+    """
+    Anti-aliased 'L' coverage mask of a background shape at size x size pixels. There are
+    only a handful of shapes and sizes, so each mask is drawn once per process and shared;
+    callers must treat the returned image as read-only.
+    """
+    big = size * SUPERSAMPLE
+    scale = big / DESIGN_SIZE
+    mask = Image.new('L', (big, big), 0)
+    draw = ImageDraw.Draw(mask)
+    if bg_shape == 'rounded_square':
+        draw.rounded_rectangle([(0, 0), (big - 1, big - 1)], radius=ROUNDED_RADIUS * scale, fill=255)
+    elif bg_shape == 'circle':
+        draw.ellipse([(0, 0), (big - 1, big - 1)], fill=255)
+    elif bg_shape == 'triangular':
+        # Triangle pointing up
+        draw.polygon([(big / 2, 0), (0, big), (big, big)], fill=255)
+    else:
+        draw.rectangle([(0, 0), (big - 1, big - 1)], fill=255)
+    return mask.reduce(SUPERSAMPLE)
+
+
+def warm_shape_masks(shapes, sizes):
+    """
+    Draws the masks for every (shape, size) pair up front, e.g. at worker start-up.
+    """
+    for bg_shape in shapes:
+        for size in sizes:
+            shape_mask(bg_shape, size)
+
+
+def rasterize(logo, size):
+    """
+    Renders the logo natively at size x size pixels as an RGBA frame.
+    """
+    scale = size / DESIGN_SIZE
+    frame = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    if logo.bg_color is not None:
+        frame.paste(logo.bg_color, mask=shape_mask(logo.bg_shape, size))
+
+    text_layer = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    font = fonts.load_font(logo.font_path, logo.font_px * scale)
+    center = (logo.center[0] * scale, logo.center[1] * scale)
+    ImageDraw.Draw(text_layer).text(center, logo.text, fill=logo.font_color, font=font, anchor='mm')
+    frame.alpha_composite(text_layer)
+    return frame
+
+
+def _svg_color(color):
+    if color is None:
+        return 'none', ''
+    hex_color = '#{:02x}{:02x}{:02x}'.format(*color[:3])
+    opacity = f' fill-opacity="{color[3] / 255:.3f}"' if len(color) == 4 and color[3] < 255 else ''
+    return hex_color, opacity
+
+
+def _svg_shape(logo):
+    fill, opacity = _svg_color(logo.bg_color)
+    if logo.bg_color is None:
+        return ''
+    if logo.bg_shape == 'rounded_square':
+        return f'<rect width="{DESIGN_SIZE}" height="{DESIGN_SIZE}" rx="{ROUNDED_RADIUS}" fill="{fill}"{opacity}/>'
+    if logo.bg_shape == 'circle':
+        r = DESIGN_SIZE / 2
+        return f'<circle cx="{r:g}" cy="{r:g}" r="{r:g}" fill="{fill}"{opacity}/>'
+    if logo.bg_shape == 'triangular':
+        return f'<polygon points="{DESIGN_SIZE / 2:g},0 0,{DESIGN_SIZE} {DESIGN_SIZE},{DESIGN_SIZE}" fill="{fill}"{opacity}/>'
+    return f'<rect width="{DESIGN_SIZE}" height="{DESIGN_SIZE}" fill="{fill}"{opacity}/>'
+
+
+@functools.lru_cache(maxsize=16)
+def _outline_font(path):
+    """
+    The font at ``path``, loaded lazily, and the lock to hold while using it: tables and
+    glyphs decompile on first access, which is not safe from several render threads at once.
+    """
+    from fontTools.ttLib import TTFont
+    return TTFont(path, fontNumber=0, lazy=True), threading.Lock()
+
+
+def _svg_text_outline(logo, fill, opacity):
+    """
+    The text as a single <path> built from the font's glyph outlines, positioned to match
+    Pillow's 'mm' anchor. Returns None when fontTools is unavailable or the font unreadable.
+    """
+    if logo.font_path is None:
+        return None
+    try:
+        from fontTools.pens.svgPathPen import SVGPathPen
+        from fontTools.pens.transformPen import TransformPen
+        font, lock = _outline_font(logo.font_path)
+        with lock:
+            glyph_set = font.getGlyphSet()
+            cmap = font.getBestCmap()
+            units_per_em = font['head'].unitsPerEm
+            ascent, descent = font['hhea'].ascent, font['hhea'].descent
+
+            pen = SVGPathPen(glyph_set)
+            advance = 0
+            for char in logo.text:
+                glyph = glyph_set[cmap.get(ord(char), '.notdef')]
+                glyph.draw(TransformPen(pen, (1, 0, 0, 1, advance, 0)))
+                advance += glyph.width
+    except Exception:
+        return None
+
+    scale = logo.font_px / units_per_em
+    x = logo.center[0] - advance * scale / 2
+    # 'm' vertical anchor: halfway between the ascender and descender lines
+    baseline = logo.center[1] + (ascent + descent) * scale / 2
+    return (f'<path transform="translate({x:.2f} {baseline:.2f}) scale({scale:.5f} {-scale:.5f})" '
+            f'd="{pen.getCommands()}" fill="{fill}"{opacity}/>')
+
+
+def to_svg(logo):
+    """
+    The logo as a standalone SVG document in the 512-unit design space.
+    """
+    # Pillow draws text in white when no colour is given
+    fill, opacity = _svg_color(logo.font_color or (255, 255, 255))
+    text = _svg_text_outline(logo, fill, opacity)
+    if text is None:
+        # No outlines available: fall back to live text in a generic family
+        text = (f'<text x="{logo.center[0]:g}" y="{logo.center[1]:g}" font-family="sans-serif" '
+                f'font-size="{logo.font_px:g}" text-anchor="middle" dominant-baseline="central" '
+                f'fill="{fill}"{opacity}>{escape(logo.text)}</text>')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {DESIGN_SIZE} {DESIGN_SIZE}" '
+        f'aria-label={quoteattr(logo.text)}>{_svg_shape(logo)}{text}</svg>'
+    )
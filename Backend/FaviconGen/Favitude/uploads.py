@@ -0,0 +1,183 @@
+"""
+Streaming upload handling for the favicon endpoints.
+
+FaviconUploadHandler replaces Django's default handlers on views that take image uploads.
+It checks each file while it arrives instead of after it has been buffered:
+
+- the first bytes are matched against the signatures of the formats ingest accepts, so a
+  non-image is refused after one chunk;
+- the bytes received are counted against ``MAX_UPLOAD_BYTES`` (see ingest.get_limits), and a
+  request whose Content-Length already exceeds the view's budget is refused before any file
+  data is read;
+- the SHA-256 is computed chunk by chunk, so the render cache key needs no second pass.
+
+A refused upload stops the body from being read any further (StopUpload with a connection
+reset) and is recorded on the request; views report it with rejections(request). Accepted
+files are kept in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE and in a temporary file beyond,
+like Django's own handlers, and carry ``sha256`` and ``image_format`` attributes.
+
+Views must install the handler before anything reads request.POST or request.FILES, which
+for function views means running outside CSRF protection until it is in place:
+
+    @csrf_exempt
+    def view(request):
+        uploads.install(request)
+        return csrf_protect(real_view)(request)
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.template.defaultfilters import filesizeformat
+
+from . import ingest
+
+# (Pillow format, offset, signature)
+SIGNATURES = [
+    ('PNG', 0, b'\x89PNG\r\n\x1a\n'),
+    ('JPEG', 0, b'\xff\xd8\xff'),
+    ('GIF', 0, b'GIF87a'),
+    ('GIF', 0, b'GIF89a'),
+    ('WEBP', 8, b'WEBP'),
+    ('BMP', 0, b'BM'),
+    ('ICO', 0, b'\x00\x00\x01\x00'),
+    ('TIFF', 0, b'II*\x00'),
+    ('TIFF', 0, b'MM\x00*'),
+]
+
+# Bytes needed to tell every signature apart
+SNIFF_BYTES = max(offset + len(signature) for _, offset, signature in SIGNATURES)
+
+# Room for the form fields and multipart boundaries around the files of a request
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def sniff_format(head):
+    """
+    The Pillow format name for the leading bytes of a file, or None.
+    """
+    for fmt, offset, signature in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if fmt == 'WEBP' and not head.startswith(b'RIFF'):
+                continue
+            return fmt
+    return None
+
+
+def get_max_upload_bytes():
+    return ingest.get_limits()['MAX_UPLOAD_BYTES']
+
+
+class FaviconUploadHandler(FileUploadHandler):
+    """
+    Validates, hashes and stores image uploads as they stream in. ``max_files`` bounds the
+    request size checked against Content-Length.
+    """
+
+    def __init__(self, request=None, max_files=1):
+        super().__init__(request)
+        self.max_bytes = get_max_upload_bytes()
+        self.max_request_bytes = self.max_bytes * max_files + FORM_OVERHEAD_BYTES
+        self.too_large = False
+        # Not ``file``: MultiPartParser closes handler.file on StopUpload, even when None
+        self.buffer = None
+        if request is not None:
+            request.upload_rejections = []
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Let the leading form fields (the CSRF token among them) be parsed, but stop at the
+        # first file
+        self.too_large = content_length > self.max_request_bytes
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.too_large:
+            self._reject(self._too_large_message())
+        self.buffer = io.BytesIO()
+        self.head = b''
+        self.image_format = None
+        self.digest = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.image_format is None and len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        if start + len(raw_data) > self.max_bytes:
+            self._reject(self._too_large_message())
+
+        self.digest.update(raw_data)
+        if isinstance(self.buffer, io.BytesIO) and start + len(raw_data) > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            self._spill()
+        self.buffer.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.image_format is None:
+            # Shorter than SNIFF_BYTES
+            self.image_format = sniff_format(self.head)
+            if self.image_format is None:
+                self._record('The uploaded file is not a supported image.')
+                self.upload_interrupted()
+                return None
+
+        self.buffer.seek(0)
+        if isinstance(self.buffer, io.BytesIO):
+            uploaded = InMemoryUploadedFile(self.buffer, self.field_name, self.file_name, self.content_type,
+                                            file_size, self.charset, self.content_type_extra)
+        else:
+            uploaded = self.buffer
+            uploaded.size = file_size
+        uploaded.sha256 = self.digest.hexdigest()
+        uploaded.image_format = self.image_format
+        self.buffer = None
+        return uploaded
+
+    def upload_interrupted(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def _sniff(self):
+        self.image_format = sniff_format(self.head)
+        if self.image_format is None:
+            self._reject('The uploaded file is not a supported image.')
+
+    def _spill(self):
+        """
+        Moves the bytes received so far from memory into a temporary file.
+        """
+        spooled = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        spooled.write(self.buffer.getvalue())
+        self.buffer = spooled
+
+    def _too_large_message(self):
+        return f'Images can be at most {filesizeformat(self.max_bytes)}.'
+
+    def _record(self, message):
+        if self.request is not None:
+            self.request.upload_rejections.append((self.field_name, self.file_name, message))
+
+    def _reject(self, message):
+        self._record(message)
+        self.upload_interrupted()
+        # Nothing after a refused file is worth reading; the connection is closed instead
+        raise StopUpload(connection_reset=True)
+
+
+def install(request, max_files=1):
+    """
+    Makes FaviconUploadHandler the only upload handler for ``request``.
+    """
+    request.upload_handlers = [FaviconUploadHandler(request, max_files=max_files)]
+
+
+def rejections(request):
+    """
+    (field name, file name, message) for every upload the handler refused. Parses the body
+    if nothing has yet.
+    """
+    request.FILES
+    return getattr(request, 'upload_rejections', [])
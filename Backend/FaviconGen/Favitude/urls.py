@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .lazy import lazy_view
 
 app_name = "Favitude"
 
@@ -17,8 +18,15 @@ urlpatterns = [
   path("documentation/", views.documentation_page, name="documentation_page"),
   path("tutorial/", views.tutorial_page, name="tutorial_page"),
   path("gen_from_text/", views.gen_from_text_page, name="gen_from_text_page"),
+  path("render/text/<str:token>/favicons.zip", views.render_text, name="render_text"),
   path("privacy/", views.privacy_page, name="privacy_page"),
   path("FAQs/", views.FAQs_page, name="FAQs_page"),
   path("download/collection/<str:filename>/", views.download_favicon, name="download_favicon"),
+  path("gallery/<slug:slug>/preview.png", views.gallery_preview, name="gallery_preview"),
+  path("api/jobs/", lazy_view('Favitude.api.JobListView', csrf_exempt=True), name="api_jobs"),
+  path("api/jobs/<uuid:job_id>/", lazy_view('Favitude.api.JobDetailView', csrf_exempt=True), name="api_job_detail"),
+  path("api/jobs/<uuid:job_id>/result/", lazy_view('Favitude.api.JobResultView', csrf_exempt=True), name="api_job_result"),
+  path("api/batch/", lazy_view('Favitude.api.BatchView', csrf_exempt=True), name="api_batch"),
+  path("api/stats/render/", lazy_view('Favitude.api.RenderStatsView', csrf_exempt=True), name="api_render_stats"),
   
 ]
\ No newline at end of file
@@ -1,180 +1,342 @@
+import functools
 import io
 import zipfile
-from PIL import Image, ImageDraw, ImageFont
-from django.http import FileResponse
+from PIL import Image, ImageColor
+from asgiref.sync import sync_to_async
 
-import os
-import platform
+from . import cache, executor, fonts, ingest, instrument, optimize, profiles, textrender
+
+# Bump whenever a change to the renderers alters their output, so cached bundles are not reused
+RENDERER_VERSION = 8
+
+BG_SHAPES = ('square', 'rounded_square', 'circle', 'triangular')
+
+# Sizes of the default ('classic') profile; see profiles.py for the others
+PNG_SIZES = profiles.CLASSIC_PNG_SIZES
+ICO_SIZES = profiles.CLASSIC_ICO_SIZES
 
 def get_font_path(font_name):
     """
-    Attempts to find the font file path based on the OS.
-    """
-    system = platform.system()
-    
-    # Common font filenames mapping
-    font_map = {
-        'Roboto': ['Roboto-Regular.ttf', 'arial.ttf'], # Roboto might not be installed
-        'Arial': ['arial.ttf', 'Arial.ttf'],
-        'Verdana': ['verdana.ttf', 'Verdana.ttf'],
-        'Times New Roman': ['times.ttf', 'Times.ttf'],
-        'Helvetica': ['Helvetica.ttf', 'arial.ttf', 'Arial.ttf'], # Fallback to Arial on Windows
-        'Calibri': ['calibri.ttf', 'Calibri.ttf'],
-        'Garamond': ['gara.ttf', 'Garamond.ttf'],
-        'Futura': ['Futura.ttf', 'arial.ttf'],
-        'Franklin Gothic': ['framd.ttf', 'Franklin Gothic.ttf'],
-        'Rockwell': ['rock.ttf', 'Rockwell.ttf'],
-    }
-    
-    potential_filenames = font_map.get(font_name, [f'{font_name}.ttf'])
-    
-    # Windows Font Directory
-    if system == 'Windows':
-        font_dir = os.path.join(os.environ['WINDIR'], 'Fonts')
-        for filename in potential_filenames:
-            path = os.path.join(font_dir, filename)
-            if os.path.exists(path):
-                return path
-            # Try capitalizing if not found (sometimes filesystem is picky or map is wrong)
-            path_cap = os.path.join(font_dir, filename.capitalize())
-            if os.path.exists(path_cap):
-                return path_cap
-                
-    # macOS / Linux could be added here, but user is on Windows.
-    # We can perform a robust fallback if needed later.
-    
-    return None
-
-def generate_favicon_from_image(image_file):
+    Returns the font file path for a family name, using the process-wide font registry.
+    """
+    return fonts.registry.resolve(font_name)
+
+def build_resize_pyramid(img, sizes):
+    """
+    Resizes ``img`` to every size in ``sizes`` exactly once and returns {size: RGBA frame}.
+    Large sources are first shrunk with Image.reduce (a cheap box filter) to about twice the
+    largest target, then each frame is LANCZOS-resampled from the smallest already-built
+    frame that is still at least twice its size, so only one filter pass touches the source.
+    """
+    targets = sorted(set(sizes), key=lambda s: s[0] * s[1], reverse=True)
+    largest = targets[0]
+
+    factor = min(img.width // (largest[0] * 2), img.height // (largest[1] * 2))
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+
+    frames = {}
+    for size in targets:
+        base = img
+        for frame in frames.values():
+            if frame.width >= size[0] * 2 and frame.height >= size[1] * 2 and frame.width < base.width:
+                base = frame
+        frames[size] = base.resize(size, Image.Resampling.LANCZOS)
+    return frames
+
+class _ZipSink:
+    """
+    Write-only, non-seekable file object that ZipFile streams into. The bytes written
+    since the last drain() are handed to the response as each entry is finished.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# PNG entries are deflated already; the rest (the ICO's BMP entries, SVG, manifests) are not
+STORED_SUFFIXES = ('.png',)
+
+# Every entry carries the same timestamp (the earliest a ZIP can hold), so identical renders
+# produce identical archives: the gallery stores them once and ETags stay stable
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def _zip_entry(arcname):
+    info = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+    if not arcname.endswith(STORED_SUFFIXES):
+        info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+def iter_zip(members):
+    """
+    Yields a ZIP archive chunk by chunk from (arcname, writer) pairs, calling each writer with
+    the open entry so renditions are encoded straight into the archive.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w') as zip_file:
+        for arcname, write in members:
+            with instrument.span('zip'), zip_file.open(_zip_entry(arcname), 'w') as dest:
+                write(dest)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Central directory
+    yield sink.drain()
+
+def _bundle_members(frames, outputs=None, svg=None, meta=None):
+    """
+    The (arcname, writer) pairs for a profile's outputs (the default profile's if not given).
+    ``frames`` must hold every size from profiles.plan_sizes(outputs). Frames go through the
+    output optimizer once each, however many outputs share them.
+    """
+    if outputs is None:
+        outputs = profiles.get_outputs()
+    return profiles.members(outputs, frames, optimize.FrameEncoder(frames), svg=svg, meta=meta)
+
+def _bundle_chunks(render):
+    """
+    Runs a renderer to completion and returns the archive as a list of chunks, one per entry.
+    This is the unit of work handed to the render executor, so ``render`` must be picklable
+    (a partial of a module level function over plain arguments).
+    """
+    return list(render())
+
+def _bundle_bytes(render):
+    """
+    Runs a renderer to completion and returns the archive bytes.
+    """
+    return b''.join(render())
+
+def _cached_stream(render_cache, key, render):
+    """
+    Returns an iterator over the bundle's ZIP bytes: the cached bytes on a hit, otherwise
+    render() run on the render executor (or inline when it is disabled), with the finished
+    archive stored in the cache.
+    """
+    data = None
+    if render_cache is not None:
+        with instrument.span('cache'):
+            data = render_cache.get(key)
+    if data is not None:
+        return iter([data])
+
+    render_executor = executor.get_render_executor()
+    if render_executor is None:
+        # render() does decoding and drawing eagerly so errors surface before the response
+        # starts; the entries are then encoded as the response sends them
+        chunks = render()
+        if render_cache is None:
+            return chunks
+        return _TeeIntoCache(chunks, render_cache, key)
+
+    # The job finishes the whole archive and gives its slot back before the response starts,
+    # so a slow client never holds a worker
+    with instrument.span('render'):
+        chunks = render_executor.run(_bundle_chunks, render)
+    if render_cache is not None:
+        render_cache.set(key, b''.join(chunks))
+    return iter(chunks)
+
+async def _acached_stream(render_cache, key, render, asynchronous=True):
+    """
+    Async counterpart of _cached_stream, awaiting the cache and the render without blocking
+    the event loop. Returns an async iterator, or a sync one when ``asynchronous`` is false:
+    an async view served over WSGI, whose server reads the response from its own thread.
+    """
+    data = None
+    if render_cache is not None:
+        with instrument.span('cache'):
+            data = await render_cache.aget(key)
+    if data is not None:
+        chunks = [data]
+    else:
+        # Run inline, the generator would encode on the event loop; so it always runs to
+        # completion off the loop, on the executor or on a worker thread
+        with instrument.span('render'):
+            chunks = await executor.arun(_bundle_chunks, render)
+        if render_cache is not None:
+            await render_cache.aset(key, b''.join(chunks))
+    return _aiter_chunks(chunks) if asynchronous else iter(chunks)
+
+async def _aiter_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+class _TeeIntoCache:
+    """
+    Passes the chunks of an inline render through and stores the finished archive in the
+    render cache after the last one.
+    """
+
+    def __init__(self, chunks, render_cache, key):
+        self.chunks = chunks
+        self.render_cache = render_cache
+        self.key = key
+        self.parts = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.render_cache.set(self.key, b''.join(self.parts))
+            raise
+        self.parts.append(chunk)
+        return chunk
+
+    def close(self):
+        self.chunks.close()
+
+def prepare_image_render(image_file, profile=None, sizes=None):
+    """
+    Returns (render_cache, key, render) for an uploaded image: where its bundle is cached and
+    a picklable callable that renders it. ``profile`` and ``sizes`` select the output profile
+    (see profiles.normalize_profile); a bad choice raises ValueError.
+    """
+    profile, sizes = profiles.normalize_profile(profile, sizes)
+    upload_cache = cache.get_render_cache('upload')
+    key = None
+    if upload_cache is not None:
+        key = cache.make_key('image', version=RENDERER_VERSION, digest=cache.hash_upload(image_file),
+                             profile=profile, sizes=sizes)
+    if executor.get_render_executor() is not None:
+        # Uploaded file objects cannot cross into a worker process, their bytes can
+        image_file = image_file.read()
+    return upload_cache, key, functools.partial(_render_favicon_from_image, image_file, profile, sizes)
+
+def stream_favicon_from_image(image_file, profile=None, sizes=None):
+    """
+    Returns an iterator over the ZIP bytes of the favicon bundle for an uploaded image.
+    Re-uploads of the same bytes are served from the upload cache without decoding.
+    """
+    return _cached_stream(*prepare_image_render(image_file, profile, sizes))
+
+async def astream_favicon_from_image(image_file, profile=None, sizes=None, asynchronous=True):
+    """
+    Async counterpart of stream_favicon_from_image (see _acached_stream for ``asynchronous``):
+    reading and hashing the upload happen on a worker thread and the render on the render
+    executor.
+    """
+    prepared = await sync_to_async(prepare_image_render, thread_sensitive=False)(image_file, profile, sizes)
+    return await _acached_stream(*prepared, asynchronous)
+
+def generate_favicon_from_image(image_file, profile=None, sizes=None):
     """
     Generates favicons from an uploaded image file.
     Returns a ZIP file containing .ico and .png formats in standard sizes.
     """
-    img = Image.open(image_file)
-    sizes = [(16, 16), (32, 32), (96, 96), (256, 256)]
-    
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        # ICO file (contains multiple sizes)
-        ico_buffer = io.BytesIO()
-        # Ensure image is compatible mode
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
-            
-        img.save(ico_buffer, format='ICO', sizes=[(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)])
-        zip_file.writestr('favicon.ico', ico_buffer.getvalue())
-        
-        # PNGs
-        for size in sizes:
-            resized_img = img.resize(size, Image.Resampling.LANCZOS)
-            img_buffer = io.BytesIO()
-            resized_img.save(img_buffer, format='PNG')
-            zip_file.writestr(f'favicon-{size[0]}x{size[1]}.png', img_buffer.getvalue())
-            
-    zip_buffer.seek(0)
-    return zip_buffer
-
-def generate_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type='Roboto'):
+    return io.BytesIO(b''.join(stream_favicon_from_image(image_file, profile, sizes)))
+
+def _render_favicon_from_image(image_file, profile=profiles.DEFAULT_PROFILE, sizes=()):
+    if isinstance(image_file, bytes):
+        image_file = io.BytesIO(image_file)
+    outputs = profiles.get_outputs(profile, sizes)
+    plan = profiles.plan_sizes(outputs)
+    with instrument.span('decode'):
+        img = ingest.open_upload(image_file, plan[0])
+    with instrument.span('resize'):
+        frames = build_resize_pyramid(img, plan)
+    return iter_zip(_bundle_members(frames, outputs))
+
+def color_to_hex(color):
+    """
+    '#rrggbb' (or '#rrggbbaa') for a normalized color tuple; None stays None.
+    """
+    return None if color is None else '#' + ''.join(f'{channel:02x}' for channel in color)
+
+def normalize_text_params(text, font_size, bg_shape, font_color, bg_color, font_type='Roboto', profile=None, sizes=None):
+    """
+    Canonicalizes form input for the text renderer so equivalent requests share a cache key.
+    Raises ValueError for a non-numeric font size, an unparseable color, an overlong font name
+    or a bad output profile.
+    """
+    font_size = int(font_size) if font_size else 0
+    if font_type and len(font_type) > fonts.MAX_NAME_LENGTH:
+        raise ValueError(f'Font names are at most {fonts.MAX_NAME_LENGTH} characters.')
+    profile, sizes = profiles.normalize_profile(profile, sizes)
+    return {
+        'text': text,
+        'font_size': max(font_size, 0),
+        'bg_shape': bg_shape if bg_shape in BG_SHAPES else 'square',
+        'font_color': ImageColor.getrgb(font_color) if font_color else None,
+        'bg_color': ImageColor.getrgb(bg_color) if bg_color else None,
+        'font_type': font_type or fonts.DEFAULT_FAMILY,
+        'profile': profile,
+        'sizes': sizes,
+    }
+
+def text_cache_key(params):
+    """
+    Cache key for normalized text parameters, including the hash of the resolved font file.
+    """
+    font_path = get_font_path(params['font_type'])
+    font_hash = cache.file_digest(font_path) if font_path else 'default'
+    return cache.make_key('text', version=RENDERER_VERSION, font_hash=font_hash, **params)
+
+def prepare_text_render(text, font_size, bg_shape, font_color, bg_color, font_type='Roboto', profile=None, sizes=None):
+    """
+    Returns (render_cache, key, render) for a text logo; see prepare_image_render.
+    """
+    params = normalize_text_params(text, font_size, bg_shape, font_color, bg_color, font_type, profile, sizes)
+    render_cache = cache.get_render_cache('text')
+    key = text_cache_key(params) if render_cache is not None else None
+    return render_cache, key, functools.partial(_render_favicon_from_text, **params)
+
+def stream_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type='Roboto', profile=None, sizes=None):
+    """
+    Returns an iterator over the ZIP bytes of the favicon bundle for a text logo.
+    Identical requests are served from the render cache without re-rasterizing.
+    """
+    return _cached_stream(*prepare_text_render(text, font_size, bg_shape, font_color, bg_color, font_type, profile, sizes))
+
+async def astream_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type='Roboto', profile=None,
+                                    sizes=None, asynchronous=True):
+    """
+    Async counterpart of stream_favicon_from_text; see astream_favicon_from_image.
+    """
+    # A worker thread: the first use of a font builds the font index and hashes the font file
+    prepared = await sync_to_async(prepare_text_render, thread_sensitive=False)(
+        text, font_size, bg_shape, font_color, bg_color, font_type, profile, sizes)
+    return await _acached_stream(*prepared, asynchronous)
+
+def generate_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type='Roboto', profile=None, sizes=None):
     """
     Generates favicons from text input.
     """
-    size = (512, 512) # High resolution base
-    img = Image.new('RGBA', size, (0, 0, 0, 0)) # Transparent background initially
-    draw = ImageDraw.Draw(img)
-    
-    # Draw Background
-    if bg_shape == 'square':
-        draw.rectangle([(0,0), size], fill=bg_color)
-    elif bg_shape == 'rounded_square':
-        # Draw rounded rectangle (requires corners)
-        # Using a simple approximation or standard rounded_rectangle if available in this pillow version
-        # Radius ~ 20% of size is standard for icons
-        r = 100 
-        draw.rounded_rectangle([(0,0), size], radius=r, fill=bg_color)
-    elif bg_shape == 'circle':
-        draw.ellipse([(0,0), size], fill=bg_color)
-    elif bg_shape == 'triangular':
-        # Triangle pointing up
-        draw.polygon([(256, 0), (0, 512), (512, 512)], fill=bg_color)
-    else:
-        # Default to square if unknown
-        draw.rectangle([(0,0), size], fill=bg_color)
-        
-    # Determine Font
-    font_path = get_font_path(font_type)
-    
-    # Auto-fit logic if font_size is not provided or 0
-    target_size_px = 300 # Default fallback
-    
-    if font_size and int(font_size) > 0:
-        # Manual size - scale it up because user input 100 usually means "big", but on 512 canvas it's different.
-        # We'll treat user input roughly as percentage of canvas if > 10, or pt size.
-        # Let's align with previous logic: * 10 was a bit aggressive if they type 200.
-        # If they type "50", 50*10 = 500 (full height).
-        target_size_px = int(font_size)
-    
-    # If using 'None' (default), we try to find the max size that fits.
-    # However, to do that efficiently we need a Font object.
-    
-    final_font = None
-    
-    # Load initial font to test or use
-    try:
-        if font_path:
-            # If auto-sizing, start big and shrink, or binary search. 
-            # Simple approach: Start at 400 and shrink until it fits box (e.g. 400x400 safe area)
-             
-            if not font_size or int(font_size) <= 0:
-                # AUTO SIZE
-                test_size = 400
-                while test_size > 10:
-                    f = ImageFont.truetype(font_path, test_size)
-                    # Get bbox
-                    left, top, right, bottom = draw.textbbox((0, 0), text, font=f)
-                    w = right - left
-                    h = bottom - top
-                    if w < 450 and h < 450: # Leave some padding
-                        final_font = f
-                        break
-                    test_size -= 20
-            else:
-                final_font = ImageFont.truetype(font_path, target_size_px)
-        else:
-             final_font = ImageFont.load_default()
-             # Default font is fixed size, can't scale easily without hacks.
-             
-    except Exception:
-        final_font = ImageFont.load_default()
-    
-    if final_font is None:
-         # Fallback if auto-sizing loop failed to set it (unlikely)
-         final_font = ImageFont.load_default()
-
-    # Draw Text Centered
-    # anchor='mm' aligns the text's middle-center to the given xy coordinates
-    # This is much more accurate than manual calculation
-    center_x, center_y = size[0] // 2, size[1] // 2
-    
-    # Adjust for visual center if triangle
-    if bg_shape == 'triangular':
-        center_y = int(size[1] * 0.65) # Move text down a bit for triangle
-
-    draw.text((center_x, center_y), text, fill=font_color, font=final_font, anchor='mm')
-    
-    # Process like image
-    sizes = [(16, 16), (32, 32), (96, 96), (256, 256)]
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-         # ICO
-        ico_buffer = io.BytesIO()
-        img.save(ico_buffer, format='ICO', sizes=[(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)])
-        zip_file.writestr('favicon.ico', ico_buffer.getvalue())
-
-        for s in sizes:
-            resized = img.resize(s, Image.Resampling.LANCZOS)
-            buf = io.BytesIO()
-            resized.save(buf, format='PNG')
-            zip_file.writestr(f'favicon-{s[0]}x{s[1]}.png', buf.getvalue())
-            
-    zip_buffer.seek(0)
-    return zip_buffer
+    return io.BytesIO(b''.join(
+        stream_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type, profile, sizes)
+    ))
+
+def _render_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type,
+                              profile=profiles.DEFAULT_PROFILE, sizes=()):
+    # Lay the logo out once in 512px design space, then draw every planned size natively from it
+    with instrument.span('font'):
+        font_path = get_font_path(font_type)
+    logo = textrender.layout(text, font_size, bg_shape, font_color, bg_color, font_path)
+    outputs = profiles.get_outputs(profile, sizes)
+    with instrument.span('rasterize'):
+        frames = {size: textrender.rasterize(logo, size[0]) for size in profiles.plan_sizes(outputs)}
+    with instrument.span('svg'):
+        svg = textrender.to_svg(logo)
+    meta = {'name': text, 'theme_color': color_to_hex(bg_color[:3]) if bg_color else None}
+    return iter_zip(_bundle_members(frames, outputs, svg=svg, meta=meta))
@@ -2,18 +2,103 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.contrib.auth.decorators import login_required
-from django.http import FileResponse
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
+from django.utils.text import slugify
 from django.conf import settings
+from django.db import IntegrityError, transaction
+import logging
 import os
-from . import utils
+from asgiref.sync import sync_to_async
+# The renderer modules (utils, gallery, uploads, and with them Pillow and the font registry)
+# are imported inside the views that use them, so a cold start serving any other page skips them
+from .asyncviews import csrf_exempt, csrf_protect, is_asgi, login_required, require_GET, stream_file
+from .backends import users_by_username_or_email
+from .executor import RenderQueueFull, RenderTimeout
+from .models import GalleryItem
+from .pagecache import cached_page
+
+logger = logging.getLogger(__name__)
 
 # ... existing imports ...
 
+def _zip_response(chunks, filename):
+  """
+  Streams a generated ZIP to the client entry by entry instead of buffering the whole archive.
+  ``chunks`` may be an async iterator (utils.astream_favicon_from_*), which ASGI servers send
+  from the event loop.
+  """
+  response = StreamingHttpResponse(chunks, content_type='application/zip')
+  response['Content-Disposition'] = content_disposition_header(True, filename)
+  return response
+
+def _busy_response(exc):
+  """
+  503 with Retry-After when the render queue is full or a render timed out, so clients back off
+  instead of queueing.
+  """
+  response = HttpResponse(str(exc), status=503, content_type='text/plain')
+  response['Retry-After'] = str(exc.retry_after)
+  return response
+
+def _stored_file_response(request, field_file, digest, modified_at, filename=None, **cache_control):
+  """
+  Serves a content-addressed file with ETag/Last-Modified, answering revalidations with 304.
+  FileResponse hands the open file to the server's wsgi.file_wrapper (sendfile) when available.
+  """
+  etag = f'"{digest}"'
+  last_modified = int(modified_at.timestamp())
+  response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+  if response is None:
+      response = FileResponse(field_file.open('rb'), as_attachment=filename is not None, filename=filename)
+  response['ETag'] = etag
+  response['Last-Modified'] = http_date(last_modified)
+  patch_cache_control(response, **cache_control)
+  return response
+
+async def _rendered_gallery_item(slug):
+  """
+  The published gallery item for ``slug``, rendering it first if the prerender command has not.
+  """
+  try:
+      item = await GalleryItem.objects.aget(slug=slug, is_published=True)
+  except GalleryItem.DoesNotExist:
+      return None
+  if not item.is_rendered:
+      from . import gallery
+      await gallery.aprerender_item(item)
+  return item
+
+async def _async_stored_file_response(request, *args, **kwargs):
+  # Opening the stored file is disk (or network storage) I/O
+  response = await sync_to_async(_stored_file_response, thread_sensitive=False)(request, *args, **kwargs)
+  return stream_file(request, response)
+
+# Rendered bundles never change for a given URL; a renderer or font change changes the ETag
+RENDER_MAX_AGE = 365 * 24 * 60 * 60
+RENDER_URL_SALT = 'Favitude.views.render_text'
+
+def text_render_url(params):
+  """
+  Signed GET URL for normalized text parameters. Equivalent inputs share one URL, so browser
+  and CDN caches see a single cacheable resource per logo.
+  """
+  from . import utils
+  payload = dict(params, font_color=utils.color_to_hex(params['font_color']), bg_color=utils.color_to_hex(params['bg_color']))
+  # Signer, not signing.dumps: a timestamp would give every request a different URL
+  token = signing.Signer(salt=RENDER_URL_SALT).sign_object(payload, compress=True)
+  return reverse('Hill:render_text', kwargs={'token': token})
+
 # Create your views here.
+@cached_page
 def home(request):
-  return render(request, 'Favitude/index.html')  
+  gallery_items = GalleryItem.objects.filter(is_published=True)
+  return render(request, 'Favitude/index.html', {'gallery_items': gallery_items})
 
+@cached_page
 def about(request):
   return render(request, 'Favitude/about.html')
 
@@ -59,19 +144,25 @@ def signup_page(request):
       email = request.POST.get('email')
       password = request.POST.get('password')
       
-      if User.objects.filter(username=username).exists():
+      # One indexed query for both checks; the unique indexes catch a concurrent signup
+      taken = list(users_by_username_or_email(username=username, email=email).values_list('username', flat=True))
+      if username in taken:
           messages.error(request, 'Username already taken')
-      elif User.objects.filter(email=email).exists():
+      elif taken:
           messages.error(request, 'Email already registered')
       else:
-          user = User.objects.create_user(username=username, email=email, password=password)
-          user.save()
-          # Specify the backend since we have multiple configured
-          login(request, user, backend='django.contrib.auth.backends.ModelBackend')
-          return redirect('Hill:home_page')
+          try:
+              with transaction.atomic():
+                  user = User.objects.create_user(username=username, email=email, password=password)
+          except IntegrityError:
+              messages.error(request, 'Username or email already registered')
+          else:
+              login(request, user, backend='Favitude.backends.EmailBackend')
+              return redirect('Hill:home_page')
           
   return render(request, 'Favitude/signup.html')  
 
+@cached_page
 def contact_page(request):
   return render(request, 'Favitude/contact.html')
 
@@ -82,32 +173,47 @@ def error_page(request):
 def generate_page(request):
   return render(request, 'Favitude/generate.html')
 
+@csrf_exempt
+async def imageGen_page(request):
+  from . import uploads
+  # The upload handler must be installed before CSRF protection reads the form
+  uploads.install(request)
+  return await _imageGen_page(request)
+
+@csrf_protect
 @login_required
-def imageGen_page(request):
-  if request.method == 'POST' and request.FILES.get('image'):
-      image = request.FILES['image']
+async def _imageGen_page(request):
+  from . import uploads, utils
+  # Normally parsed already by the CSRF check; if not, parse (and validate) off the event loop
+  files = await sync_to_async(lambda: request.FILES, thread_sensitive=False)()
+  for _, _, message in uploads.rejections(request):
+      messages.error(request, message)
+  if request.method == 'POST' and files.get('image'):
+      image = files['image']
+      profile = request.POST.get('profile')
+      sizes = request.POST.get('sizes') if profile == 'custom' else None
       try:
-          zip_file = utils.generate_favicon_from_image(image)
-          return FileResponse(
-              zip_file, 
-              as_attachment=True, 
-              filename='favicons.zip'
-          )
+          chunks = await utils.astream_favicon_from_image(image, profile, sizes, asynchronous=is_asgi(request))
+          return _zip_response(chunks, 'favicons.zip')
+      except (RenderQueueFull, RenderTimeout) as e:
+          return _busy_response(e)
       except Exception as e:
           messages.error(request, f"Error generating favicon: {str(e)}")
           
-  return render(request, 'Favitude/imageGen.html')         
+  return await sync_to_async(render)(request, 'Favitude/imageGen.html')
 
+@cached_page
 @login_required
 def documentation_page(request):
   return render(request, 'Favitude/documentation.html')  
 
+@cached_page
 @login_required
 def tutorial_page(request):
   return render(request, 'Favitude/tutorial.html')   
 
 @login_required
-def gen_from_text_page(request):
+async def gen_from_text_page(request):
   if request.method == 'POST':
       text = request.POST.get('text')
       # Use defaults if empty
@@ -116,44 +222,90 @@ def gen_from_text_page(request):
       font_color = request.POST.get('fcolor')
       bg_color = request.POST.get('bcolor')
       font_type = request.POST.get('ftype') # Note: Template ID is ftype, need to check name attr
+      profile = request.POST.get('profile')
+      # The sizes box only applies to the custom profile
+      sizes = request.POST.get('sizes') if profile == 'custom' else None
       
       if text:
+          from . import utils
           try:
-              zip_file = utils.generate_favicon_from_text(text, font_size, bg_shape, font_color, bg_color, font_type)
-              return FileResponse(
-                  zip_file,
-                  as_attachment=True,
-                  filename='favicons_text.zip'
-              )
+              params = utils.normalize_text_params(text, font_size, bg_shape, font_color, bg_color, font_type, profile, sizes)
+              # Hand off to the cacheable GET URL so repeat downloads never reach the renderer
+              return redirect(text_render_url(params))
           except Exception as e:
               messages.error(request, f"Error generating favicon: {str(e)}")
       else:
            messages.error(request, "Please enter some text")
            
-  return render(request, 'Favitude/gen_from_text.html')     
+  return await sync_to_async(render)(request, 'Favitude/gen_from_text.html')
+
+@require_GET
+async def render_text(request, token):
+  """
+  Streams the bundle for a signed text render URL. The ETag is the render cache key, so a
+  revalidation is answered with 304 before any font is loaded or pixel drawn.
+  """
+  from . import utils
+  try:
+      payload = signing.Signer(salt=RENDER_URL_SALT).unsign_object(token)
+      params = utils.normalize_text_params(**payload)
+  except (signing.BadSignature, TypeError, ValueError):
+      raise Http404("Invalid render URL.")
 
+  # Hashes the font file the first time it is used
+  etag = f'"{await sync_to_async(utils.text_cache_key, thread_sensitive=False)(params)}"'
+  response = get_conditional_response(request, etag=etag)
+  if response is None:
+      try:
+          chunks = await utils.astream_favicon_from_text(**payload, asynchronous=is_asgi(request))
+      except (RenderQueueFull, RenderTimeout) as e:
+          return _busy_response(e)
+      except Exception as e:
+          # A public URL, so no redirect to the login-only form; and not cacheable, as the
+          # same URL may well render next time
+          logger.exception('Text render failed')
+          response = HttpResponse(f"Error generating favicon: {str(e)}", status=500, content_type='text/plain')
+          patch_cache_control(response, no_store=True)
+          return response
+      response = _zip_response(chunks, 'favicons_text.zip')
+  response['ETag'] = etag
+  patch_cache_control(response, public=True, max_age=RENDER_MAX_AGE, immutable=True)
+  return response
+
+@cached_page
 def privacy_page(request):
   return render(request, 'Favitude/privacy.html')       
 
 @login_required
-def download_favicon(request, filename):
-    # Security: Whitelist allowed files to prevent arbitrary file access
-    ALLOWED_FILES = {
-        'Frame1.png', 'Frame2.png', 'Frame3.png', 'Frame5.png',
-        'check.png', 'convert.png'
-    }
-    
-    if filename not in ALLOWED_FILES:
-        messages.error(request, "Invalid file requested.")
-        return redirect('Hill:landing_page')
-        
-    file_path = os.path.join(settings.BASE_DIR, 'Favitude/static/images/images-home', filename)
-    
-    if os.path.exists(file_path):
-        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename)
-    else:
+async def download_favicon(request, filename):
+    # Collection links name the item by slug; older links used the source file name
+    slug = slugify(os.path.splitext(filename)[0])
+    try:
+        item = await _rendered_gallery_item(slug)
+    except (RenderQueueFull, RenderTimeout) as e:
+        return _busy_response(e)
+    except (OSError, ValueError):
+        item = None
+    if item is None:
         messages.error(request, "File not found.")
         return redirect('Hill:landing_page')
 
+    # Private: downloads need a login, so shared caches must not keep them
+    return await _async_stored_file_response(request, item.bundle, item.bundle_digest, item.rendered_at,
+                                             filename=f'{item.slug}-favicons.zip', private=True, no_cache=True)
+
+async def gallery_preview(request, slug):
+    try:
+        item = await _rendered_gallery_item(slug)
+    except (RenderQueueFull, RenderTimeout) as e:
+        return _busy_response(e)
+    except (OSError, ValueError):
+        item = None
+    if item is None:
+        raise Http404("No such gallery item.")
+    return await _async_stored_file_response(request, item.preview, item.preview_digest, item.rendered_at,
+                                             public=True, max_age=3600)
+
+@cached_page
 def FAQs_page(request):
   return render(request, 'Favitude/FAQs.html')   
\ No newline at end of file